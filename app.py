@@ -1,60 +1,287 @@
-from typing import List
+import csv
+import io
+import json
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Union
 
-from fastapi import FastAPI, HTTPException, status
-from psycopg2.extras import RealDictCursor
+from fastapi import (
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import ValidationError
 
-from db import (
+import async_db
+import db
+from cache import CacheInvalidator, cache
+from geocoding import geocoder
+from http_cache import (
+    CacheControlMiddleware,
+    CompressionMiddleware,
+    conditional,
+    has_conditions,
+    make_etag,
+    validator_headers,
+)
+from images import UPLOAD_MAX_BYTES, UPLOAD_TYPES, processor
+from metrics import InstrumentedRoute, MetricsMiddleware, render_metrics
+from realtime import format_sse, hub, listing_events
+from stats import refresher
+from storage import STORAGE_URL, LocalStorage, MediaFiles, storage
+from async_db import (
+    DEFAULT_PAGE_SIZE,
+    MAX_MAP_RESULTS,
+    MAX_PAGE_SIZE,
+    BidRejected,
+    ViewingRejected,
     accept_bid,
     add_favorite,
+    cancel_registration,
+    cancel_viewing,
     create_address,
+    create_agent_review,
     create_bid,
+    create_category,
     create_listing,
+    create_listing_image,
+    create_saved_search,
+    create_uploaded_image,
     create_user,
     create_viewing,
     delete_listing,
+    delete_saved_search,
     delete_user,
+    enqueue_job,
+    get_agencies,
+    get_agency_listings,
+    get_agent_calendar,
+    get_agent_rating,
+    get_agent_reviews,
     get_bids_for_listing,
-    get_connection,
+    get_categories,
+    get_categories_version,
     get_listing_by_id,
+    get_listing_detail,
+    get_listing_images,
+    get_listing_images_version,
+    get_listing_version,
     get_listings,
+    get_listings_in_bbox,
+    get_listings_nearby,
+    get_market_stats,
+    get_market_stats_by_category,
+    get_market_stats_by_city,
+    get_saved_searches,
+    get_search_alerts,
+    get_stats_refresh_state,
+    get_favorite_memberships,
+    get_job_queue_stats,
+    get_top_agents,
     get_user_by_id,
+    get_user_favorite_ids,
+    get_user_favorite_ids_version,
     get_user_favorites,
+    get_user_favorites_version,
     get_users,
+    get_viewing_registrations,
     get_viewings_for_listing,
+    register_for_viewing,
     remove_favorite,
+    reorder_listing_images,
+    search_listings,
     update_listing,
     update_listing_status,
     update_user,
 )
-from schemas import BidCreate, ListingCreate, UserCreate, ViewingCreate
+from schemas import (
+    AddressResponse,
+    AgencyResponse,
+    AgentRating,
+    AgentReviewResponse,
+    BidCreate,
+    BidResponse,
+    BulkResponse,
+    CategoryResponse,
+    FavoriteMembership,
+    FavoriteResponse,
+    ImageOrder,
+    ImageResponse,
+    JobQueueStats,
+    ListingCreate,
+    ListingDeleted,
+    ListingDetail,
+    ListingIngest,
+    ListingResponse,
+    ListingSummary,
+    MapClusters,
+    MapListings,
+    MarketStats,
+    Page,
+    SavedSearchCreate,
+    SavedSearchResponse,
+    SearchAlertResponse,
+    StatsRefreshState,
+    TopAgent,
+    UserCreate,
+    UserDeleted,
+    UserResponse,
+    UserSummary,
+    ViewingCreate,
+    ViewingRegistrationCreate,
+    ViewingRegistrationResponse,
+    ViewingResponse,
+)
+from serialization import columnar_response
+
+
+invalidator = CacheInvalidator(cache, async_db.connect)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    db.init_pool()
+    await async_db.init_pool()
+    await hub.start()
+    await invalidator.start()
+    await refresher.start()
+    await processor.start()
+    yield
+    await processor.stop()
+    await refresher.stop()
+    await invalidator.stop()
+    await hub.stop()
+    await cache.close()
+    await geocoder.close()
+    await async_db.close_pool()
+    db.close_pool()
+
+
+app = FastAPI(lifespan=lifespan)
+app.router.route_class = InstrumentedRoute
+# Last added runs first: metrics see the compressed response and its time.
+app.add_middleware(CompressionMiddleware)
+app.add_middleware(CacheControlMiddleware)
+app.add_middleware(MetricsMiddleware)
+if isinstance(storage, LocalStorage):
+    app.mount(STORAGE_URL, MediaFiles(directory=storage.root), name="media")
+
+
+async def get_async_db():
+    async with async_db.acquire() as con:
+        yield con
+
+
+def _with_connection(query, *args):
+    # Loader for cache.get_or_load: only takes a connection on a cache miss.
+    async def load():
+        async with async_db.acquire() as con:
+            return await query(con, *args)
+    return load
+
+
+def _split_fields(fields):
+    return [field.strip() for field in fields.split(",")] if fields else None
+
+
+def _split_ids(ids, max_count):
+    try:
+        values = [int(value) for value in _split_fields(ids) or []]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Ids must be comma-separated integers")
+    if len(values) > max_count:
+        raise HTTPException(status_code=400, detail=f"At most {max_count} ids per request")
+    return values
+
+
+def _listing_page_fields(fields, response_format):
+    # format=columns always returns exactly the ListingSummary fields.
+    if response_format == "columns":
+        if fields:
+            raise HTTPException(
+                status_code=400, detail="fields cannot be combined with format=columns"
+            )
+        return list(ListingSummary.model_fields)
+    return _split_fields(fields)
+
+
+def _listing_page(page, response_format, headers=None):
+    # headers: for format=columns, whose Response is returned as-is and
+    # so doesn't pick up headers set on the injected response.
+    if response_format == "columns":
+        return columnar_response(page, ListingSummary, headers)
+    return page
+
 
-app = FastAPI()
+def _json_default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def _ndjson_chunks(rows, batch_size=db.EXPORT_BATCH_SIZE):
+    lines = []
+    for row in rows:
+        lines.append(json.dumps(row, default=_json_default))
+        if len(lines) >= batch_size:
+            yield "\n".join(lines) + "\n"
+            lines = []
+    if lines:
+        yield "\n".join(lines) + "\n"
+
+
+def _csv_chunks(rows, batch_size=db.EXPORT_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = None
+    for count, row in enumerate(rows, start=1):
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=list(row.keys()))
+            writer.writeheader()
+        writer.writerow(row)
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
 
 
 # ---------- USERS ----------
 
-@app.get("/users", status_code=status.HTTP_200_OK)
-def api_get_users():
-    con = get_connection()
-    users = get_users(con)
-    con.close()
+@app.get("/users", status_code=status.HTTP_200_OK, response_model=Page[UserSummary])
+async def api_get_users(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None,
+    con=Depends(get_async_db),
+):
+    try:
+        users = await get_users(con, limit, cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     return users
 
 
-@app.get("/users/{user_id}", status_code=status.HTTP_200_OK)
-def api_get_user(user_id: int):
-    con = get_connection()
-    user = get_user_by_id(con, user_id)
-    con.close()
+@app.get("/users/{user_id}", status_code=status.HTTP_200_OK, response_model=UserResponse)
+async def api_get_user(user_id: int, con=Depends(get_async_db)):
+    user = await get_user_by_id(con, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 
-@app.post("/users", status_code=status.HTTP_201_CREATED)
-def api_create_user(user: UserCreate):
-    con = get_connection()
-    created = create_user(
+@app.post("/users", status_code=status.HTTP_201_CREATED, response_model=UserResponse)
+async def api_create_user(user: UserCreate, con=Depends(get_async_db)):
+    created = await create_user(
         con,
         user.email,
         user.password_hash,
@@ -62,25 +289,22 @@ def api_create_user(user: UserCreate):
         user.last_name,
         user.role_id,
     )
-    con.close()
     return created
 
 
-@app.put("/users/{user_id}", status_code=status.HTTP_200_OK)
-def api_update_user(user_id: int, first_name: str, last_name: str):
-    con = get_connection()
-    updated = update_user(con, user_id, first_name, last_name)
-    con.close()
+@app.put("/users/{user_id}", status_code=status.HTTP_200_OK, response_model=UserResponse)
+async def api_update_user(
+    user_id: int, first_name: str, last_name: str, con=Depends(get_async_db)
+):
+    updated = await update_user(con, user_id, first_name, last_name)
     if not updated:
         raise HTTPException(status_code=404, detail="User not found")
     return updated
 
 
-@app.delete("/users/{user_id}", status_code=status.HTTP_200_OK)
-def api_delete_user(user_id: int):
-    con = get_connection()
-    deleted = delete_user(con, user_id)
-    con.close()
+@app.delete("/users/{user_id}", status_code=status.HTTP_200_OK, response_model=UserDeleted)
+async def api_delete_user(user_id: int, con=Depends(get_async_db)):
+    deleted = await delete_user(con, user_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="User not found")
     return {"deleted_user_id": deleted["id"]}
@@ -88,28 +312,253 @@ def api_delete_user(user_id: int):
 
 # ---------- LISTINGS ----------
 
-@app.get("/listings", status_code=status.HTTP_200_OK)
-def api_get_listings():
-    con = get_connection()
-    listings = get_listings(con)
-    con.close()
+@app.get(
+    "/listings",
+    status_code=status.HTTP_200_OK,
+    response_model=Page[ListingSummary],
+    response_model_exclude_unset=True,
+)
+async def api_get_listings(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None,
+    fields: str = None,
+    response_format: str = Query("objects", alias="format", pattern="^(objects|columns)$"),
+    status_value: str = Query(None, alias="status"),
+    category_id: int = None,
+    min_price: int = None,
+    max_price: int = None,
+    rooms: int = None,
+    min_living_area: int = None,
+    max_living_area: int = None,
+    city: str = None,
+    agency_id: int = None,
+    con=Depends(get_async_db),
+):
+    try:
+        listings = await get_listings(
+            con,
+            limit,
+            cursor,
+            _listing_page_fields(fields, response_format),
+            status=status_value,
+            category_id=category_id,
+            min_price=min_price,
+            max_price=max_price,
+            rooms=rooms,
+            min_living_area=min_living_area,
+            max_living_area=max_living_area,
+            city=city,
+            agency_id=agency_id,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return _listing_page(listings, response_format)
+
+
+def _listings_export(include, export_format):
+    # The connection is checked out here rather than through a dependency
+    # so it stays open until the last chunk has been sent.
+    con = db.get_connection()
+    try:
+        rows = db.iter_listings_export(con, include)
+        if export_format == "csv":
+            yield from _csv_chunks(rows)
+        else:
+            yield from _ndjson_chunks(rows)
+    finally:
+        db.release_connection(con)
+
+
+@app.get("/listings/export", status_code=status.HTTP_200_OK)
+def api_export_listings(
+    export_format: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$"),
+    include: str = None,
+):
+    include = _split_fields(include) or []
+    unknown = set(include) - set(db.EXPORT_INCLUDES)
+    if unknown:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown export includes: {', '.join(sorted(unknown))}"
+        )
+    if export_format == "csv":
+        media_type, filename = "text/csv", "listings.csv"
+    else:
+        media_type, filename = "application/x-ndjson", "listings.ndjson"
+    return StreamingResponse(
+        _listings_export(include, export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    )
+
+
+@app.get(
+    "/listings/search",
+    status_code=status.HTTP_200_OK,
+    response_model=Page[ListingSummary],
+    response_model_exclude_unset=True,
+)
+async def api_search_listings(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None,
+    fields: str = None,
+    response_format: str = Query("objects", alias="format", pattern="^(objects|columns)$"),
+    status_value: str = Query(None, alias="status"),
+    category_id: int = None,
+    min_price: int = None,
+    max_price: int = None,
+    rooms: int = None,
+    min_living_area: int = None,
+    max_living_area: int = None,
+    city: str = None,
+    agency_id: int = None,
+    con=Depends(get_async_db),
+):
+    try:
+        listings = await search_listings(
+            con,
+            q,
+            limit,
+            cursor,
+            _listing_page_fields(fields, response_format),
+            status=status_value,
+            category_id=category_id,
+            min_price=min_price,
+            max_price=max_price,
+            rooms=rooms,
+            min_living_area=min_living_area,
+            max_living_area=max_living_area,
+            city=city,
+            agency_id=agency_id,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return _listing_page(listings, response_format)
+
+
+@app.get(
+    "/listings/map",
+    status_code=status.HTTP_200_OK,
+    response_model=Union[MapListings, MapClusters],
+    response_model_exclude_unset=True,
+)
+async def api_get_listings_in_bbox(
+    west: float = Query(..., ge=-180, le=180),
+    south: float = Query(..., ge=-90, le=90),
+    east: float = Query(..., ge=-180, le=180),
+    north: float = Query(..., ge=-90, le=90),
+    zoom: int = Query(None, ge=0, le=22),
+    limit: int = Query(MAX_MAP_RESULTS, ge=1, le=MAX_MAP_RESULTS),
+    fields: str = None,
+    status_value: str = Query(None, alias="status"),
+    category_id: int = None,
+    min_price: int = None,
+    max_price: int = None,
+    rooms: int = None,
+    con=Depends(get_async_db),
+):
+    # With zoom, listings are grouped into screen-sized grid cells;
+    # without it, the listings themselves are returned.
+    try:
+        listings = await get_listings_in_bbox(
+            con,
+            west,
+            south,
+            east,
+            north,
+            zoom,
+            limit,
+            _split_fields(fields),
+            status=status_value,
+            category_id=category_id,
+            min_price=min_price,
+            max_price=max_price,
+            rooms=rooms,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     return listings
 
 
-@app.get("/listings/{listing_id}", status_code=status.HTTP_200_OK)
-def api_get_listing(listing_id: int):
-    con = get_connection()
-    listing = get_listing_by_id(con, listing_id)
-    con.close()
+@app.get(
+    "/listings/nearby",
+    status_code=status.HTTP_200_OK,
+    response_model=Union[MapListings, MapClusters],
+    response_model_exclude_unset=True,
+)
+async def api_get_listings_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_km: float = Query(..., gt=0, le=200),
+    zoom: int = Query(None, ge=0, le=22),
+    limit: int = Query(MAX_MAP_RESULTS, ge=1, le=MAX_MAP_RESULTS),
+    fields: str = None,
+    status_value: str = Query(None, alias="status"),
+    category_id: int = None,
+    min_price: int = None,
+    max_price: int = None,
+    rooms: int = None,
+    con=Depends(get_async_db),
+):
+    try:
+        listings = await get_listings_nearby(
+            con,
+            lat,
+            lon,
+            radius_km,
+            zoom,
+            limit,
+            _split_fields(fields),
+            status=status_value,
+            category_id=category_id,
+            min_price=min_price,
+            max_price=max_price,
+            rooms=rooms,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return listings
+
+
+@app.get("/listings/{listing_id}", status_code=status.HTTP_200_OK, response_model=ListingResponse)
+async def api_get_listing(listing_id: int, request: Request, response: Response):
+    # Revalidations are answered from updated_at alone; everything else is
+    # served from the cache as before, with validators from the row itself.
+    version = None
+    if has_conditions(request):
+        async with async_db.acquire() as con:
+            version = await get_listing_version(con, listing_id)
+        if version is not None:
+            not_modified = conditional(request, response, version)
+            if not_modified:
+                return not_modified
+    load = _with_connection(get_listing_by_id, listing_id)
+    listing = await cache.get_or_load("listing", listing_id, load)
+    if listing and version is not None:
+        if make_etag({"updated_at": listing["updated_at"]}) != make_etag(version):
+            # Cached before a write whose invalidation hasn't arrived yet;
+            # the client already knows the row changed, so don't send it back.
+            await cache.invalidate("listing", listing_id)
+            listing = await cache.get_or_load("listing", listing_id, load)
     if not listing:
         raise HTTPException(status_code=404, detail="Listing not found")
+    response.headers.update(validator_headers({"updated_at": listing["updated_at"]}))
     return listing
 
 
-@app.post("/listings", status_code=status.HTTP_201_CREATED)
-def api_create_listing(listing: ListingCreate):
-    con = get_connection()
-    created = create_listing(
+@app.get(
+    "/listings/{listing_id}/detail", status_code=status.HTTP_200_OK, response_model=ListingDetail
+)
+async def api_get_listing_detail(listing_id: int, con=Depends(get_async_db)):
+    listing = await get_listing_detail(con, listing_id)
+    if not listing:
+        raise HTTPException(status_code=404, detail="Listing not found")
+    return listing
+
+
+@app.post("/listings", status_code=status.HTTP_201_CREATED, response_model=ListingResponse)
+async def api_create_listing(listing: ListingCreate, con=Depends(get_async_db)):
+    created = await create_listing(
         con,
         listing.title,
         listing.description,
@@ -121,35 +570,85 @@ def api_create_listing(listing: ListingCreate):
         "active",
         listing.address_id
     )
-    con.close()
     return created
 
 
-@app.put("/listings/{listing_id}", status_code=status.HTTP_200_OK)
-def api_update_listing(listing_id: int, title: str, description: str, price: int):
-    con = get_connection()
-    updated = update_listing(con, listing_id, title, description, price)
-    con.close()
+def _bulk_create_listings(body, ndjson):
+    # Runs on a worker thread: parsing and validating tens of thousands of
+    # rows would otherwise hold up every other request on the event loop.
+    if ndjson:
+        lines = [line for line in body.splitlines() if line.strip()]
+    else:
+        try:
+            lines = json.loads(body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise ValueError("Body must be a JSON array or NDJSON")
+        if not isinstance(lines, list):
+            raise ValueError("Body must be a JSON array or NDJSON")
+
+    results = [{"row": row, "listing_id": None, "error": None} for row in range(len(lines))]
+    valid, positions = [], []
+    for row, line in enumerate(lines):
+        try:
+            item = json.loads(line) if isinstance(line, bytes) else line
+            valid.append(ListingIngest.model_validate(item).model_dump())
+            positions.append(row)
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            results[row]["error"] = "Invalid JSON"
+        except ValidationError as exc:
+            error = exc.errors()[0]
+            results[row]["error"] = f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+
+    if valid:
+        con = db.get_connection()
+        try:
+            ingested_rows = db.bulk_create_listings(con, valid)
+        finally:
+            db.release_connection(con)
+        for ingested in ingested_rows:
+            result = results[positions[ingested["row_no"]]]
+            result["listing_id"] = ingested["listing_id"]
+            result["error"] = ingested["error"]
+
+    inserted = sum(1 for result in results if result["error"] is None)
+    return {"inserted": inserted, "failed": len(results) - inserted, "results": results}
+
+
+@app.post("/listings/bulk", status_code=status.HTTP_200_OK, response_model=BulkResponse)
+async def api_bulk_create_listings(request: Request):
+    body = await request.body()
+    ndjson = request.headers.get("content-type", "").startswith("application/x-ndjson")
+    try:
+        return await run_in_threadpool(_bulk_create_listings, body, ndjson)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@app.put("/listings/{listing_id}", status_code=status.HTTP_200_OK, response_model=ListingResponse)
+async def api_update_listing(
+    listing_id: int, title: str, description: str, price: int, con=Depends(get_async_db)
+):
+    updated = await update_listing(con, listing_id, title, description, price)
     if not updated:
         raise HTTPException(status_code=404, detail="Listing not found")
     return updated
 
 
-@app.patch("/listings/{listing_id}/status", status_code=status.HTTP_200_OK)
-def api_update_listing_status(listing_id: int, status_value: str):
-    con = get_connection()
-    updated = update_listing_status(con, listing_id, status_value)
-    con.close()
+@app.patch(
+    "/listings/{listing_id}/status", status_code=status.HTTP_200_OK, response_model=ListingResponse
+)
+async def api_update_listing_status(
+    listing_id: int, status_value: str, con=Depends(get_async_db)
+):
+    updated = await update_listing_status(con, listing_id, status_value)
     if not updated:
         raise HTTPException(status_code=404, detail="Listing not found")
     return updated
 
 
-@app.delete("/listings/{listing_id}", status_code=status.HTTP_200_OK)
-def api_delete_listing(listing_id: int):
-    con = get_connection()
-    deleted = delete_listing(con, listing_id)
-    con.close()
+@app.delete("/listings/{listing_id}", status_code=status.HTTP_200_OK, response_model=ListingDeleted)
+async def api_delete_listing(listing_id: int, con=Depends(get_async_db)):
+    deleted = await delete_listing(con, listing_id)
     if not deleted:
         raise HTTPException(status_code=404, detail="Listing not found")
     return {"deleted_listing_id": deleted["id"]}
@@ -157,193 +656,607 @@ def api_delete_listing(listing_id: int):
 
 # ---------- BIDS ----------
 
-@app.get("/listings/{listing_id}/bids", status_code=status.HTTP_200_OK)
-def api_get_bids(listing_id: int):
-    con = get_connection()
-    bids = get_bids_for_listing(con, listing_id)
-    con.close()
+@app.get(
+    "/listings/{listing_id}/bids", status_code=status.HTTP_200_OK, response_model=list[BidResponse]
+)
+async def api_get_bids(listing_id: int, con=Depends(get_async_db)):
+    bids = await get_bids_for_listing(con, listing_id)
     return bids
 
 
-@app.post("/listings/{listing_id}/bids", status_code=status.HTTP_201_CREATED)
-def api_create_bid(listing_id: int, bid: BidCreate):
-    con = get_connection()
-    created = create_bid(con, listing_id, bid.bidder_id, bid.amount)
-    con.close()
+@app.post(
+    "/listings/{listing_id}/bids", status_code=status.HTTP_201_CREATED, response_model=BidResponse
+)
+async def api_create_bid(listing_id: int, bid: BidCreate, con=Depends(get_async_db)):
+    try:
+        created = await create_bid(con, listing_id, bid.bidder_id, bid.amount)
+    except BidRejected as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    if not created:
+        raise HTTPException(status_code=404, detail="Listing not found")
     return created
 
 
-@app.patch("/bids/{bid_id}/accept", status_code=status.HTTP_200_OK)
-def api_accept_bid(bid_id: int):
-    con = get_connection()
-    accepted = accept_bid(con, bid_id)
-    con.close()
+@app.patch("/bids/{bid_id}/accept", status_code=status.HTTP_200_OK, response_model=BidResponse)
+async def api_accept_bid(bid_id: int, con=Depends(get_async_db)):
+    try:
+        accepted = await accept_bid(con, bid_id)
+    except BidRejected as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
     if not accepted:
         raise HTTPException(status_code=404, detail="Bid not found")
     return accepted
 
 
+@app.get("/listings/{listing_id}/events", status_code=status.HTTP_200_OK)
+async def api_listing_events(
+    listing_id: int,
+    last_event_id: int = Query(None),
+    last_event_id_header: int = Header(None, alias="Last-Event-ID"),
+):
+    # Browsers send Last-Event-ID themselves when an EventSource reconnects.
+    resume_from = last_event_id_header if last_event_id_header is not None else last_event_id
+
+    async def stream():
+        async for event in listing_events(listing_id, resume_from):
+            yield format_sse(event) if event is not None else ": keep-alive\n\n"
+
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.websocket("/listings/{listing_id}/ws")
+async def ws_listing_events(websocket: WebSocket, listing_id: int, last_event_id: int = None):
+    await websocket.accept()
+    events = listing_events(listing_id, last_event_id)
+    try:
+        async for event in events:
+            if event is None:
+                event = {"event_type": "heartbeat"}
+            await websocket.send_text(json.dumps(event, default=_json_default))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await events.aclose()
+
+
 # ---------- FAVORITES ----------
 
-@app.post("/favorites", status_code=status.HTTP_201_CREATED)
-def api_add_favorite(user_id: int, listing_id: int):
-    con = get_connection()
-    favorite = add_favorite(con, user_id, listing_id)
-    con.close()
+@app.post("/favorites", status_code=status.HTTP_201_CREATED, response_model=FavoriteResponse)
+async def api_add_favorite(user_id: int, listing_id: int, con=Depends(get_async_db)):
+    favorite = await add_favorite(con, user_id, listing_id)
     return favorite
 
 
-@app.delete("/favorites", status_code=status.HTTP_200_OK)
-def api_remove_favorite(user_id: int, listing_id: int):
-    con = get_connection()
-    removed = remove_favorite(con, user_id, listing_id)
-    con.close()
+@app.delete("/favorites", status_code=status.HTTP_200_OK, response_model=FavoriteResponse)
+async def api_remove_favorite(user_id: int, listing_id: int, con=Depends(get_async_db)):
+    removed = await remove_favorite(con, user_id, listing_id)
     if not removed:
         raise HTTPException(status_code=404, detail="Favorite not found")
     return removed
 
 
-@app.get("/users/{user_id}/favorites", status_code=status.HTTP_200_OK)
-def api_get_user_favorites(user_id: int):
-    con = get_connection()
-    favorites = get_user_favorites(con, user_id)
-    con.close()
+@app.get(
+    "/users/{user_id}/favorites",
+    status_code=status.HTTP_200_OK,
+    response_model=Page[ListingSummary],
+    response_model_exclude_unset=True,
+)
+async def api_get_user_favorites(
+    user_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None,
+    fields: str = None,
+    response_format: str = Query("objects", alias="format", pattern="^(objects|columns)$"),
+    con=Depends(get_async_db),
+):
+    version = await get_user_favorites_version(con, user_id)
+    not_modified = conditional(request, response, version)
+    if not_modified:
+        return not_modified
+    try:
+        favorites = await get_user_favorites(
+            con, user_id, limit, cursor, _listing_page_fields(fields, response_format)
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return _listing_page(favorites, response_format, response.headers)
+
+
+@app.get(
+    "/users/{user_id}/favorites/ids",
+    status_code=status.HTTP_200_OK,
+    response_model=Page[FavoriteResponse],
+)
+async def api_get_user_favorite_ids(
+    user_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None,
+    con=Depends(get_async_db),
+):
+    version = await get_user_favorite_ids_version(con, user_id)
+    not_modified = conditional(request, response, version)
+    if not_modified:
+        return not_modified
+    try:
+        favorites = await get_user_favorite_ids(con, user_id, limit, cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     return favorites
 
-@app.get("/categories")
-def get_categories():
-    con = get_connection()
-    with con:
-        with con.cursor() as cur:
-            cur.execute("SELECT * FROM listing_categories;")
-            data = cur.fetchall()
-    con.close()
-    return data
-
-@app.post("/categories", status_code=201)
-def create_category(name: str):
-    con = get_connection()
-    with con:
-        with con.cursor() as cur:
-            cur.execute(
-                "INSERT INTO listing_categories (name) VALUES (%s) RETURNING *;",
-                (name,)
-            )
-            created = cur.fetchone()
-    con.close()
+
+@app.get(
+    "/users/{user_id}/favorites/membership",
+    status_code=status.HTTP_200_OK,
+    response_model=list[FavoriteMembership],
+)
+async def api_get_favorite_memberships(
+    user_id: int, listing_ids: str = Query(...), con=Depends(get_async_db)
+):
+    # For a result page: the ids on it, answered in one query.
+    memberships = await get_favorite_memberships(
+        con, user_id, _split_ids(listing_ids, MAX_PAGE_SIZE)
+    )
+    return memberships
+
+
+# ---------- SAVED SEARCHES ----------
+
+@app.post(
+    "/users/{user_id}/saved-searches",
+    status_code=status.HTTP_201_CREATED,
+    response_model=SavedSearchResponse,
+)
+async def api_create_saved_search(
+    user_id: int, search: SavedSearchCreate, con=Depends(get_async_db)
+):
+    try:
+        created = await create_saved_search(
+            con, user_id, search.name, **search.model_dump(exclude={"name"})
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     return created
 
-@app.get("/agencies")
-def get_agencies():
-    con = get_connection()
-    with con:
-        with con.cursor() as cur:
-            cur.execute("SELECT * FROM real_estate_agencies;")
-            data = cur.fetchall()
-    con.close()
-    return data
-
-@app.get("/agencies/{agency_id}/listings")
-def get_agency_listings(agency_id: int):
-    con = get_connection()
-    with con:
-        with con.cursor() as cur:
-            cur.execute(
-                "SELECT * FROM listings WHERE agency_id = %s;",
-                (agency_id,)
-            )
-            data = cur.fetchall()
-    con.close()
-    return data
+
+@app.get(
+    "/users/{user_id}/saved-searches",
+    status_code=status.HTTP_200_OK,
+    response_model=list[SavedSearchResponse],
+)
+async def api_get_saved_searches(user_id: int, con=Depends(get_async_db)):
+    searches = await get_saved_searches(con, user_id)
+    return searches
+
+
+@app.delete(
+    "/users/{user_id}/saved-searches/{saved_search_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=SavedSearchResponse,
+)
+async def api_delete_saved_search(user_id: int, saved_search_id: int, con=Depends(get_async_db)):
+    deleted = await delete_saved_search(con, user_id, saved_search_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Saved search not found")
+    return deleted
+
+
+@app.get(
+    "/users/{user_id}/alerts",
+    status_code=status.HTTP_200_OK,
+    response_model=Page[SearchAlertResponse],
+)
+async def api_get_search_alerts(
+    user_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None,
+    con=Depends(get_async_db),
+):
+    try:
+        alerts = await get_search_alerts(con, user_id, limit, cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return alerts
+
+
+# ---------- CATEGORIES ----------
+
+@app.get("/categories", status_code=status.HTTP_200_OK, response_model=list[CategoryResponse])
+async def api_get_categories(request: Request, response: Response):
+    async with async_db.acquire() as con:
+        version = await get_categories_version(con)
+    not_modified = conditional(request, response, version)
+    if not_modified:
+        return not_modified
+    categories = await cache.get_or_load("categories", "all", _with_connection(get_categories))
+    return categories
+
+
+@app.post("/categories", status_code=status.HTTP_201_CREATED, response_model=CategoryResponse)
+async def api_create_category(name: str, con=Depends(get_async_db)):
+    created = await create_category(con, name)
+    return created
+
+
+# ---------- AGENCIES ----------
+
+@app.get("/agencies", status_code=status.HTTP_200_OK, response_model=list[AgencyResponse])
+async def api_get_agencies():
+    agencies = await cache.get_or_load("agencies", "all", _with_connection(get_agencies))
+    return agencies
+
+
+@app.get(
+    "/agencies/{agency_id}/top-agents",
+    status_code=status.HTTP_200_OK,
+    response_model=list[TopAgent],
+)
+async def api_get_top_agents(
+    agency_id: int,
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    min_reviews: int = Query(1, ge=1),
+    con=Depends(get_async_db),
+):
+    agents = await get_top_agents(con, agency_id, limit, min_reviews)
+    return agents
+
+
+@app.get(
+    "/agencies/{agency_id}/listings",
+    status_code=status.HTTP_200_OK,
+    response_model=Page[ListingSummary],
+    response_model_exclude_unset=True,
+)
+async def api_get_agency_listings(
+    agency_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None,
+    fields: str = None,
+    response_format: str = Query("objects", alias="format", pattern="^(objects|columns)$"),
+    con=Depends(get_async_db),
+):
+    try:
+        listings = await get_agency_listings(
+            con, agency_id, limit, cursor, _listing_page_fields(fields, response_format)
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return _listing_page(listings, response_format)
+
 
 # ---------- VIEWINGS ----------
 
-@app.get("/listings/{listing_id}/viewings", status_code=200)
-def api_get_viewings(listing_id: int):
-    con = get_connection()
-    viewings = get_viewings_for_listing(con, listing_id)
-    con.close()
+@app.get(
+    "/listings/{listing_id}/viewings",
+    status_code=status.HTTP_200_OK,
+    response_model=list[ViewingResponse],
+)
+async def api_get_viewings(listing_id: int, con=Depends(get_async_db)):
+    viewings = await get_viewings_for_listing(con, listing_id)
     return viewings
 
 
-@app.post("/listings/{listing_id}/viewings", status_code=201)
-def api_create_viewing(listing_id: int, viewing: ViewingCreate):
-    con = get_connection()
-    created = create_viewing(
-        con,
-        listing_id,
-        viewing.start_time,
-        viewing.end_time
-    )
-    con.close()
+@app.post(
+    "/listings/{listing_id}/viewings",
+    status_code=status.HTTP_201_CREATED,
+    response_model=ViewingResponse,
+)
+async def api_create_viewing(listing_id: int, viewing: ViewingCreate, con=Depends(get_async_db)):
+    try:
+        created = await create_viewing(
+            con,
+            listing_id,
+            viewing.start_time,
+            viewing.end_time,
+            viewing.agent_id,
+            viewing.capacity,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except ViewingRejected as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    if not created:
+        raise HTTPException(status_code=404, detail="Listing not found")
     return created
 
+
+@app.post(
+    "/viewings/{viewing_id}/cancel",
+    status_code=status.HTTP_200_OK,
+    response_model=ViewingResponse,
+)
+async def api_cancel_viewing(viewing_id: int, con=Depends(get_async_db)):
+    cancelled = await cancel_viewing(con, viewing_id)
+    if not cancelled:
+        raise HTTPException(status_code=404, detail="Viewing not found")
+    return cancelled
+
+
+@app.get(
+    "/viewings/{viewing_id}/registrations",
+    status_code=status.HTTP_200_OK,
+    response_model=list[ViewingRegistrationResponse],
+)
+async def api_get_viewing_registrations(viewing_id: int, con=Depends(get_async_db)):
+    registrations = await get_viewing_registrations(con, viewing_id)
+    return registrations
+
+
+@app.post(
+    "/viewings/{viewing_id}/registrations",
+    status_code=status.HTTP_201_CREATED,
+    response_model=ViewingRegistrationResponse,
+)
+async def api_register_for_viewing(
+    viewing_id: int, registration: ViewingRegistrationCreate, con=Depends(get_async_db)
+):
+    try:
+        created = await register_for_viewing(con, viewing_id, registration.user_id)
+    except ViewingRejected as exc:
+        raise HTTPException(status_code=409, detail=str(exc))
+    if not created:
+        raise HTTPException(status_code=404, detail="Viewing not found")
+    return created
+
+
+@app.delete(
+    "/viewings/{viewing_id}/registrations/{user_id}",
+    status_code=status.HTTP_200_OK,
+    response_model=ViewingRegistrationResponse,
+)
+async def api_cancel_registration(viewing_id: int, user_id: int, con=Depends(get_async_db)):
+    removed = await cancel_registration(con, viewing_id, user_id)
+    if not removed:
+        raise HTTPException(status_code=404, detail="Registration not found")
+    return removed
+
+
+@app.get(
+    "/agents/{agent_id}/viewings",
+    status_code=status.HTTP_200_OK,
+    response_model=list[ViewingResponse],
+)
+async def api_get_agent_calendar(
+    agent_id: int, start: datetime, end: datetime, con=Depends(get_async_db)
+):
+    try:
+        viewings = await get_agent_calendar(con, agent_id, start, end)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    return viewings
+
+
 # ---------- AGENT REVIEWS ----------
-@app.get("/agents/{agent_id}/reviews")
-def get_agent_reviews(agent_id: int):
-    con = get_connection()
-    with con:
-        with con.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SELECT * FROM agent_reviews WHERE agent_id = %s;",
-                (agent_id,)
-            )
-            reviews = cur.fetchall()
-    con.close()
+
+@app.get(
+    "/agents/{agent_id}/reviews",
+    status_code=status.HTTP_200_OK,
+    response_model=Page[AgentReviewResponse],
+)
+async def api_get_agent_reviews(
+    agent_id: int,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: str = None,
+    con=Depends(get_async_db),
+):
+    try:
+        reviews = await get_agent_reviews(con, agent_id, limit, cursor)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
     return reviews
 
-@app.post("/agents/{agent_id}/reviews")
-def create_agent_review(agent_id: int, reviewer_id: int, rating: int, comment: str = None):
-    con = get_connection()
-    with con:
-        with con.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                INSERT INTO agent_reviews (agent_id, reviewer_id, rating, comment)
-                VALUES (%s, %s, %s, %s)
-                RETURNING *;
-                """,
-                (agent_id, reviewer_id, rating, comment)
-            )
-            review = cur.fetchone()
-    con.close()
+
+@app.get("/agents/{agent_id}/rating", status_code=status.HTTP_200_OK, response_model=AgentRating)
+async def api_get_agent_rating(agent_id: int, con=Depends(get_async_db)):
+    rating = await get_agent_rating(con, agent_id)
+    if not rating:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return rating
+
+
+@app.post(
+    "/agents/{agent_id}/reviews",
+    status_code=status.HTTP_200_OK,
+    response_model=AgentReviewResponse,
+)
+async def api_create_agent_review(
+    agent_id: int, reviewer_id: int, rating: int, comment: str = None, con=Depends(get_async_db)
+):
+    review = await create_agent_review(con, agent_id, reviewer_id, rating, comment)
     return review
 
+
 # ---------- IMAGES ----------
-@app.get("/listings/{listing_id}/images")
-def get_listing_images(listing_id: int):
-    con = get_connection()
-    with con:
-        with con.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SELECT * FROM images WHERE listing_id = %s ORDER BY position ASC;",
-                (listing_id,)
-            )
-            images = cur.fetchall()
-    con.close()
+
+@app.get(
+    "/listings/{listing_id}/images",
+    status_code=status.HTTP_200_OK,
+    response_model=list[ImageResponse],
+)
+async def api_get_listing_images(
+    listing_id: int, request: Request, response: Response, con=Depends(get_async_db)
+):
+    # The version is read before the images, so a concurrent change can
+    # only make the ETag older than the body, never newer.
+    version = await get_listing_images_version(con, listing_id)
+    not_modified = conditional(request, response, version)
+    if not_modified:
+        return not_modified
+    images = await get_listing_images(con, listing_id)
     return images
 
-@app.post("/listings/{listing_id}/images")
-def create_listing_image(listing_id: int, image_url: str, position: int = None):
-    con = get_connection()
-    with con:
-        with con.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                """
-                INSERT INTO images (listing_id, image_url, position)
-                VALUES (%s, %s, %s)
-                RETURNING *;
-                """,
-                (listing_id, image_url, position)
+
+@app.post(
+    "/listings/{listing_id}/images",
+    status_code=status.HTTP_200_OK,
+    response_model=ImageResponse,
+)
+async def api_create_listing_image(
+    listing_id: int, image_url: str, position: int = None, con=Depends(get_async_db)
+):
+    image = await create_listing_image(con, listing_id, image_url, position)
+    return image
+
+
+async def _limited(chunks, max_bytes):
+    # Passes the body through, cutting it off once it outgrows max_bytes,
+    # whatever Content-Length claimed.
+    size = 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if size > max_bytes:
+            raise HTTPException(
+                status_code=413, detail=f"Upload exceeds {max_bytes} bytes"
             )
-            image = cur.fetchone()
-    con.close()
+        yield chunk
+
+
+@app.post(
+    "/listings/{listing_id}/images/upload",
+    status_code=status.HTTP_201_CREATED,
+    response_model=ImageResponse,
+)
+async def api_upload_listing_image(
+    listing_id: int,
+    request: Request,
+    content_type: str = Header(...),
+    content_length: int = Header(None),
+    description: str = None,
+    position: int = None,
+):
+    # The raw body is the image (Content-Type image/jpeg, png or webp). It
+    # goes to storage as it arrives, and no connection is held meanwhile.
+    extension = UPLOAD_TYPES.get(content_type.split(";")[0].strip().lower())
+    if extension is None:
+        raise HTTPException(
+            status_code=415, detail=f"Content-Type must be one of {', '.join(UPLOAD_TYPES)}"
+        )
+    if content_length is not None and content_length > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {UPLOAD_MAX_BYTES} bytes")
+    async with async_db.acquire() as con:
+        if await get_listing_version(con, listing_id) is None:
+            raise HTTPException(status_code=404, detail="Listing not found")
+
+    storage_key = f"listings/{listing_id}/{uuid.uuid4().hex}{extension}"
+    size = await storage.save(storage_key, _limited(request.stream(), UPLOAD_MAX_BYTES))
+    if size == 0:
+        await storage.delete(storage_key)
+        raise HTTPException(status_code=400, detail="Empty upload")
+    try:
+        async with async_db.acquire() as con:
+            async with con.transaction():
+                image = await create_uploaded_image(
+                    con, listing_id, storage_key, storage.url(storage_key), description, position
+                )
+                # Without the in-process processor, python worker.py makes
+                # the variants.
+                if image and not processor.running:
+                    await enqueue_job(
+                        con, "process_image", {"image_id": image["id"]}, queue="images"
+                    )
+    except BaseException:
+        await storage.delete(storage_key)
+        raise
+    if not image:
+        await storage.delete(storage_key)
+        raise HTTPException(status_code=404, detail="Listing not found")
+    processor.submit(image["id"])
     return image
 
+
+@app.put(
+    "/listings/{listing_id}/images/order",
+    status_code=status.HTTP_200_OK,
+    response_model=list[ImageResponse],
+)
+async def api_reorder_listing_images(
+    listing_id: int, order: ImageOrder, con=Depends(get_async_db)
+):
+    try:
+        images = await reorder_listing_images(con, listing_id, order.image_ids)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    if images is None:
+        raise HTTPException(status_code=404, detail="Listing has no images")
+    return images
+
+
 # ---------- ADDRESSES ----------
-@app.post("/addresses", status_code=201)
-def api_create_address(street: str, postal_code: str, city: str, country: str):
-    con = get_connection()
-    created = create_address(con, street, postal_code, city, country)
-    con.close()
-    return created
\ No newline at end of file
+
+@app.post("/addresses", status_code=status.HTTP_201_CREATED, response_model=AddressResponse)
+async def api_create_address(
+    street: str,
+    postal_code: str,
+    city: str,
+    country: str,
+    latitude: float = Query(None, ge=-90, le=90),
+    longitude: float = Query(None, ge=-180, le=180),
+):
+    # Geocoding may wait on a remote service, so no connection is held
+    # until the coordinates are known.
+    if latitude is None or longitude is None:
+        coordinates = await geocoder.geocode(street, postal_code, city, country)
+        if coordinates is not None:
+            latitude, longitude = coordinates
+    async with async_db.acquire() as con:
+        created = await create_address(
+            con, street, postal_code, city, country, latitude, longitude
+        )
+    return created
+
+
+# ---------- STATS ----------
+
+@app.get("/stats/market", status_code=status.HTTP_200_OK, response_model=MarketStats)
+async def api_get_market_stats(
+    city: str = None, category_id: int = None, con=Depends(get_async_db)
+):
+    stats = await get_market_stats(con, city, category_id)
+    if not stats:
+        raise HTTPException(status_code=404, detail="No statistics for this selection")
+    return stats
+
+
+@app.get("/stats/market/cities", status_code=status.HTTP_200_OK, response_model=list[MarketStats])
+async def api_get_market_stats_by_city(category_id: int = None, con=Depends(get_async_db)):
+    return await get_market_stats_by_city(con, category_id)
+
+
+@app.get(
+    "/stats/market/categories", status_code=status.HTTP_200_OK, response_model=list[MarketStats]
+)
+async def api_get_market_stats_by_category(city: str = None, con=Depends(get_async_db)):
+    return await get_market_stats_by_category(con, city)
+
+
+@app.get("/stats/refresh", status_code=status.HTTP_200_OK, response_model=list[StatsRefreshState])
+async def api_get_stats_refresh_state(con=Depends(get_async_db)):
+    return await get_stats_refresh_state(con)
+
+
+# ---------- JOBS ----------
+
+@app.get("/jobs/stats", status_code=status.HTTP_200_OK, response_model=list[JobQueueStats])
+async def api_get_job_queue_stats(con=Depends(get_async_db)):
+    return await get_job_queue_stats(con)
+
+
+# ---------- CACHE ----------
+
+@app.get("/cache/stats", status_code=status.HTTP_200_OK)
+async def api_get_cache_stats():
+    return await cache.stats()
+
+
+# ---------- METRICS ----------
+
+@app.get("/metrics", status_code=status.HTTP_200_OK, response_class=PlainTextResponse)
+async def api_get_metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,1673 @@
+import base64
+import binascii
+import json
+import math
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+
+import asyncpg
+from dotenv import load_dotenv
+
+from cache import cache
+from metrics import named_query, observe_acquire, observe_query
+from schemas import (
+    AddressResponse,
+    AgencyResponse,
+    AgentReviewResponse,
+    BidResponse,
+    CategoryResponse,
+    FavoriteMembership,
+    FavoriteResponse,
+    ImageResponse,
+    JobQueueStats,
+    ListingResponse,
+    ListingSummary,
+    MarketStats,
+    SavedSearchResponse,
+    StatsRefreshState,
+    UserResponse,
+    UserSummary,
+    ViewingRegistrationResponse,
+    ViewingResponse,
+)
+
+load_dotenv()
+
+
+# ---------- CONNECTION ----------
+
+POOL_MIN_SIZE = int(os.getenv("DB_ASYNC_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_ASYNC_POOL_MAX_SIZE", "20"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+_pool = None
+
+
+def _row_count(status):
+    # "INSERT 0 5", "UPDATE 3", "SELECT 12" -> the trailing count.
+    count = status.rsplit(" ", 1)[-1] if isinstance(status, str) else ""
+    return int(count) if count.isdigit() else 0
+
+
+class InstrumentedConnection(asyncpg.Connection):
+    # Times every statement for metrics.py, labelled with the @named_query
+    # it runs under.
+
+    async def _timed(self, method, query, args, kwargs, count_rows):
+        started = time.perf_counter()
+        result = await method(query, *args, **kwargs)
+        observe_query(query, time.perf_counter() - started, count_rows(result))
+        return result
+
+    async def fetch(self, query, *args, **kwargs):
+        return await self._timed(super().fetch, query, args, kwargs, len)
+
+    async def fetchrow(self, query, *args, **kwargs):
+        return await self._timed(
+            super().fetchrow, query, args, kwargs, lambda row: int(row is not None)
+        )
+
+    async def fetchval(self, query, *args, **kwargs):
+        return await self._timed(super().fetchval, query, args, kwargs, lambda value: 1)
+
+    async def execute(self, query, *args, **kwargs):
+        return await self._timed(super().execute, query, args, kwargs, _row_count)
+
+    async def executemany(self, command, args, **kwargs):
+        return await self._timed(
+            super().executemany, command, (args,), kwargs, lambda result: len(args)
+        )
+
+
+async def _init_connection(con):
+    # Decode json/jsonb columns (json_agg, to_jsonb, ...) into Python objects
+    # instead of strings.
+    for type_name in ("json", "jsonb"):
+        await con.set_type_codec(
+            type_name, encoder=json.dumps, decoder=json.loads, schema="pg_catalog"
+        )
+
+
+async def init_pool(min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE):
+    global _pool
+    if _pool is None:
+        _pool = await asyncpg.create_pool(
+            host=os.getenv("DB_HOST"),
+            port=os.getenv("DB_PORT"),
+            database=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASSWORD"),
+            min_size=min_size,
+            max_size=max_size,
+            init=_init_connection,
+            connection_class=InstrumentedConnection,
+        )
+    return _pool
+
+
+async def connect():
+    # A dedicated connection outside the pool, for LISTEN and other
+    # long-lived sessions.
+    con = await asyncpg.connect(
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        database=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        connection_class=InstrumentedConnection,
+    )
+    await _init_connection(con)
+    return con
+
+
+async def close_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+    _pool = None
+
+
+@asynccontextmanager
+async def acquire():
+    started = time.perf_counter()
+    async with _pool.acquire(timeout=POOL_TIMEOUT) as con:
+        observe_acquire(time.perf_counter() - started, "async")
+        yield con
+
+
+def _one(row):
+    return dict(row) if row is not None else None
+
+
+def _all(rows):
+    return [dict(row) for row in rows]
+
+
+# ---------- COLUMNS ----------
+# The response models in schemas.py double as column lists, so each query
+# fetches exactly the fields its route returns.
+
+def _columns(model, alias=None):
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(f"{prefix}{name}" for name in model.model_fields)
+
+
+def _json_object(model, alias):
+    pairs = ", ".join(f"'{name}', {alias}.{name}" for name in model.model_fields)
+    return f"jsonb_build_object({pairs})"
+
+
+# ---------- PAGINATION ----------
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(row, id_column="id"):
+    raw = f"{row['created_at'].isoformat()}|{row[id_column]}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        created_at, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def _keyset(conditions, args, cursor, alias, id_column="id"):
+    # Rows are returned newest first, so the next page is everything
+    # strictly older than the last (created_at, id) the client saw.
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        args.extend([created_at, row_id])
+        conditions.append(
+            f"({alias}.created_at, {alias}.{id_column}) < (${len(args) - 1}, ${len(args)})"
+        )
+
+
+def _page(rows, limit, encode=encode_cursor):
+    items = _all(rows[:limit])
+    next_cursor = encode(items[-1]) if len(rows) > limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _listing_columns(fields=None):
+    if not fields:
+        return _columns(ListingSummary, "l")
+    unknown = set(fields) - set(ListingSummary.model_fields)
+    if unknown:
+        raise ValueError(f"Unknown listing fields: {', '.join(sorted(unknown))}")
+    # id and created_at are always selected because the cursor is built from them.
+    columns = dict.fromkeys(["id", "created_at", *fields])
+    return ", ".join(f"l.{column}" for column in columns)
+
+
+# ---------- USERS ----------
+
+@named_query("get_users")
+async def get_users(con, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    conditions, args = [], []
+    _keyset(conditions, args, cursor, "u")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit = min(limit, MAX_PAGE_SIZE)
+    args.append(limit + 1)
+    rows = await con.fetch(
+        f"""
+        SELECT {_columns(UserSummary, "u")}
+        FROM users u
+        {where}
+        ORDER BY u.created_at DESC, u.id DESC
+        LIMIT ${len(args)};
+        """,
+        *args,
+    )
+    return _page(rows, limit)
+
+
+@named_query("get_user_by_id")
+async def get_user_by_id(con, user_id):
+    row = await con.fetchrow(
+        f"SELECT {_columns(UserResponse)} FROM users WHERE id = $1;", user_id
+    )
+    return _one(row)
+
+
+@named_query("create_user")
+async def create_user(con, email, password_hash, first_name, last_name, role_id):
+    row = await con.fetchrow(
+        f"""
+        INSERT INTO users (email, password_hash, first_name, last_name, role_id)
+        VALUES ($1, $2, $3, $4, $5)
+        RETURNING {_columns(UserResponse)};
+        """,
+        email, password_hash, first_name, last_name, role_id,
+    )
+    return _one(row)
+
+
+@named_query("update_user")
+async def update_user(con, user_id, first_name, last_name):
+    row = await con.fetchrow(
+        f"""
+        UPDATE users
+        SET first_name = $1, last_name = $2
+        WHERE id = $3
+        RETURNING {_columns(UserResponse)};
+        """,
+        first_name, last_name, user_id,
+    )
+    return _one(row)
+
+
+@named_query("delete_user")
+async def delete_user(con, user_id):
+    row = await con.fetchrow("DELETE FROM users WHERE id = $1 RETURNING id;", user_id)
+    return _one(row)
+
+
+# ---------- LISTINGS ----------
+
+def _listing_filters(
+    conditions,
+    args,
+    status=None,
+    category_id=None,
+    min_price=None,
+    max_price=None,
+    rooms=None,
+    min_living_area=None,
+    max_living_area=None,
+    city=None,
+    agency_id=None,
+):
+    filters = (
+        ("l.status = {}", status),
+        ("l.category_id = {}", category_id),
+        ("l.price >= {}", min_price),
+        ("l.price <= {}", max_price),
+        ("l.rooms = {}", rooms),
+        ("l.living_area >= {}", min_living_area),
+        ("l.living_area <= {}", max_living_area),
+        ("l.agency_id = {}", agency_id),
+    )
+    for condition, value in filters:
+        if value is not None:
+            args.append(value)
+            conditions.append(condition.format(f"${len(args)}"))
+    if city is not None:
+        args.append(city)
+        conditions.append(
+            "EXISTS (SELECT 1 FROM addresses a"
+            f" WHERE a.id = l.address_id AND lower(a.city) = lower(${len(args)}))"
+        )
+
+
+@named_query("get_listings")
+async def get_listings(con, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, **filters):
+    conditions, args = [], []
+    _listing_filters(conditions, args, **filters)
+    _keyset(conditions, args, cursor, "l")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit = min(limit, MAX_PAGE_SIZE)
+    args.append(limit + 1)
+    rows = await con.fetch(
+        f"""
+        SELECT {_listing_columns(fields)}
+        FROM listings l
+        {where}
+        ORDER BY l.created_at DESC, l.id DESC
+        LIMIT ${len(args)};
+        """,
+        *args,
+    )
+    return _page(rows, limit)
+
+
+def encode_search_cursor(row):
+    raw = f"{row['rank']!r}|{row['id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_search_cursor(cursor):
+    try:
+        rank, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return float(rank), int(row_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+@named_query("search_listings")
+async def search_listings(
+    con, query, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None, **filters
+):
+    # Full-text matches on title/description/street/city, plus fuzzy
+    # street/city matches for misspelt addresses. Each branch is served by
+    # its own GIN index; a listing found by both keeps the better rank.
+    # Pages are keyset on (rank, id), which is stable for a given query.
+    conditions, args = [], [query]
+    _listing_filters(conditions, args, **filters)
+    if cursor:
+        rank, row_id = decode_search_cursor(cursor)
+        args.extend([rank, row_id])
+        conditions.append(f"(m.rank, l.id) < (${len(args) - 1}, ${len(args)})")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    limit = min(limit, MAX_PAGE_SIZE)
+    args.append(limit + 1)
+    rows = await con.fetch(
+        f"""
+        WITH q AS (
+            SELECT websearch_to_tsquery('swedish', $1)
+                || websearch_to_tsquery('english', $1) AS query
+        ),
+        matches AS (
+            SELECT s.listing_id, ts_rank_cd(s.document, q.query) AS rank
+            FROM listing_search s, q
+            WHERE s.document @@ q.query
+            UNION ALL
+            SELECT l.id, word_similarity(lower($1), lower(a.street || ' ' || a.city))
+            FROM addresses a
+            JOIN listings l ON l.address_id = a.id
+            WHERE lower($1) <% lower(a.street || ' ' || a.city)
+        )
+        SELECT {_listing_columns(fields)}, m.rank
+        FROM (
+            SELECT listing_id, max(rank) AS rank
+            FROM matches
+            GROUP BY listing_id
+        ) m
+        JOIN listings l ON l.id = m.listing_id
+        {where}
+        ORDER BY m.rank DESC, l.id DESC
+        LIMIT ${len(args)};
+        """,
+        *args,
+    )
+    return _page(rows, limit, encode_search_cursor)
+
+
+@named_query("get_listing_by_id")
+async def get_listing_by_id(con, listing_id):
+    row = await con.fetchrow(
+        f"SELECT {_columns(ListingResponse)} FROM listings WHERE id = $1;", listing_id
+    )
+    return _one(row)
+
+
+@named_query("get_listing_detail")
+async def get_listing_detail(con, listing_id):
+    # Everything a property page needs in one round-trip. The top bid, bid
+    # count and agent rating come from denormalized columns/rows kept up to
+    # date on write; each LATERAL subquery is served by an index on
+    # listing_id.
+    row = await con.fetchrow(
+        f"""
+        SELECT
+            {_columns(ListingResponse, "l")},
+            {_json_object(AddressResponse, "a")} AS address,
+            {_json_object(CategoryResponse, "c")} AS category,
+            CASE WHEN ag.id IS NOT NULL THEN {_json_object(AgencyResponse, "ag")} END AS agency,
+            jsonb_build_object(
+                'id', u.id,
+                'first_name', u.first_name,
+                'last_name', u.last_name,
+                'email', u.email,
+                'phone', u.phone,
+                'review_count', COALESCE(r.rating_count, 0),
+                'average_rating', r.average_rating
+            ) AS agent,
+            img.images,
+            CASE WHEN tb.id IS NOT NULL THEN {_json_object(BidResponse, "tb")} END AS top_bid,
+            v.upcoming_viewings
+        FROM listings l
+        JOIN addresses a ON a.id = l.address_id
+        JOIN listing_categories c ON c.id = l.category_id
+        JOIN users u ON u.id = l.agent_id
+        LEFT JOIN real_estate_agencies ag ON ag.id = l.agency_id
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(
+                jsonb_agg({_json_object(ImageResponse, "i")} ORDER BY i.position, i.id), '[]'
+            ) AS images
+            FROM images i
+            WHERE i.listing_id = l.id
+        ) img
+        LEFT JOIN bids tb ON tb.id = l.highest_bid_id
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(
+                jsonb_agg({_json_object(ViewingResponse, "vw")} ORDER BY vw.start_time), '[]'
+            ) AS upcoming_viewings
+            FROM viewings vw
+            WHERE vw.listing_id = l.id AND vw.start_time >= NOW() AND vw.cancelled_at IS NULL
+        ) v
+        LEFT JOIN agent_ratings r ON r.agent_id = l.agent_id
+        WHERE l.id = $1;
+        """,
+        listing_id,
+    )
+    return _one(row)
+
+
+@named_query("create_listing")
+async def create_listing(
+    con,
+    title,
+    description,
+    price,
+    living_area,
+    rooms,
+    category_id,
+    agent_id,
+    status,
+    address_id,
+):
+    row = await con.fetchrow(
+        f"""
+        INSERT INTO listings
+        (title, description, price, living_area, rooms,
+        category_id, agent_id, status, address_id)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+        RETURNING {_columns(ListingResponse)};
+        """,
+        title,
+        description,
+        price,
+        living_area,
+        rooms,
+        category_id,
+        agent_id,
+        status,
+        address_id,
+    )
+    return _one(row)
+
+
+@named_query("update_listing")
+async def update_listing(con, listing_id, title, description, price):
+    row = await con.fetchrow(
+        f"""
+        UPDATE listings
+        SET title = $1, description = $2, price = $3
+        WHERE id = $4
+        RETURNING {_columns(ListingResponse)};
+        """,
+        title, description, price, listing_id,
+    )
+    await cache.invalidate("listing", listing_id)
+    return _one(row)
+
+
+@named_query("update_listing_status")
+async def update_listing_status(con, listing_id, status):
+    row = await con.fetchrow(
+        f"""
+        UPDATE listings
+        SET status = $1
+        WHERE id = $2
+        RETURNING {_columns(ListingResponse)};
+        """,
+        status, listing_id,
+    )
+    await cache.invalidate("listing", listing_id)
+    return _one(row)
+
+
+@named_query("delete_listing")
+async def delete_listing(con, listing_id):
+    row = await con.fetchrow("DELETE FROM listings WHERE id = $1 RETURNING id;", listing_id)
+    await cache.invalidate("listing", listing_id)
+    return _one(row)
+
+
+# ---------- BIDS ----------
+
+BID_MIN_INCREMENT = int(os.getenv("BID_MIN_INCREMENT", "1000"))
+
+
+class BidRejected(Exception):
+    pass
+
+
+@named_query("get_bids_for_listing")
+async def get_bids_for_listing(con, listing_id):
+    rows = await con.fetch(
+        f"""
+        SELECT {_columns(BidResponse)}
+        FROM bids
+        WHERE listing_id = $1
+        ORDER BY amount DESC;
+        """,
+        listing_id,
+    )
+    return _all(rows)
+
+
+@named_query("create_bid")
+async def create_bid(con, listing_id, bidder_id, amount, min_increment=BID_MIN_INCREMENT):
+    # One statement: lock the listing row, check it is open and that the bid
+    # clears the current highest by min_increment, insert, and move the
+    # listing's highest bid. The checks are part of the locking WHERE, so a
+    # bid that is already too low is rejected without queueing on the lock;
+    # one that waited is re-checked against the row it finally locked.
+    row = await con.fetchrow(
+        f"""
+        WITH current AS (
+            SELECT id, status, highest_bid_amount
+            FROM listings
+            WHERE id = $1
+        ), target AS (
+            SELECT id
+            FROM listings
+            WHERE id = $1
+            AND status = 'active'
+            -- In bigint: a highest bid near the INTEGER maximum plus the
+            -- increment would overflow int4 and fail the statement.
+            AND (highest_bid_amount IS NULL OR $3::bigint >= highest_bid_amount::bigint + $4)
+            FOR UPDATE
+        ), bid AS (
+            INSERT INTO bids (listing_id, bidder_id, amount)
+            SELECT id, $2, $3
+            FROM target
+            RETURNING {_columns(BidResponse)}
+        ), bump AS (
+            UPDATE listings l
+            SET highest_bid_id = bid.id,
+                highest_bid_amount = bid.amount,
+                bid_count = l.bid_count + 1
+            FROM bid
+            WHERE l.id = bid.listing_id
+        )
+        SELECT c.status AS listing_status, c.highest_bid_amount, {_columns(BidResponse, "bid")}
+        FROM current c
+        LEFT JOIN bid ON TRUE;
+        """,
+        listing_id, bidder_id, amount, min_increment,
+    )
+    if row is None:
+        return None
+    if row["id"] is None:
+        if row["listing_status"] != "active":
+            raise BidRejected("Listing is not open for bids")
+        raise BidRejected(
+            f"Bid must beat the current highest bid by at least {min_increment}"
+        )
+    await cache.invalidate("listing", listing_id)
+    bid = dict(row)
+    del bid["listing_status"], bid["highest_bid_amount"]
+    return bid
+
+
+@named_query("accept_bid")
+async def accept_bid(con, bid_id):
+    async with con.transaction():
+        listing_id = await con.fetchval("SELECT listing_id FROM bids WHERE id = $1;", bid_id)
+        if listing_id is None:
+            return None
+        # Same lock create_bid takes, so no bid can land while we accept.
+        listing_status = await con.fetchval(
+            "SELECT status FROM listings WHERE id = $1 FOR UPDATE;", listing_id
+        )
+        if listing_status != "active":
+            raise BidRejected("Listing is not open for bids")
+        accepted = await con.fetchrow(
+            f"""
+            UPDATE bids
+            SET is_accepted = TRUE
+            WHERE id = $1
+            RETURNING {_columns(BidResponse)};
+            """,
+            bid_id,
+        )
+        await con.execute(
+            "UPDATE bids SET is_rejected = TRUE WHERE listing_id = $1 AND id <> $2;",
+            listing_id, bid_id,
+        )
+        await con.execute("UPDATE listings SET status = 'sold' WHERE id = $1;", listing_id)
+    await cache.invalidate("listing", listing_id)
+    return _one(accepted)
+
+
+# ---------- FAVORITES ----------
+
+@named_query("add_favorite")
+async def add_favorite(con, user_id, listing_id):
+    row = await con.fetchrow(
+        f"""
+        INSERT INTO favorites (user_id, listing_id)
+        VALUES ($1, $2)
+        RETURNING {_columns(FavoriteResponse)};
+        """,
+        user_id, listing_id,
+    )
+    return _one(row)
+
+
+@named_query("remove_favorite")
+async def remove_favorite(con, user_id, listing_id):
+    row = await con.fetchrow(
+        f"""
+        DELETE FROM favorites
+        WHERE user_id = $1 AND listing_id = $2
+        RETURNING {_columns(FavoriteResponse)};
+        """,
+        user_id, listing_id,
+    )
+    return _one(row)
+
+
+@named_query("get_user_favorites")
+async def get_user_favorites(con, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None):
+    conditions, args = ["f.user_id = $1"], [user_id]
+    _keyset(conditions, args, cursor, "l")
+    limit = min(limit, MAX_PAGE_SIZE)
+    args.append(limit + 1)
+    rows = await con.fetch(
+        f"""
+        SELECT {_listing_columns(fields)}
+        FROM listings l
+        JOIN favorites f ON l.id = f.listing_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY l.created_at DESC, l.id DESC
+        LIMIT ${len(args)};
+        """,
+        *args,
+    )
+    return _page(rows, limit)
+
+
+@named_query("get_user_favorite_ids")
+async def get_user_favorite_ids(con, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    # Straight off the (user_id, created_at, listing_id) index; no listings.
+    conditions, args = ["f.user_id = $1"], [user_id]
+    _keyset(conditions, args, cursor, "f", "listing_id")
+    limit = min(limit, MAX_PAGE_SIZE)
+    args.append(limit + 1)
+    rows = await con.fetch(
+        f"""
+        SELECT {_columns(FavoriteResponse, "f")}
+        FROM favorites f
+        WHERE {' AND '.join(conditions)}
+        ORDER BY f.created_at DESC, f.listing_id DESC
+        LIMIT ${len(args)};
+        """,
+        *args,
+    )
+    return _page(rows, limit, lambda row: encode_cursor(row, "listing_id"))
+
+
+@named_query("get_favorite_memberships")
+async def get_favorite_memberships(con, user_id, listing_ids):
+    # One row per requested id, in request order, whether or not the
+    # listing exists.
+    rows = await con.fetch(
+        """
+        SELECT
+            ids.listing_id,
+            f.created_at IS NOT NULL AS is_favorite,
+            f.created_at AS favorited_at,
+            COALESCE(c.favorite_count, 0) AS favorite_count
+        FROM unnest($2::int[]) WITH ORDINALITY AS ids(listing_id, n)
+        LEFT JOIN favorites f ON f.user_id = $1 AND f.listing_id = ids.listing_id
+        LEFT JOIN listing_favorite_counts c ON c.listing_id = ids.listing_id
+        ORDER BY ids.n;
+        """,
+        user_id, listing_ids,
+    )
+    return _all(rows)
+
+
+# ---------- SAVED SEARCHES ----------
+# Matching runs in the database (migrations/0010): listing inserts and
+# criteria changes append to saved_search_alerts, which is read here.
+
+SAVED_SEARCH_CRITERIA = (
+    "city",
+    "category_id",
+    "min_price",
+    "max_price",
+    "rooms",
+    "min_living_area",
+    "max_living_area",
+    "agency_id",
+)
+
+
+@named_query("create_saved_search")
+async def create_saved_search(con, user_id, name, **criteria):
+    unknown = set(criteria) - set(SAVED_SEARCH_CRITERIA)
+    if unknown:
+        raise ValueError(f"Unknown search criteria: {', '.join(sorted(unknown))}")
+    min_price, max_price = criteria.get("min_price"), criteria.get("max_price")
+    if min_price is not None and max_price is not None and min_price > max_price:
+        raise ValueError("min_price is greater than max_price")
+    values = [criteria.get(column) for column in SAVED_SEARCH_CRITERIA]
+    placeholders = ", ".join(f"${n}" for n in range(3, len(values) + 3))
+    row = await con.fetchrow(
+        f"""
+        INSERT INTO saved_searches (user_id, name, {', '.join(SAVED_SEARCH_CRITERIA)})
+        VALUES ($1, $2, {placeholders})
+        RETURNING {_columns(SavedSearchResponse)};
+        """,
+        user_id, name, *values,
+    )
+    return _one(row)
+
+
+@named_query("get_saved_searches")
+async def get_saved_searches(con, user_id):
+    rows = await con.fetch(
+        f"""
+        SELECT {_columns(SavedSearchResponse)}
+        FROM saved_searches
+        WHERE user_id = $1
+        ORDER BY id;
+        """,
+        user_id,
+    )
+    return _all(rows)
+
+
+@named_query("delete_saved_search")
+async def delete_saved_search(con, user_id, saved_search_id):
+    row = await con.fetchrow(
+        f"""
+        DELETE FROM saved_searches
+        WHERE id = $1 AND user_id = $2
+        RETURNING {_columns(SavedSearchResponse)};
+        """,
+        saved_search_id, user_id,
+    )
+    return _one(row)
+
+
+@named_query("get_search_alerts")
+async def get_search_alerts(con, user_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    conditions, args = ["sa.user_id = $1"], [user_id]
+    _keyset(conditions, args, cursor, "sa")
+    limit = min(limit, MAX_PAGE_SIZE)
+    args.append(limit + 1)
+    rows = await con.fetch(
+        f"""
+        SELECT sa.id, sa.saved_search_id, sa.listing_id, sa.reason, sa.created_at,
+               {_json_object(ListingSummary, "l")} AS listing
+        FROM saved_search_alerts sa
+        JOIN listings l ON l.id = sa.listing_id
+        WHERE {' AND '.join(conditions)}
+        ORDER BY sa.created_at DESC, sa.id DESC
+        LIMIT ${len(args)};
+        """,
+        *args,
+    )
+    return _page(rows, limit)
+
+
+# ---------- CATEGORIES ----------
+
+@named_query("get_categories")
+async def get_categories(con):
+    rows = await con.fetch(f"SELECT {_columns(CategoryResponse)} FROM listing_categories;")
+    return _all(rows)
+
+
+@named_query("create_category")
+async def create_category(con, name):
+    row = await con.fetchrow(
+        f"""
+        INSERT INTO listing_categories (name)
+        VALUES ($1)
+        RETURNING {_columns(CategoryResponse)};
+        """,
+        name,
+    )
+    await cache.invalidate("categories", "all")
+    return _one(row)
+
+
+# ---------- AGENCIES ----------
+
+@named_query("get_agencies")
+async def get_agencies(con):
+    rows = await con.fetch(f"SELECT {_columns(AgencyResponse)} FROM real_estate_agencies;")
+    return _all(rows)
+
+
+@named_query("get_agency_listings")
+async def get_agency_listings(con, agency_id, limit=DEFAULT_PAGE_SIZE, cursor=None, fields=None):
+    return await get_listings(con, limit, cursor, fields, agency_id=agency_id)
+
+
+# ---------- VIEWINGS ----------
+
+VIEWING_CAPACITY = int(os.getenv("VIEWING_CAPACITY", "10"))
+
+
+class ViewingRejected(Exception):
+    pass
+
+
+@named_query("get_viewings_for_listing")
+async def get_viewings_for_listing(con, listing_id):
+    rows = await con.fetch(
+        f"""
+        SELECT {_columns(ViewingResponse)}
+        FROM viewings
+        WHERE listing_id = $1
+        ORDER BY start_time, id;
+        """,
+        listing_id,
+    )
+    return _all(rows)
+
+
+# Longest range the agent calendar returns in one request.
+MAX_CALENDAR_DAYS = 92
+
+
+@named_query("get_agent_calendar")
+async def get_agent_calendar(con, agent_id, start, end):
+    if end <= start:
+        raise ValueError("end must be after start")
+    if (end - start).days > MAX_CALENDAR_DAYS:
+        raise ValueError(f"At most {MAX_CALENDAR_DAYS} days per request")
+    # Matches viewings_no_agent_overlap's predicate and expression, so its
+    # gist index answers this without scanning the agent's other viewings.
+    rows = await con.fetch(
+        f"""
+        SELECT {_columns(ViewingResponse)}
+        FROM viewings
+        WHERE agent_id = $1
+          AND tstzrange(start_time, end_time) && tstzrange($2, $3)
+          AND cancelled_at IS NULL
+        ORDER BY start_time;
+        """,
+        agent_id, start, end,
+    )
+    return _all(rows)
+
+
+@named_query("create_viewing")
+async def create_viewing(con, listing_id, start_time, end_time=None, agent_id=None, capacity=None):
+    if end_time is not None and end_time <= start_time:
+        raise ValueError("end_time must be after start_time")
+    if capacity is None:
+        capacity = VIEWING_CAPACITY
+    # Overlaps are rejected by the exclusion constraints in migrations/0012,
+    # which also hold against a concurrent booking of the same slot.
+    try:
+        row = await con.fetchrow(
+            f"""
+            INSERT INTO viewings (listing_id, agent_id, start_time, end_time, capacity)
+            SELECT l.id, COALESCE($2, l.agent_id), $3, $4, $5
+            FROM listings l
+            WHERE l.id = $1
+            RETURNING {_columns(ViewingResponse)};
+            """,
+            listing_id, agent_id, start_time, end_time, capacity,
+        )
+    except asyncpg.ExclusionViolationError as exc:
+        if exc.constraint_name == "viewings_no_agent_overlap":
+            raise ViewingRejected("The agent already has a viewing at that time")
+        raise ViewingRejected("The listing already has a viewing at that time")
+    return _one(row)
+
+
+@named_query("cancel_viewing")
+async def cancel_viewing(con, viewing_id):
+    row = await con.fetchrow(
+        f"""
+        UPDATE viewings
+        SET cancelled_at = COALESCE(cancelled_at, NOW())
+        WHERE id = $1
+        RETURNING {_columns(ViewingResponse)};
+        """,
+        viewing_id,
+    )
+    return _one(row)
+
+
+@named_query("get_viewing_registrations")
+async def get_viewing_registrations(con, viewing_id):
+    rows = await con.fetch(
+        f"""
+        SELECT {_columns(ViewingRegistrationResponse)}
+        FROM viewing_registrations
+        WHERE viewing_id = $1
+        ORDER BY registered_at, id;
+        """,
+        viewing_id,
+    )
+    return _all(rows)
+
+
+@named_query("register_for_viewing")
+async def register_for_viewing(con, viewing_id, user_id):
+    # Same shape as create_bid: lock the viewing only if it still has room,
+    # insert, and let the trigger bump registration_count under that lock.
+    # A sign-up that waited on the lock re-checks the count it left behind,
+    # so concurrent sign-ups can't push a viewing past capacity.
+    row = await con.fetchrow(
+        f"""
+        WITH target AS (
+            SELECT id
+            FROM viewings
+            WHERE id = $1
+            AND cancelled_at IS NULL
+            AND start_time > NOW()
+            AND registration_count < capacity
+            FOR UPDATE
+        ), registration AS (
+            INSERT INTO viewing_registrations (viewing_id, user_id)
+            SELECT id, $2
+            FROM target
+            ON CONFLICT (viewing_id, user_id) DO NOTHING
+            RETURNING {_columns(ViewingRegistrationResponse)}
+        )
+        SELECT
+            v.cancelled_at,
+            v.start_time,
+            EXISTS (
+                SELECT 1 FROM viewing_registrations r
+                WHERE r.viewing_id = v.id AND r.user_id = $2
+            ) AS already_registered,
+            {_columns(ViewingRegistrationResponse, "registration")}
+        FROM viewings v
+        LEFT JOIN registration ON TRUE
+        WHERE v.id = $1;
+        """,
+        viewing_id, user_id,
+    )
+    if row is None:
+        return None
+    if row["id"] is None:
+        if row["already_registered"]:
+            raise ViewingRejected("Already registered for this viewing")
+        if row["cancelled_at"] is not None:
+            raise ViewingRejected("Viewing is cancelled")
+        if row["start_time"] <= datetime.now(timezone.utc):
+            raise ViewingRejected("Viewing has already started")
+        raise ViewingRejected("Viewing is full")
+    registration = dict(row)
+    del registration["cancelled_at"], registration["start_time"], registration["already_registered"]
+    return registration
+
+
+@named_query("cancel_registration")
+async def cancel_registration(con, viewing_id, user_id):
+    row = await con.fetchrow(
+        f"""
+        DELETE FROM viewing_registrations
+        WHERE viewing_id = $1 AND user_id = $2
+        RETURNING {_columns(ViewingRegistrationResponse)};
+        """,
+        viewing_id, user_id,
+    )
+    return _one(row)
+
+
+# ---------- AGENT REVIEWS ----------
+
+@named_query("get_agent_reviews")
+async def get_agent_reviews(con, agent_id, limit=DEFAULT_PAGE_SIZE, cursor=None):
+    conditions, args = ["r.agent_id = $1"], [agent_id]
+    _keyset(conditions, args, cursor, "r")
+    limit = min(limit, MAX_PAGE_SIZE)
+    args.append(limit + 1)
+    rows = await con.fetch(
+        f"""
+        SELECT {_columns(AgentReviewResponse, "r")}
+        FROM agent_reviews r
+        WHERE {' AND '.join(conditions)}
+        ORDER BY r.created_at DESC, r.id DESC
+        LIMIT ${len(args)};
+        """,
+        *args,
+    )
+    return _page(rows, limit)
+
+
+def _agent_rating(row):
+    rating = dict(row)
+    rating["histogram"] = {str(n): rating.pop(f"rating_{n}") for n in range(1, 6)}
+    return rating
+
+
+@named_query("get_agent_rating")
+async def get_agent_rating(con, agent_id):
+    # Agents without reviews have no agent_ratings row yet.
+    row = await con.fetchrow(
+        """
+        SELECT
+            u.id AS agent_id,
+            COALESCE(r.rating_count, 0) AS rating_count,
+            COALESCE(r.rating_sum, 0) AS rating_sum,
+            r.average_rating,
+            COALESCE(r.rating_1, 0) AS rating_1,
+            COALESCE(r.rating_2, 0) AS rating_2,
+            COALESCE(r.rating_3, 0) AS rating_3,
+            COALESCE(r.rating_4, 0) AS rating_4,
+            COALESCE(r.rating_5, 0) AS rating_5
+        FROM users u
+        LEFT JOIN agent_ratings r ON r.agent_id = u.id
+        WHERE u.id = $1;
+        """,
+        agent_id,
+    )
+    return _agent_rating(row) if row is not None else None
+
+
+@named_query("get_top_agents")
+async def get_top_agents(con, agency_id, limit=10, min_reviews=1):
+    # Walks agent_ratings_agency_rank_idx for the agency; users is only
+    # looked up by primary key for the agents returned.
+    rows = await con.fetch(
+        """
+        SELECT
+            r.agent_id, u.first_name, u.last_name,
+            r.rating_count, r.rating_sum, r.average_rating,
+            r.rating_1, r.rating_2, r.rating_3, r.rating_4, r.rating_5
+        FROM agent_ratings r
+        JOIN users u ON u.id = r.agent_id
+        WHERE r.agency_id = $1 AND r.rating_count > 0 AND r.rating_count >= $2
+        ORDER BY r.average_rating DESC, r.rating_count DESC, r.agent_id
+        LIMIT $3;
+        """,
+        agency_id, min_reviews, min(limit, MAX_PAGE_SIZE),
+    )
+    return [_agent_rating(row) for row in rows]
+
+
+@named_query("create_agent_review")
+async def create_agent_review(con, agent_id, reviewer_id, rating, comment=None):
+    row = await con.fetchrow(
+        f"""
+        INSERT INTO agent_reviews (agent_id, reviewer_id, rating, comment)
+        VALUES ($1, $2, $3, $4)
+        RETURNING {_columns(AgentReviewResponse)};
+        """,
+        agent_id, reviewer_id, rating, comment,
+    )
+    return _one(row)
+
+
+# ---------- IMAGES ----------
+
+@named_query("get_listing_images")
+async def get_listing_images(con, listing_id):
+    rows = await con.fetch(
+        f"""
+        SELECT {_columns(ImageResponse)}
+        FROM images
+        WHERE listing_id = $1
+        ORDER BY position ASC;
+        """,
+        listing_id,
+    )
+    return _all(rows)
+
+
+@named_query("create_listing_image")
+async def create_listing_image(con, listing_id, image_url, position=None):
+    row = await con.fetchrow(
+        f"""
+        INSERT INTO images (listing_id, image_url, position)
+        VALUES ($1, $2, $3)
+        RETURNING {_columns(ImageResponse)};
+        """,
+        listing_id, image_url, position,
+    )
+    return _one(row)
+
+
+@named_query("create_uploaded_image")
+async def create_uploaded_image(
+    con, listing_id, storage_key, image_url, description=None, position=None
+):
+    # Goes after the listing's last image unless a position is given, and
+    # stays pending until ImageProcessor has made its variants.
+    row = await con.fetchrow(
+        f"""
+        INSERT INTO images (listing_id, image_url, description, position, storage_key, status)
+        SELECT l.id, $3, $4,
+               COALESCE($5, (SELECT max(position) + 1 FROM images WHERE listing_id = l.id), 0),
+               $2, 'pending'
+        FROM listings l
+        WHERE l.id = $1
+        RETURNING {_columns(ImageResponse)};
+        """,
+        listing_id, storage_key, image_url, description, position,
+    )
+    return _one(row)
+
+
+@named_query("reorder_listing_images")
+async def reorder_listing_images(con, listing_id, image_ids):
+    # image_ids come first, in the given order; images left out keep their
+    # relative order after them. One UPDATE for the whole listing, and only
+    # rows whose position actually moves are written.
+    if len(set(image_ids)) != len(image_ids):
+        raise ValueError("Duplicate image ids")
+    async with con.transaction():
+        existing = await con.fetch(
+            "SELECT id FROM images WHERE listing_id = $1 ORDER BY id FOR UPDATE;", listing_id
+        )
+        if not existing:
+            return None
+        unknown = set(image_ids) - {row["id"] for row in existing}
+        if unknown:
+            raise ValueError(f"Images not on this listing: {sorted(unknown)}")
+        await con.execute(
+            """
+            WITH requested AS (
+                SELECT image_id, ord
+                FROM unnest($2::int[]) WITH ORDINALITY AS r(image_id, ord)
+            ),
+            ranked AS (
+                SELECT i.id,
+                       row_number() OVER (
+                           ORDER BY r.ord NULLS LAST, i.position NULLS LAST, i.id
+                       ) - 1 AS position
+                FROM images i
+                LEFT JOIN requested r ON r.image_id = i.id
+                WHERE i.listing_id = $1
+            )
+            UPDATE images i
+            SET position = ranked.position
+            FROM ranked
+            WHERE i.id = ranked.id AND i.position IS DISTINCT FROM ranked.position;
+            """,
+            listing_id, image_ids,
+        )
+        return await get_listing_images(con, listing_id)
+
+
+@named_query("get_pending_image_ids")
+async def get_pending_image_ids(con):
+    rows = await con.fetch("SELECT id FROM images WHERE status = 'pending' ORDER BY id;")
+    return [row["id"] for row in rows]
+
+
+@named_query("get_pending_image_key")
+async def get_pending_image_key(con, image_id):
+    return await con.fetchval(
+        "SELECT storage_key FROM images WHERE id = $1 AND status = 'pending';", image_id
+    )
+
+
+@named_query("set_image_variants")
+async def set_image_variants(con, image_id, variants):
+    # False if the image was deleted (or already processed) meanwhile.
+    updated = await con.fetchval(
+        """
+        UPDATE images
+        SET variants = $2, status = 'ready'
+        WHERE id = $1 AND status = 'pending'
+        RETURNING id;
+        """,
+        image_id, variants,
+    )
+    return updated is not None
+
+
+@named_query("set_image_failed")
+async def set_image_failed(con, image_id):
+    await con.execute(
+        "UPDATE images SET status = 'failed' WHERE id = $1 AND status = 'pending';", image_id
+    )
+
+
+# ---------- ADDRESSES ----------
+
+@named_query("create_address")
+async def create_address(
+    con, street, postal_code, city, country, latitude=None, longitude=None
+):
+    row = await con.fetchrow(
+        f"""
+        INSERT INTO addresses (street, postal_code, city, country, latitude, longitude)
+        VALUES ($1, $2, $3, $4, $5, $6)
+        RETURNING {_columns(AddressResponse)};
+        """,
+        street, postal_code, city, country, latitude, longitude,
+    )
+    return _one(row)
+
+
+# ---------- MAP ----------
+
+KM_PER_DEGREE_LATITUDE = 111.195
+CLUSTER_CELL_PX = 64
+MAX_MAP_RESULTS = 500
+
+
+def _bbox_condition(args, west, south, east, north):
+    args.extend([west, south, east, north])
+    n = len(args)
+    # Same expression as addresses_location_idx, so this is a GiST scan.
+    return (
+        "a.latitude IS NOT NULL AND a.longitude IS NOT NULL"
+        f" AND point(a.longitude, a.latitude) <@ box(point(${n - 3}, ${n - 2}), point(${n - 1}, ${n}))"
+    )
+
+
+def _radius_condition(args, latitude, longitude, radius_km):
+    # Box around the circle for the index, then the exact distance.
+    lat_delta = radius_km / KM_PER_DEGREE_LATITUDE
+    lon_delta = radius_km / (KM_PER_DEGREE_LATITUDE * max(math.cos(math.radians(latitude)), 0.01))
+    condition = _bbox_condition(
+        args,
+        longitude - lon_delta,
+        latitude - lat_delta,
+        longitude + lon_delta,
+        latitude + lat_delta,
+    )
+    args.extend([latitude, longitude, radius_km])
+    n = len(args)
+    return (
+        f"{condition} AND haversine_km(${n - 2}, ${n - 1}, a.latitude, a.longitude) <= ${n}"
+    )
+
+
+def cluster_cell_degrees(zoom):
+    # Web map tiles are 256px wide and cover 360 / 2^zoom degrees, so one
+    # cell is CLUSTER_CELL_PX screen pixels at this zoom level.
+    return 360 / (256 * 2 ** zoom) * CLUSTER_CELL_PX
+
+
+async def _map_query(con, area, args, zoom, limit, fields, filters, distance=None):
+    conditions = [area]
+    _listing_filters(conditions, args, **filters)
+    where = " AND ".join(conditions)
+    if zoom is not None:
+        args.append(cluster_cell_degrees(zoom))
+        rows = await con.fetch(
+            f"""
+            SELECT
+                count(*) AS count,
+                avg(a.latitude) AS latitude,
+                avg(a.longitude) AS longitude,
+                min(l.price) AS min_price,
+                max(l.price) AS max_price,
+                CASE WHEN count(*) = 1 THEN min(l.id) END AS listing_id
+            FROM addresses a
+            JOIN listings l ON l.address_id = a.id
+            WHERE {where}
+            GROUP BY floor(a.longitude / ${len(args)}), floor(a.latitude / ${len(args)})
+            ORDER BY count(*) DESC
+            LIMIT {MAX_MAP_RESULTS + 1};
+            """,
+            *args,
+        )
+        # truncated tells the client to zoom in rather than trust the counts.
+        return {
+            "clusters": _all(rows[:MAX_MAP_RESULTS]),
+            "truncated": len(rows) > MAX_MAP_RESULTS,
+        }
+    limit = min(limit, MAX_MAP_RESULTS)
+    args.append(limit + 1)
+    order = "distance_km, l.id" if distance else "l.created_at DESC, l.id DESC"
+    rows = await con.fetch(
+        f"""
+        SELECT {_listing_columns(fields)}, a.latitude, a.longitude
+            {f", {distance} AS distance_km" if distance else ""}
+        FROM addresses a
+        JOIN listings l ON l.address_id = a.id
+        WHERE {where}
+        ORDER BY {order}
+        LIMIT ${len(args)};
+        """,
+        *args,
+    )
+    return {"items": _all(rows[:limit]), "truncated": len(rows) > limit}
+
+
+@named_query("get_listings_in_bbox")
+async def get_listings_in_bbox(
+    con, west, south, east, north, zoom=None, limit=MAX_MAP_RESULTS, fields=None, **filters
+):
+    if west > east or south > north:
+        raise ValueError("Bounding box must have west <= east and south <= north")
+    args = []
+    area = _bbox_condition(args, west, south, east, north)
+    return await _map_query(con, area, args, zoom, limit, fields, filters)
+
+
+@named_query("get_listings_nearby")
+async def get_listings_nearby(
+    con, latitude, longitude, radius_km, zoom=None, limit=MAX_MAP_RESULTS, fields=None, **filters
+):
+    args = []
+    area = _radius_condition(args, latitude, longitude, radius_km)
+    distance = f"haversine_km(${len(args) - 2}, ${len(args) - 1}, a.latitude, a.longitude)"
+    return await _map_query(con, area, args, zoom, limit, fields, filters, distance)
+
+
+# ---------- STATS ----------
+# Reads only the materialized views from migrations/0007. city '' and
+# category_id 0 are the rollups over all cities / categories.
+
+async def _market_stats(con, condition, *args):
+    rows = await con.fetch(
+        f"""
+        SELECT {_columns(MarketStats)}
+        FROM (SELECT * FROM market_price_stats WHERE {condition}) p
+        FULL JOIN (SELECT * FROM market_sales_stats WHERE {condition}) s
+            USING (city, category_id)
+        ORDER BY city, category_id;
+        """,
+        *args,
+    )
+    return [
+        {**row, "city": row["city"] or None, "category_id": row["category_id"] or None}
+        for row in _all(rows)
+    ]
+
+
+@named_query("get_market_stats")
+async def get_market_stats(con, city=None, category_id=None):
+    rows = await _market_stats(
+        con, "city = lower($1) AND category_id = $2", city or "", category_id or 0
+    )
+    return rows[0] if rows else None
+
+
+@named_query("get_market_stats_by_city")
+async def get_market_stats_by_city(con, category_id=None):
+    return await _market_stats(con, "city <> '' AND category_id = $1", category_id or 0)
+
+
+@named_query("get_market_stats_by_category")
+async def get_market_stats_by_category(con, city=None):
+    return await _market_stats(con, "city = lower($1) AND category_id <> 0", city or "")
+
+
+@named_query("get_stats_refresh_state")
+async def get_stats_refresh_state(con):
+    rows = await con.fetch(
+        f"SELECT {_columns(StatsRefreshState)} FROM stats_refresh_state ORDER BY view_name;"
+    )
+    return _all(rows)
+
+
+# ---------- JOBS ----------
+# The queue behind worker.py (jobs.py, migrations/0014). enqueue_job takes
+# the caller's connection, so a job enqueued inside a transaction only
+# exists if that transaction commits.
+
+JOB_MAX_ATTEMPTS = 5
+
+
+@named_query("enqueue_job")
+async def enqueue_job(
+    con, task, payload=None, queue="default", run_at=None, delay=None,
+    max_attempts=JOB_MAX_ATTEMPTS, dedupe_key=None,
+):
+    # run_at or delay (seconds) schedules the job for later. Returns the
+    # job id, or None if a job with the same dedupe_key is already queued
+    # or running.
+    return await con.fetchval(
+        """
+        INSERT INTO jobs (task, payload, queue, run_at, max_attempts, dedupe_key)
+        VALUES (
+            $1, $2, $3,
+            COALESCE($4, NOW()) + make_interval(secs => COALESCE($5::float8, 0)),
+            $6, $7
+        )
+        ON CONFLICT (dedupe_key) WHERE status IN ('queued', 'running') DO NOTHING
+        RETURNING id;
+        """,
+        task, payload or {}, queue, run_at, delay, max_attempts, dedupe_key,
+    )
+
+
+@named_query("claim_jobs")
+async def claim_jobs(con, worker_id, queues=None, limit=1):
+    # SKIP LOCKED: jobs another worker is claiming right now are passed
+    # over rather than waited for.
+    rows = await con.fetch(
+        """
+        UPDATE jobs j
+        SET status = 'running', attempts = j.attempts + 1, started_at = NOW(),
+            locked_by = $2
+        FROM (
+            SELECT id
+            FROM jobs
+            WHERE status = 'queued'
+              AND run_at <= NOW()
+              AND ($1::text[] IS NULL OR queue = ANY($1::text[]))
+            ORDER BY run_at, id
+            LIMIT $3
+            FOR UPDATE SKIP LOCKED
+        ) claimed
+        WHERE j.id = claimed.id
+        RETURNING j.id, j.queue, j.task, j.payload, j.attempts, j.max_attempts;
+        """,
+        queues, worker_id, limit,
+    )
+    return _all(rows)
+
+
+@named_query("complete_job")
+async def complete_job(con, job_id):
+    await con.execute(
+        """
+        UPDATE jobs
+        SET status = 'done', finished_at = NOW(), locked_by = NULL
+        WHERE id = $1 AND status = 'running';
+        """,
+        job_id,
+    )
+
+
+@named_query("fail_job")
+async def fail_job(con, job_id, error, retry_in=None):
+    # Back in the queue retry_in seconds from now, or failed for good when
+    # retry_in is None.
+    await con.execute(
+        """
+        UPDATE jobs
+        SET status = CASE WHEN $3::float8 IS NULL THEN 'failed' ELSE 'queued' END,
+            run_at = CASE WHEN $3::float8 IS NULL THEN run_at
+                          ELSE NOW() + make_interval(secs => $3::float8) END,
+            finished_at = CASE WHEN $3::float8 IS NULL THEN NOW() END,
+            last_error = $2,
+            locked_by = NULL
+        WHERE id = $1 AND status = 'running';
+        """,
+        job_id, error, retry_in,
+    )
+
+
+@named_query("requeue_stale_jobs")
+async def requeue_stale_jobs(con, timeout):
+    # Jobs left running for longer than any run may take belong to a worker
+    # that died; they go back in the queue, the lost run counted as an
+    # attempt.
+    rows = await con.fetch(
+        """
+        UPDATE jobs
+        SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END,
+            finished_at = CASE WHEN attempts >= max_attempts THEN NOW() END,
+            last_error = 'Worker stopped during the run',
+            locked_by = NULL
+        WHERE status = 'running' AND started_at < NOW() - make_interval(secs => $1)
+        RETURNING id;
+        """,
+        timeout,
+    )
+    return [row["id"] for row in rows]
+
+
+@named_query("register_recurring_job")
+async def register_recurring_job(con, name, task, every, queue="default", payload=None):
+    # every in seconds. Re-registering keeps the next run where it is.
+    await con.execute(
+        """
+        INSERT INTO recurring_jobs (name, task, every, queue, payload)
+        VALUES ($1, $2, make_interval(secs => $3), $4, $5)
+        ON CONFLICT (name) DO UPDATE
+        SET task = EXCLUDED.task, every = EXCLUDED.every,
+            queue = EXCLUDED.queue, payload = EXCLUDED.payload;
+        """,
+        name, task, every, queue, payload or {},
+    )
+
+
+@named_query("remove_recurring_jobs")
+async def remove_recurring_jobs(con, keep):
+    # Drops recurring jobs no longer scheduled, e.g. the stats refresh once
+    # STATS_JOB_INTERVAL is 0. Runs already enqueued still go ahead.
+    rows = await con.fetch(
+        "DELETE FROM recurring_jobs WHERE name <> ALL($1::text[]) RETURNING name;", list(keep)
+    )
+    return [row["name"] for row in rows]
+
+
+@named_query("enqueue_due_recurring_jobs")
+async def enqueue_due_recurring_jobs(con):
+    # Runs missed while no worker was up collapse into one.
+    rows = await con.fetch(
+        """
+        WITH due AS (
+            UPDATE recurring_jobs r
+            SET next_run_at = GREATEST(r.next_run_at + r.every, NOW() + r.every)
+            WHERE r.name IN (
+                SELECT name FROM recurring_jobs
+                WHERE next_run_at <= NOW()
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING r.name, r.queue, r.task, r.payload
+        )
+        INSERT INTO jobs (queue, task, payload, dedupe_key)
+        SELECT queue, task, payload, 'recurring:' || name FROM due
+        ON CONFLICT (dedupe_key) WHERE status IN ('queued', 'running') DO NOTHING
+        RETURNING id;
+        """
+    )
+    return [row["id"] for row in rows]
+
+
+@named_query("prune_jobs")
+async def prune_jobs(con, older_than):
+    # Finished jobs older than older_than seconds.
+    status = await con.execute(
+        """
+        DELETE FROM jobs
+        WHERE status IN ('done', 'failed')
+          AND finished_at < NOW() - make_interval(secs => $1);
+        """,
+        older_than,
+    )
+    return _row_count(status)
+
+
+@named_query("get_job_queue_stats")
+async def get_job_queue_stats(con):
+    rows = await con.fetch(
+        f"SELECT {_columns(JobQueueStats)} FROM job_queue_stats ORDER BY queue, task;"
+    )
+    return _all(rows)
+
+
+# ---------- VERSIONS ----------
+# Cheap lookups behind ETag / Last-Modified (http_cache.py): one index
+# probe each, without reading the rows a route would return. The
+# collection versions are kept by the triggers in migrations/0009.
+
+@named_query("get_listing_version")
+async def get_listing_version(con, listing_id):
+    row = await con.fetchrow("SELECT updated_at FROM listings WHERE id = $1;", listing_id)
+    return _one(row)
+
+
+async def _collection_version(con, collection, owner_id):
+    updated_at = await con.fetchval(
+        "SELECT updated_at FROM collection_versions WHERE collection = $1 AND owner_id = $2;",
+        collection, owner_id,
+    )
+    return {"updated_at": updated_at}
+
+
+@named_query("get_listing_images_version")
+async def get_listing_images_version(con, listing_id):
+    return await _collection_version(con, "listing_images", listing_id)
+
+
+@named_query("get_categories_version")
+async def get_categories_version(con):
+    return await _collection_version(con, "categories", 0)
+
+
+@named_query("get_user_favorite_ids_version")
+async def get_user_favorite_ids_version(con, user_id):
+    return await _collection_version(con, "user_favorites", user_id)
+
+
+@named_query("get_user_favorites_version")
+async def get_user_favorites_version(con, user_id):
+    # The page shows the favorited listings, so it also changes whenever
+    # one of them does. The sum moves on every such update, even one that
+    # commits with an updated_at below the current max.
+    row = await con.fetchrow(
+        """
+        SELECT
+            GREATEST(v.updated_at, l.updated_at) AS updated_at,
+            l.checksum
+        FROM (
+            SELECT
+                max(l.updated_at) AS updated_at,
+                sum(extract(epoch FROM l.updated_at)) AS checksum
+            FROM favorites f
+            JOIN listings l ON l.id = f.listing_id
+            WHERE f.user_id = $1
+        ) l
+        LEFT JOIN collection_versions v
+            ON v.collection = 'user_favorites' AND v.owner_id = $1;
+        """,
+        user_id,
+    )
+    return _one(row)
+
+
+# ---------- LISTING EVENTS ----------
+
+@named_query("get_last_listing_event_id")
+async def get_last_listing_event_id(con, listing_id):
+    return await con.fetchval(
+        "SELECT COALESCE(max(id), 0) FROM listing_events WHERE listing_id = $1;",
+        listing_id,
+    )
+
+
+@named_query("get_listing_events")
+async def get_listing_events(con, listing_id, after_id, limit=500):
+    rows = await con.fetch(
+        """
+        SELECT id, listing_id, event_type, payload, created_at
+        FROM listing_events
+        WHERE listing_id = $1 AND id > $2
+        ORDER BY id
+        LIMIT $3;
+        """,
+        listing_id, after_id, limit,
+    )
+    return _all(rows)
+
+
+@named_query("prune_listing_events")
+async def prune_listing_events(con, older_than, batch_size=10000):
+    # Events older than older_than seconds, at most batch_size of them, so
+    # one run doesn't hold a huge delete open; callers loop until 0.
+    status = await con.execute(
+        """
+        DELETE FROM listing_events
+        WHERE id IN (
+            SELECT id FROM listing_events
+            WHERE created_at < NOW() - make_interval(secs => $1::float8)
+            LIMIT $2
+        );
+        """,
+        older_than, batch_size,
+    )
+    return _row_count(status)
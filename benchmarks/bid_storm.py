@@ -0,0 +1,106 @@
+"""Concurrent bid storm against one hot listing.
+
+    python -m benchmarks.bid_storm --bidders 200 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+import async_db
+from async_db import BidRejected, create_bid
+from benchmarks.report import summarize
+
+
+async def create_fixture(con):
+    role_id = await con.fetchval(
+        "INSERT INTO roles (name) VALUES ('bench') "
+        "ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name RETURNING id;"
+    )
+    category_id = await con.fetchval(
+        "INSERT INTO listing_categories (name) VALUES ('bench') "
+        "ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name RETURNING id;"
+    )
+    address_id = await con.fetchval(
+        "INSERT INTO addresses (street, postal_code, city, country) "
+        "VALUES ('Benchgatan 1', '00000', 'Bench', 'SE') RETURNING id;"
+    )
+    suffix = time.time_ns()
+    user_ids = [
+        await con.fetchval(
+            "INSERT INTO users (email, password_hash, first_name, last_name, role_id) "
+            "VALUES ($1, 'x', 'Bench', 'Bidder', $2) RETURNING id;",
+            f"bench-{suffix}-{n}@example.com", role_id,
+        )
+        for n in range(20)
+    ]
+    listing_id = await con.fetchval(
+        "INSERT INTO listings (title, description, price, living_area, rooms, "
+        "address_id, category_id, agent_id, status) "
+        "VALUES ('Bid storm', '', 1000000, 100, 4, $1, $2, $3, 'active') RETURNING id;",
+        address_id, category_id, user_ids[0],
+    )
+    return listing_id, user_ids
+
+
+async def bidder(listing_id, user_ids, state, deadline, latencies, outcomes):
+    while time.perf_counter() < deadline:
+        amount = state["highest"] + async_db.BID_MIN_INCREMENT + random.randint(0, 500)
+        started = time.perf_counter()
+        async with async_db.acquire() as con:
+            try:
+                bid = await create_bid(con, listing_id, random.choice(user_ids), amount)
+                state["highest"] = max(state["highest"], bid["amount"])
+                outcomes["accepted"] += 1
+            except BidRejected:
+                outcomes["rejected"] += 1
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def main(bidders, duration, pool_size):
+    await async_db.init_pool(min_size=pool_size, max_size=pool_size)
+    try:
+        async with async_db.acquire() as con:
+            listing_id, user_ids = await create_fixture(con)
+
+        state = {"highest": 0}
+        latencies, outcomes = [], {"accepted": 0, "rejected": 0}
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            bidder(listing_id, user_ids, state, deadline, latencies, outcomes)
+            for _ in range(bidders)
+        ))
+
+        async with async_db.acquire() as con:
+            listing = await con.fetchrow(
+                "SELECT highest_bid_amount, bid_count FROM listings WHERE id = $1;", listing_id
+            )
+            actual = await con.fetchrow(
+                "SELECT max(amount) AS highest, count(*) AS total FROM bids WHERE listing_id = $1;",
+                listing_id,
+            )
+    finally:
+        await async_db.close_pool()
+
+    return {
+        "listing_id": listing_id,
+        "bidders": bidders,
+        "pool_size": pool_size,
+        "duration_s": duration,
+        **summarize(latencies, duration),
+        **outcomes,
+        "consistent": (
+            listing["highest_bid_amount"] == actual["highest"]
+            and listing["bid_count"] == actual["total"] == outcomes["accepted"]
+        ),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--bidders", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--pool-size", type=int, default=async_db.POOL_MAX_SIZE)
+    args = parser.parse_args()
+    print(json.dumps(asyncio.run(main(args.bidders, args.duration, args.pool_size)), indent=2))
@@ -0,0 +1,70 @@
+"""Compare two benchmarks.load result files; exits 1 if a route's p95 regressed.
+
+    python -m benchmarks.compare baseline.json candidate.json --threshold 10
+"""
+import argparse
+import json
+import sys
+
+PERCENTILES = ("p50", "p95", "p99")
+
+
+def _change(before, after):
+    if not before or after is None:
+        return None
+    return round((after - before) / before * 100, 1)
+
+
+def compare(baseline, candidate, threshold):
+    routes = {}
+    regressions = []
+    for route in sorted(set(baseline["routes"]) | set(candidate["routes"])):
+        before = baseline["routes"].get(route)
+        after = candidate["routes"].get(route)
+        if not before or not after or not before["latency_ms"] or not after["latency_ms"]:
+            routes[route] = {"missing_in": "baseline" if not before else "candidate"}
+            continue
+        change = {
+            "throughput_rps": _change(before["throughput_rps"], after["throughput_rps"]),
+            **{
+                p: _change(before["latency_ms"][p], after["latency_ms"][p])
+                for p in PERCENTILES
+            },
+            "errors": after["errors"] - before["errors"],
+        }
+        routes[route] = change
+        if (change["p95"] or 0) > threshold or (after["errors"] and not before["errors"]):
+            regressions.append(route)
+    return {"threshold_pct": threshold, "routes": routes, "regressions": regressions}
+
+
+def _format(result):
+    lines = [f"{'route':40} {'rps %':>8} {'p50 %':>8} {'p95 %':>8} {'p99 %':>8} {'errors':>7}"]
+    for route, change in result["routes"].items():
+        if "missing_in" in change:
+            lines.append(f"{route:40} (missing in {change['missing_in']})")
+            continue
+        marker = "  <-- regression" if route in result["regressions"] else ""
+        cells = [change["throughput_rps"], *(change[p] for p in PERCENTILES)]
+        lines.append(
+            f"{route:40} "
+            + " ".join(f"{'-' if c is None else f'{c:+.1f}':>8}" for c in cells)
+            + f" {change['errors']:>+7}{marker}"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument("--threshold", type=float, default=10, help="allowed p95 slowdown in percent")
+    parser.add_argument("--json", action="store_true", help="print the comparison as JSON")
+    args = parser.parse_args()
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    result = compare(baseline, candidate, args.threshold)
+    print(json.dumps(result, indent=2) if args.json else _format(result))
+    sys.exit(1 if result["regressions"] else 0)
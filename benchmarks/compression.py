@@ -0,0 +1,126 @@
+"""Compression ratio and CPU cost per encoding and level.
+
+    python -m benchmarks.compression --iterations 50
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from async_db import MAX_PAGE_SIZE
+from db import EXPORT_BATCH_SIZE
+from http_cache import ENCODERS, available_encodings
+
+LEVELS = {"gzip": (1, 6, 9), "br": (1, 4, 6), "zstd": (1, 3, 9)}
+
+
+async def fetch_payloads(client, limit, export_bytes):
+    payloads = {}
+    for name, path, params in (
+        ("page", "/listings", {"limit": limit}),
+        ("page_columns", "/listings", {"limit": limit, "format": "columns"}),
+        ("categories", "/categories", {}),
+        ("agencies", "/agencies", {}),
+        ("market_cities", "/stats/market/cities", {}),
+    ):
+        response = await client.get(path, params=params)
+        response.raise_for_status()
+        payloads[name] = [response.content]
+    items = json.loads(payloads["page"][0])["items"]
+    if not items:
+        raise SystemExit("No listings to benchmark against; run benchmarks.seed first")
+    response = await client.get(f"/listings/{items[0]['id']}/detail")
+    response.raise_for_status()
+    payloads["detail"] = [response.content]
+
+    # ASGITransport hands back the body in one piece, so cut it into the
+    # chunks the endpoint yields: EXPORT_BATCH_SIZE lines each.
+    response = await client.get("/listings/export")
+    response.raise_for_status()
+    lines = response.content[:export_bytes].splitlines(keepends=True)[:-1]
+    chunks = [
+        b"".join(lines[start:start + EXPORT_BATCH_SIZE])
+        for start in range(0, len(lines), EXPORT_BATCH_SIZE)
+    ]
+    payloads["export"] = chunks
+    return payloads
+
+
+def compress(encoder, chunks):
+    # One chunk is a whole response; several are a stream.
+    size = 0
+    for chunk in chunks[:-1]:
+        size += len(encoder.compress(chunk)) + len(encoder.flush())
+    return size + len(encoder.compress(chunks[-1])) + len(encoder.finish())
+
+
+def measure(encoding, level, chunks, iterations):
+    original = sum(len(chunk) for chunk in chunks)
+    started = time.process_time()
+    for _ in range(iterations):
+        size = compress(ENCODERS[encoding](level), chunks)
+    cpu = time.process_time() - started
+    return {
+        "ratio_pct": round(size / original * 100, 1),
+        "cpu_us": round(cpu / iterations * 1e6, 1),
+        "mb_per_cpu_s": round(original * iterations / cpu / 1e6, 1),
+    }
+
+
+async def cpu_per_request(client, encoding, limit, requests):
+    headers = {"Accept-Encoding": encoding}
+    started = time.process_time()
+    for _ in range(requests):
+        response = await client.get("/listings", params={"limit": limit}, headers=headers)
+        response.raise_for_status()
+    cpu = time.process_time() - started
+    return {
+        "cpu_us_per_request": round(cpu / requests * 1e6, 1),
+        "bytes": int(response.headers.get("content-length", len(response.content))),
+    }
+
+
+async def run(limit, iterations, requests, export_bytes):
+    from app import app
+
+    encodings = available_encodings("zstd,br,gzip")
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://bench", headers={"Accept-Encoding": "identity"}
+        ) as client:
+            payloads = await fetch_payloads(client, limit, export_bytes)
+
+            per_request = {}
+            for encoding in ("identity", *encodings):
+                await cpu_per_request(client, encoding, limit, 10)
+                per_request[encoding] = await cpu_per_request(client, encoding, limit, requests)
+
+    compression = {}
+    for name, chunks in payloads.items():
+        compression[name] = {"bytes": sum(len(chunk) for chunk in chunks), "chunks": len(chunks)}
+        # The export is large enough that fewer rounds give a stable number.
+        rounds = max(1, iterations // 10) if name == "export" else iterations
+        for encoding in encodings:
+            for level in LEVELS[encoding]:
+                compression[name][f"{encoding}-{level}"] = measure(encoding, level, chunks, rounds)
+
+    return {
+        "page_size": limit,
+        "encodings": encodings,
+        "compression": compression,
+        "request": per_request,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--limit", type=int, default=MAX_PAGE_SIZE)
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--export-bytes", type=int, default=4_000_000)
+    args = parser.parse_args()
+    result = asyncio.run(run(args.limit, args.iterations, args.requests, args.export_bytes))
+    print(json.dumps(result, indent=2))
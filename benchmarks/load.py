@@ -0,0 +1,299 @@
+"""Mixed read/write load against the API, reported per route.
+
+    python -m benchmarks.load --mix mixed --concurrency 50 --duration 30
+    python -m benchmarks.load --url http://localhost:8000 --output run.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+import httpx
+
+import async_db
+from benchmarks.report import summarize
+from benchmarks.seed import CITIES, FEATURES, STREETS
+
+SAMPLE_SIZE = 5000
+
+
+# ---------- TARGETS ----------
+
+async def sample_targets():
+    # Real ids to request, drawn once up front so the workload itself
+    # doesn't add queries of its own.
+    async with async_db.acquire() as con:
+        async def ids(query):
+            return [row[0] for row in await con.fetch(query)]
+
+        targets = {
+            "listings": await ids(
+                f"SELECT id FROM listings WHERE status = 'active' ORDER BY random() LIMIT {SAMPLE_SIZE};"
+            ),
+            "users": await ids(
+                "SELECT u.id FROM users u JOIN roles r ON r.id = u.role_id "
+                f"WHERE r.name = 'buyer' ORDER BY random() LIMIT {SAMPLE_SIZE};"
+            ),
+            "agents": await ids(
+                "SELECT u.id FROM users u JOIN roles r ON r.id = u.role_id "
+                f"WHERE r.name = 'agent' ORDER BY random() LIMIT {SAMPLE_SIZE};"
+            ),
+            "agencies": await ids("SELECT id FROM real_estate_agencies;"),
+            "categories": await ids("SELECT id FROM listing_categories;"),
+            "addresses": await ids(f"SELECT id FROM addresses ORDER BY random() LIMIT {SAMPLE_SIZE};"),
+        }
+        # Starting points for new bids, advanced as bids are accepted.
+        targets["highest_bids"] = {
+            row["id"]: row["amount"]
+            for row in await con.fetch(
+                "SELECT id, COALESCE(highest_bid_amount, price) AS amount"
+                " FROM listings WHERE id = ANY($1::int[]);",
+                targets["listings"],
+            )
+        }
+    missing = [name for name in ("listings", "users", "agents") if not targets[name]]
+    if missing:
+        raise SystemExit(f"No {', '.join(missing)} to benchmark against; run benchmarks.seed first")
+    return targets
+
+
+# ---------- OPERATIONS ----------
+# Each returns (route, response). route is the template, so results group
+# by endpoint rather than by id.
+
+def _hot(rng, ids):
+    # Skewed towards the start of the list: some listings are far more
+    # popular than others.
+    return ids[min(len(ids) - 1, int(len(ids) * (rng.paretovariate(1.2) - 1) / 10))]
+
+
+async def op_listings(client, targets, rng):
+    params = {"limit": 20, "status": "active"}
+    if rng.random() < 0.5:
+        params["city"] = rng.choice(CITIES)[0]
+    if rng.random() < 0.3:
+        params["max_price"] = rng.choice((2_000_000, 3_000_000, 5_000_000))
+    if rng.random() < 0.3:
+        params["fields"] = "id,title,price,status"
+    return "GET /listings", await client.get("/listings", params=params)
+
+
+async def op_listing(client, targets, rng):
+    listing_id = _hot(rng, targets["listings"])
+    return "GET /listings/{id}", await client.get(f"/listings/{listing_id}")
+
+
+async def op_listing_detail(client, targets, rng):
+    listing_id = _hot(rng, targets["listings"])
+    return "GET /listings/{id}/detail", await client.get(f"/listings/{listing_id}/detail")
+
+
+async def op_search(client, targets, rng):
+    q = rng.choice((rng.choice(FEATURES), rng.choice(STREETS), rng.choice(CITIES)[0]))
+    return "GET /listings/search", await client.get("/listings/search", params={"q": q})
+
+
+async def op_map(client, targets, rng):
+    _, _, lat, lon, _, _ = rng.choice(CITIES)
+    span = rng.choice((0.02, 0.05, 0.2))
+    params = {
+        "west": lon - span * 1.8, "east": lon + span * 1.8,
+        "south": lat - span, "north": lat + span,
+        "zoom": rng.choice((10, 12, 14)),
+    }
+    return "GET /listings/map", await client.get("/listings/map", params=params)
+
+
+async def op_favorites(client, targets, rng):
+    user_id = rng.choice(targets["users"])
+    return "GET /users/{id}/favorites", await client.get(f"/users/{user_id}/favorites")
+
+
+async def op_categories(client, targets, rng):
+    return "GET /categories", await client.get("/categories")
+
+
+async def op_bids(client, targets, rng):
+    listing_id = _hot(rng, targets["listings"])
+    return "GET /listings/{id}/bids", await client.get(f"/listings/{listing_id}/bids")
+
+
+async def op_agent_reviews(client, targets, rng):
+    agent_id = rng.choice(targets["agents"])
+    return "GET /agents/{id}/reviews", await client.get(f"/agents/{agent_id}/reviews")
+
+
+async def op_top_agents(client, targets, rng):
+    agency_id = rng.choice(targets["agencies"])
+    return "GET /agencies/{id}/top-agents", await client.get(f"/agencies/{agency_id}/top-agents")
+
+
+async def op_stats(client, targets, rng):
+    params = {"city": rng.choice(CITIES)[0]} if rng.random() < 0.7 else {}
+    return "GET /stats/market", await client.get("/stats/market", params=params)
+
+
+async def op_create_bid(client, targets, rng):
+    # Concurrent workers bidding on the same hot listing lose races and
+    # get 409s, which is part of the workload.
+    listing_id = _hot(rng, targets["listings"])
+    highest = targets["highest_bids"]
+    body = {
+        "bidder_id": rng.choice(targets["users"]),
+        "amount": highest[listing_id] + async_db.BID_MIN_INCREMENT + rng.randrange(1000),
+    }
+    response = await client.post(f"/listings/{listing_id}/bids", json=body)
+    if response.status_code == 201:
+        highest[listing_id] = max(highest[listing_id], body["amount"])
+    return "POST /listings/{id}/bids", response
+
+
+async def op_toggle_favorite(client, targets, rng):
+    params = {"user_id": rng.choice(targets["users"]), "listing_id": _hot(rng, targets["listings"])}
+    if rng.random() < 0.5:
+        return "POST /favorites", await client.post("/favorites", params=params)
+    return "DELETE /favorites", await client.delete("/favorites", params=params)
+
+
+async def op_create_listing(client, targets, rng):
+    body = {
+        "title": f"Benchmark {rng.choice(FEATURES)}",
+        "description": "Created by benchmarks.load",
+        "price": rng.randrange(1_000_000, 8_000_000, 10_000),
+        "living_area": rng.randrange(30, 200),
+        "rooms": rng.randrange(1, 7),
+        "category_id": rng.choice(targets["categories"]),
+        "agent_id": rng.choice(targets["agents"]),
+        "address_id": rng.choice(targets["addresses"]),
+    }
+    return "POST /listings", await client.post("/listings", json=body)
+
+
+MIXES = {
+    "read": {
+        op_listings: 25, op_listing: 25, op_listing_detail: 15, op_search: 10, op_map: 5,
+        op_favorites: 8, op_categories: 4, op_bids: 4, op_agent_reviews: 2, op_top_agents: 1,
+        op_stats: 1,
+    },
+    "mixed": {
+        op_listings: 20, op_listing: 20, op_listing_detail: 12, op_search: 8, op_map: 4,
+        op_favorites: 6, op_categories: 3, op_bids: 4, op_agent_reviews: 2, op_top_agents: 1,
+        op_stats: 1, op_create_bid: 10, op_toggle_favorite: 7, op_create_listing: 2,
+    },
+    "write": {
+        op_listing: 20, op_listing_detail: 10, op_bids: 10, op_create_bid: 35,
+        op_toggle_favorite: 20, op_create_listing: 5,
+    },
+}
+
+
+# ---------- RUNNER ----------
+
+async def worker(client, targets, mix, rng, deadline, measuring_from, results):
+    operations, weights = list(mix), list(mix.values())
+    while time.perf_counter() < deadline:
+        operation = rng.choices(operations, weights)[0]
+        started = time.perf_counter()
+        try:
+            route, response = await operation(client, targets, rng)
+            outcome = response.status_code
+        except httpx.HTTPError as exc:
+            route, outcome = operation.__name__, type(exc).__name__
+        if started < measuring_from:
+            continue
+        results[route]["latencies"].append((time.perf_counter() - started) * 1000)
+        results[route]["statuses"][outcome] += 1
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(url, mix_name, concurrency, duration, warmup, seed):
+    mix = MIXES[mix_name]
+    results = defaultdict(lambda: {"latencies": [], "statuses": Counter()})
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async def drive(client):
+        targets = await sample_targets()
+        started = time.perf_counter()
+        measuring_from = started + warmup
+        deadline = measuring_from + duration
+        await asyncio.gather(*(
+            worker(client, targets, mix, random.Random(seed + n), deadline, measuring_from, results)
+            for n in range(concurrency)
+        ))
+
+    if url:
+        await async_db.init_pool(min_size=1, max_size=2)
+        try:
+            async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+                await drive(client)
+        finally:
+            await async_db.close_pool()
+    else:
+        from app import app
+
+        # ASGITransport doesn't run lifespan events, so start the pools,
+        # listener and refresher the way uvicorn would.
+        async with app.router.lifespan_context(app):
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://bench", limits=limits, timeout=30
+            ) as client:
+                await drive(client)
+
+    routes = {}
+    for route in sorted(results):
+        statuses = results[route]["statuses"]
+        routes[route] = {
+            **summarize(results[route]["latencies"], duration),
+            "statuses": {str(code): count for code, count in sorted(statuses.items(), key=str)},
+            "errors": sum(
+                count for code, count in statuses.items()
+                if not isinstance(code, int) or code >= 500
+            ),
+        }
+    all_latencies = [ms for result in results.values() for ms in result["latencies"]]
+    return {
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "commit": _git_commit(),
+        "target": url or "in-process",
+        "mix": mix_name,
+        "concurrency": concurrency,
+        "duration_s": duration,
+        "total": {
+            **summarize(all_latencies, duration),
+            "errors": sum(route["errors"] for route in routes.values()),
+        },
+        "routes": routes,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="base URL of a running server; omit to run in-process")
+    parser.add_argument("--mix", choices=sorted(MIXES), default="mixed")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30)
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the results to this file")
+    args = parser.parse_args()
+    result = asyncio.run(
+        run(args.url, args.mix, args.concurrency, args.duration, args.warmup, args.seed)
+    )
+    report = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    print(report)
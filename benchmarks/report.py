@@ -0,0 +1,24 @@
+"""Latency summaries shared by the benchmark scripts."""
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(latencies_ms, duration_s):
+    latencies_ms = sorted(latencies_ms)
+    if not latencies_ms:
+        return {"requests": 0, "throughput_rps": 0.0, "latency_ms": None}
+    return {
+        "requests": len(latencies_ms),
+        "throughput_rps": round(len(latencies_ms) / duration_s, 1),
+        "latency_ms": {
+            "p50": round(percentile(latencies_ms, 0.50), 2),
+            "p95": round(percentile(latencies_ms, 0.95), 2),
+            "p99": round(percentile(latencies_ms, 0.99), 2),
+            "max": round(latencies_ms[-1], 2),
+        },
+    }
@@ -0,0 +1,493 @@
+"""Seed a local database with synthetic data (needs a superuser).
+
+    python -m benchmarks.seed --scale 10
+"""
+import argparse
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from db import _copy_buffer
+from db_setup import get_connection
+from stats import STATS_VIEWS
+
+CHUNK_SIZE = 10_000
+
+# name, weight, latitude, longitude, postal code prefix, asking price per m2
+CITIES = (
+    ("Malmö", 0.34, 55.6050, 13.0038, "21", 38_000),
+    ("Lund", 0.15, 55.7047, 13.1910, "22", 42_000),
+    ("Helsingborg", 0.15, 56.0465, 12.6945, "25", 30_000),
+    ("Kristianstad", 0.06, 56.0294, 14.1567, "29", 20_000),
+    ("Trelleborg", 0.05, 55.3751, 13.1569, "23", 20_000),
+    ("Ängelholm", 0.05, 56.2428, 12.8622, "26", 27_000),
+    ("Landskrona", 0.04, 55.8708, 12.8302, "26", 18_000),
+    ("Ystad", 0.04, 55.4295, 13.8200, "27", 25_000),
+    ("Höganäs", 0.04, 56.1997, 12.5577, "26", 28_000),
+    ("Hässleholm", 0.04, 56.1589, 13.7668, "28", 15_000),
+    ("Eslöv", 0.04, 55.8392, 13.3034, "24", 18_000),
+)
+
+# name, weight, mean living area, sd, price factor
+CATEGORIES = (
+    ("lägenhet", 0.45, 68, 25, 1.00),
+    ("villa", 0.30, 145, 40, 0.85),
+    ("radhus", 0.15, 110, 25, 0.90),
+    ("fritidshus", 0.07, 75, 25, 0.70),
+    ("tomt", 0.03, 60, 10, 0.40),
+)
+
+STATUSES = (("active", 0.55), ("upcoming", 0.10), ("sold", 0.30), ("archived", 0.05))
+
+STREETS = (
+    "Storgatan", "Kungsgatan", "Drottninggatan", "Södra Förstadsgatan", "Västra Vallgatan",
+    "Östra Rönneholmsvägen", "Lundavägen", "Trädgårdsgatan", "Kyrkogatan", "Stationsgatan",
+    "Skolgatan", "Parkgatan", "Bangatan", "Hamngatan", "Ringvägen", "Björkvägen",
+    "Ekvägen", "Lönngatan", "Sjögatan", "Strandvägen", "Kvarngatan", "Klostergatan",
+)
+
+ADJECTIVES = (
+    "Ljus", "Charmig", "Rymlig", "Nyrenoverad", "Välplanerad", "Centralt belägen",
+    "Modern", "Sekelskifts", "Barnvänlig", "Lugnt belägen",
+)
+
+FEATURES = (
+    "balkong", "sjöutsikt", "trädgård", "garage", "öppen spis", "havsutsikt",
+    "stor altan", "nyrenoverat kök", "två badrum", "hiss", "takterrass", "pool",
+)
+
+FIRST_NAMES = ("Anna", "Erik", "Maria", "Johan", "Sara", "Lars", "Emma", "Karl", "Elin", "Nils")
+LAST_NAMES = ("Andersson", "Johansson", "Karlsson", "Nilsson", "Eriksson", "Larsson", "Persson")
+
+
+def _weighted(choices):
+    return [c[0] for c in choices], [c[1] for c in choices]
+
+
+class Seeder:
+    def __init__(self, con, rng, now):
+        self.con = con
+        self.rng = rng
+        self.now = now
+        self.counts = {}
+
+    # ---------- HELPERS ----------
+
+    def next_ids(self, table):
+        with self.con.cursor() as cur:
+            cur.execute(f"SELECT COALESCE(max(id), 0) FROM {table};")
+            return cur.fetchone()[0] + 1
+
+    def copy(self, table, columns, rows):
+        if not rows:
+            return
+        with self.con.cursor() as cur:
+            cur.copy_expert(
+                f"COPY {table} ({', '.join(columns)}) FROM STDIN;", _copy_buffer(rows)
+            )
+        self.counts[table] = self.counts.get(table, 0) + len(rows)
+
+    def lookup(self, table, names):
+        ids = []
+        with self.con.cursor() as cur:
+            for name in names:
+                cur.execute(
+                    f"INSERT INTO {table} (name) VALUES (%s) "
+                    "ON CONFLICT (name) DO UPDATE SET name = EXCLUDED.name RETURNING id;",
+                    (name,),
+                )
+                ids.append(cur.fetchone()[0])
+        return ids
+
+    def past(self, max_days):
+        return self.now - timedelta(seconds=self.rng.uniform(0, max_days * 86400))
+
+    def zipf_index(self, n, skew=1.2):
+        # Popularity falls off like a power law: a few listings get most
+        # of the bids and favorites.
+        return min(n - 1, int(n * (self.rng.paretovariate(skew) - 1) / 10))
+
+    # ---------- TABLES ----------
+
+    def seed_users(self, count, role_id, agency_ids=None):
+        first_id = self.next_ids("users")
+        rows = []
+        for n in range(count):
+            user_id = first_id + n
+            rows.append((
+                user_id,
+                f"user{user_id}@seed.example",
+                "seed",
+                self.rng.choice(FIRST_NAMES),
+                self.rng.choice(LAST_NAMES),
+                f"07{self.rng.randrange(10**8):08d}",
+                role_id,
+                agency_ids[n % len(agency_ids)] if agency_ids else None,
+                self.past(730),
+            ))
+        self.copy(
+            "users",
+            ("id", "email", "password_hash", "first_name", "last_name", "phone",
+             "role_id", "agency_id", "created_at"),
+            rows,
+        )
+        return [row[0] for row in rows], {row[0]: row[7] for row in rows}
+
+    def seed_agencies(self, count):
+        first_id = self.next_ids("real_estate_agencies")
+        rows = []
+        for n in range(count):
+            agency_id = first_id + n
+            city = self.rng.choices(*_weighted(CITIES))[0]
+            rows.append((
+                agency_id,
+                f"{city} Mäkleri {agency_id}",
+                f"agency{agency_id}@seed.example",
+                f"https://agency{agency_id}.seed.example",
+                self.past(3650),
+            ))
+        self.copy(
+            "real_estate_agencies", ("id", "name", "email", "website", "created_at"), rows
+        )
+        return [row[0] for row in rows]
+
+    def seed_listings(self, count, category_ids, agent_agencies, buyer_ids, means):
+        agent_ids = list(agent_agencies)
+        city_names, city_weights = _weighted(CITIES)
+        cities = {c[0]: c for c in CITIES}
+        category_names, category_weights = _weighted(CATEGORIES)
+        categories = {c[0]: (category_id, *c) for category_id, c in zip(category_ids, CATEGORIES)}
+        status_names, status_weights = _weighted(STATUSES)
+
+        next_address = self.next_ids("addresses")
+        next_listing = self.next_ids("listings")
+        next_image = self.next_ids("images")
+        next_bid = self.next_ids("bids")
+        next_viewing = self.next_ids("viewings")
+        # (agent_id, start_time) already taken: viewings of an agent may not
+        # overlap (migrations/0012), and every viewing starts on the hour and
+        # lasts at most one. The agents are new to this run.
+        booked = set()
+
+        for start in range(0, count, CHUNK_SIZE):
+            addresses, listings, images, bids, viewings, events = [], [], [], [], [], []
+            for _ in range(min(CHUNK_SIZE, count - start)):
+                city = cities[self.rng.choices(city_names, city_weights)[0]]
+                name, _, lat, lon, postal_prefix, price_per_sqm = city
+                # Within ~5 km of the centre, denser towards it.
+                distance = abs(self.rng.gauss(0, 0.025))
+                angle = self.rng.uniform(0, 2 * math.pi)
+                address_id = next_address
+                next_address += 1
+                addresses.append((
+                    address_id,
+                    f"{self.rng.choice(STREETS)} {self.rng.randint(1, 120)}",
+                    f"{postal_prefix}{self.rng.randint(100, 999)}",
+                    name,
+                    "SE",
+                    lat + distance * math.sin(angle),
+                    lon + distance * math.cos(angle) * 1.8,
+                ))
+
+                category_id, category, _, area_mean, area_sd, price_factor = categories[
+                    self.rng.choices(category_names, category_weights)[0]
+                ]
+                living_area = max(15, int(self.rng.gauss(area_mean, area_sd)))
+                rooms = max(1, round(living_area / 28 + self.rng.uniform(-1, 1)))
+                price = living_area * price_per_sqm * price_factor * self.rng.lognormvariate(0, 0.25)
+                price = max(100_000, int(round(price, -4)))
+                status = self.rng.choices(status_names, status_weights)[0]
+                created_at = self.past(730)
+                agent_id = self.rng.choice(agent_ids)
+                feature = self.rng.choice(FEATURES)
+                listing_id = next_listing
+                next_listing += 1
+
+                for position in range(int(self.rng.triangular(0, means["images"] * 2, means["images"]))):
+                    images.append((
+                        next_image,
+                        listing_id,
+                        f"https://img.seed.example/{listing_id}/{position}.jpg",
+                        None,
+                        position,
+                        created_at,
+                    ))
+                    next_image += 1
+
+                # Bid counts are heavy-tailed: most listings get a few,
+                # a handful get dozens.
+                highest = sold_at = None
+                if status in ("active", "sold") and buyer_ids:
+                    bid_count = int(self.rng.expovariate(1 / means["bids"])) if means["bids"] else 0
+                    amount = int(price * self.rng.uniform(0.85, 0.95))
+                    bid_at = created_at
+                    for n in range(bid_count):
+                        amount += self.rng.choice((5_000, 10_000, 25_000, 50_000))
+                        bid_at = min(self.now, bid_at + timedelta(hours=self.rng.expovariate(1 / 12)))
+                        highest = (next_bid, amount, n + 1)
+                        bids.append([
+                            next_bid, listing_id, self.rng.choice(buyer_ids), amount,
+                            False, False, bid_at,
+                        ])
+                        next_bid += 1
+                    if status == "sold" and highest:
+                        for bid in bids[-bid_count:]:
+                            bid[4] = bid[0] == highest[0]
+                            bid[5] = bid[0] != highest[0]
+                        sold_at = bid_at + timedelta(hours=self.rng.uniform(1, 72))
+                        events.append((
+                            listing_id,
+                            "status_changed",
+                            json.dumps({"listing_id": listing_id, "status": "sold",
+                                        "previous_status": "active"}),
+                            sold_at,
+                        ))
+
+                if status in ("active", "upcoming"):
+                    for _ in range(round(self.rng.uniform(0, 2 * means["viewings"]))):
+                        start_time = (self.now + timedelta(days=self.rng.randint(1, 28))).replace(
+                            hour=self.rng.randint(9, 19), minute=0, second=0, microsecond=0
+                        )
+                        if (agent_id, start_time) in booked:
+                            continue
+                        booked.add((agent_id, start_time))
+                        viewings.append((
+                            next_viewing, listing_id, agent_id, start_time,
+                            start_time + timedelta(minutes=self.rng.choice((30, 45, 60))),
+                        ))
+                        next_viewing += 1
+
+                listings.append((
+                    listing_id,
+                    f"{self.rng.choice(ADJECTIVES)} {category} med {feature}",
+                    ". ".join(
+                        f"{self.rng.choice(ADJECTIVES)} {category} med {f}"
+                        for f in self.rng.sample(FEATURES, 3)
+                    ) + f". {living_area} m², {rooms} rum i {name}.",
+                    price,
+                    living_area,
+                    rooms,
+                    address_id,
+                    category_id,
+                    agent_id,
+                    agent_agencies[agent_id],
+                    status,
+                    created_at,
+                    created_at,
+                    highest[0] if highest else None,
+                    highest[1] if highest else None,
+                    highest[2] if highest else 0,
+                    sold_at,
+                ))
+
+            self.copy(
+                "addresses",
+                ("id", "street", "postal_code", "city", "country", "latitude", "longitude"),
+                addresses,
+            )
+            self.copy(
+                "listings",
+                ("id", "title", "description", "price", "living_area", "rooms", "address_id",
+                 "category_id", "agent_id", "agency_id", "status", "created_at", "updated_at",
+                 "highest_bid_id", "highest_bid_amount", "bid_count", "sold_at"),
+                listings,
+            )
+            self.copy(
+                "images",
+                ("id", "listing_id", "image_url", "description", "position", "created_at"),
+                images,
+            )
+            self.copy(
+                "bids",
+                ("id", "listing_id", "bidder_id", "amount", "is_accepted", "is_rejected",
+                 "created_at"),
+                bids,
+            )
+            self.copy(
+                "viewings", ("id", "listing_id", "agent_id", "start_time", "end_time"), viewings
+            )
+            self.copy(
+                "listing_events", ("listing_id", "event_type", "payload", "created_at"), events
+            )
+            self.con.commit()
+        return range(next_listing - count, next_listing)
+
+    def seed_favorites(self, buyer_ids, listing_ids, mean):
+        rows = []
+        for user_id in buyer_ids:
+            picks = {
+                listing_ids[self.zipf_index(len(listing_ids))]
+                for _ in range(int(self.rng.expovariate(1 / mean)) if mean else 0)
+            }
+            rows.extend((user_id, listing_id, self.past(180)) for listing_id in picks)
+            if len(rows) >= CHUNK_SIZE * 5:
+                self.copy("favorites", ("user_id", "listing_id", "created_at"), rows)
+                rows = []
+        self.copy("favorites", ("user_id", "listing_id", "created_at"), rows)
+
+    def seed_reviews(self, agent_ids, buyer_ids, mean):
+        first_id = self.next_ids("agent_reviews")
+        rows = []
+        for agent_id in agent_ids:
+            count = min(len(buyer_ids), int(self.rng.expovariate(1 / mean)) if mean else 0)
+            for reviewer_id in self.rng.sample(buyer_ids, count):
+                rows.append((
+                    first_id + len(rows),
+                    agent_id,
+                    reviewer_id,
+                    self.rng.choices((1, 2, 3, 4, 5), (3, 4, 10, 35, 48))[0],
+                    self.past(730),
+                ))
+        self.copy(
+            "agent_reviews", ("id", "agent_id", "reviewer_id", "rating", "created_at"), rows
+        )
+
+    # ---------- DERIVED DATA ----------
+
+    def rebuild_derived(self, listing_ids):
+        # Everything the disabled triggers would have written.
+        with self.con.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO listing_search (listing_id, document)
+                SELECT l.id, listing_search_document(l.title, l.description, a.street, a.city)
+                FROM listings l
+                JOIN addresses a ON a.id = l.address_id
+                WHERE l.id BETWEEN %s AND %s
+                ON CONFLICT (listing_id) DO UPDATE SET document = EXCLUDED.document;
+                """,
+                (listing_ids.start, listing_ids.stop - 1),
+            )
+            cur.execute(
+                """
+                INSERT INTO agent_ratings AS r (
+                    agent_id, agency_id, rating_count, rating_sum,
+                    rating_1, rating_2, rating_3, rating_4, rating_5
+                )
+                SELECT
+                    u.id, u.agency_id, count(*), sum(ar.rating),
+                    count(*) FILTER (WHERE ar.rating = 1),
+                    count(*) FILTER (WHERE ar.rating = 2),
+                    count(*) FILTER (WHERE ar.rating = 3),
+                    count(*) FILTER (WHERE ar.rating = 4),
+                    count(*) FILTER (WHERE ar.rating = 5)
+                FROM agent_reviews ar
+                JOIN users u ON u.id = ar.agent_id
+                GROUP BY u.id
+                ON CONFLICT (agent_id) DO UPDATE SET
+                    agency_id = EXCLUDED.agency_id,
+                    rating_count = EXCLUDED.rating_count,
+                    rating_sum = EXCLUDED.rating_sum,
+                    rating_1 = EXCLUDED.rating_1,
+                    rating_2 = EXCLUDED.rating_2,
+                    rating_3 = EXCLUDED.rating_3,
+                    rating_4 = EXCLUDED.rating_4,
+                    rating_5 = EXCLUDED.rating_5;
+                """
+            )
+            cur.execute(
+                """
+                INSERT INTO listing_favorite_counts (listing_id, favorite_count)
+                SELECT listing_id, count(*)
+                FROM favorites
+                WHERE listing_id BETWEEN %s AND %s
+                GROUP BY listing_id
+                ON CONFLICT (listing_id) DO UPDATE SET favorite_count = EXCLUDED.favorite_count;
+                """,
+                (listing_ids.start, listing_ids.stop - 1),
+            )
+            cur.execute(
+                """
+                SELECT
+                    touch_collection('listing_images', ARRAY(
+                        SELECT listing_id FROM images WHERE listing_id BETWEEN %(start)s AND %(stop)s
+                    )),
+                    touch_collection('user_favorites', ARRAY(
+                        SELECT user_id FROM favorites WHERE listing_id BETWEEN %(start)s AND %(stop)s
+                    )),
+                    touch_collection('categories', ARRAY[0]);
+                """,
+                {"start": listing_ids.start, "stop": listing_ids.stop - 1},
+            )
+            for table in ("users", "real_estate_agencies", "addresses", "listings",
+                          "images", "bids", "viewings", "agent_reviews"):
+                cur.execute(
+                    f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                    f"(SELECT COALESCE(max(id), 1) FROM {table}));"
+                )
+            self.con.commit()
+            for view_name in STATS_VIEWS:
+                cur.execute(f"REFRESH MATERIALIZED VIEW {view_name};")
+            cur.execute(
+                "UPDATE stats_refresh_state SET dirty = FALSE, refreshed_at = NOW() "
+                "WHERE view_name = ANY(%s);",
+                (list(STATS_VIEWS),),
+            )
+            cur.execute("ANALYZE;")
+            self.con.commit()
+
+
+def main(args):
+    scale = args.scale
+    counts = {
+        "buyers": int(args.users * scale),
+        "agencies": max(1, int(args.agencies * scale)),
+        "listings": int(args.listings * scale),
+    }
+    means = {
+        "images": args.images_per_listing,
+        "bids": args.bids_per_listing,
+        "favorites": args.favorites_per_user,
+        "viewings": args.viewings_per_listing,
+        "reviews": args.reviews_per_agent,
+    }
+    started = time.perf_counter()
+    con = get_connection()
+    try:
+        with con.cursor() as cur:
+            cur.execute("SET session_replication_role = replica;")
+        seeder = Seeder(con, random.Random(args.seed), datetime.now(timezone.utc))
+        agent_role, buyer_role = seeder.lookup("roles", ("agent", "buyer"))
+        category_ids = seeder.lookup("listing_categories", [c[0] for c in CATEGORIES])
+        agency_ids = seeder.seed_agencies(counts["agencies"])
+        agent_ids, agent_agencies = seeder.seed_users(
+            counts["agencies"] * args.agents_per_agency, agent_role, agency_ids
+        )
+        buyer_ids, _ = seeder.seed_users(counts["buyers"], buyer_role)
+        con.commit()
+        listing_ids = seeder.seed_listings(
+            counts["listings"], category_ids, agent_agencies, buyer_ids, means
+        )
+        seeder.seed_favorites(buyer_ids, listing_ids, means["favorites"])
+        seeder.seed_reviews(agent_ids, buyer_ids, means["reviews"])
+        con.commit()
+        with con.cursor() as cur:
+            cur.execute("SET session_replication_role = origin;")
+        seeder.rebuild_derived(listing_ids)
+    finally:
+        con.close()
+    return {
+        "seed": args.seed,
+        "scale": scale,
+        "rows": seeder.counts,
+        "total_rows": sum(seeder.counts.values()),
+        "duration_s": round(time.perf_counter() - started, 1),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scale", type=float, default=1, help="multiplies users, agencies and listings")
+    parser.add_argument("--users", type=int, default=20_000)
+    parser.add_argument("--agencies", type=int, default=40)
+    parser.add_argument("--agents-per-agency", type=int, default=10)
+    parser.add_argument("--listings", type=int, default=100_000)
+    parser.add_argument("--images-per-listing", type=float, default=8)
+    parser.add_argument("--bids-per-listing", type=float, default=4)
+    parser.add_argument("--favorites-per-user", type=float, default=5)
+    parser.add_argument("--viewings-per-listing", type=float, default=1)
+    parser.add_argument("--reviews-per-agent", type=float, default=15)
+    parser.add_argument("--seed", type=int, default=1)
+    print(json.dumps(main(parser.parse_args()), indent=2))
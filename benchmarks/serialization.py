@@ -0,0 +1,129 @@
+"""CPU cost of rendering listing pages as objects versus format=columns.
+
+    python -m benchmarks.serialization --pages 20 --iterations 200
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import TypeAdapter
+
+import async_db
+from async_db import MAX_PAGE_SIZE, get_listings
+from schemas import ListingSummary, Page
+from serialization import ColumnarResponse, columnar_page
+
+LISTING_PAGE = TypeAdapter(Page[ListingSummary])
+
+
+def render_objects_untyped(page):
+    return JSONResponse(jsonable_encoder(page)).body
+
+
+def render_objects(page):
+    # FastAPI validates against response_model, dumps it to JSON-able
+    # Python and then renders that with JSONResponse.
+    validated = LISTING_PAGE.validate_python(page)
+    return JSONResponse(LISTING_PAGE.dump_python(validated, mode="json", exclude_unset=True)).body
+
+
+def render_columns(page):
+    return ColumnarResponse(columnar_page(page, ListingSummary)).body
+
+
+async def fetch_pages(count, limit):
+    pages, cursor = [], None
+    async with async_db.acquire() as con:
+        for _ in range(count):
+            page = await get_listings(con, limit, cursor)
+            pages.append(page)
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+    return pages
+
+
+def cpu_per_call(render, pages, iterations):
+    started = time.process_time()
+    size = 0
+    for _ in range(iterations):
+        for page in pages:
+            size = len(render(page))
+    return round((time.process_time() - started) / (iterations * len(pages)) * 1e6, 1), size
+
+
+async def cpu_per_request(client, params, requests):
+    started = time.process_time()
+    for _ in range(requests):
+        response = await client.get("/listings", params=params)
+        response.raise_for_status()
+    return round((time.process_time() - started) / requests * 1e6, 1), len(response.content)
+
+
+def _saving(before, after):
+    return round((1 - after / before) * 100, 1)
+
+
+async def run(pages, limit, iterations, requests):
+    await async_db.init_pool(min_size=1, max_size=2)
+    try:
+        sample = await fetch_pages(pages, limit)
+    finally:
+        await async_db.close_pool()
+    if not sample or not sample[0]["items"]:
+        raise SystemExit("No listings to benchmark against; run benchmarks.seed first")
+
+    serialize = {}
+    for name, render in (
+        ("objects_untyped", render_objects_untyped),
+        ("objects", render_objects),
+        ("columns", render_columns),
+    ):
+        render(sample[0])
+        cpu_us, size = cpu_per_call(render, sample, iterations)
+        serialize[name] = {"cpu_us_per_page": cpu_us, "bytes_per_page": size}
+
+    from app import app
+
+    per_request = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for name, params in (
+                ("objects", {"limit": limit}),
+                ("columns", {"limit": limit, "format": "columns"}),
+            ):
+                await cpu_per_request(client, params, 10)
+                cpu_us, size = await cpu_per_request(client, params, requests)
+                per_request[name] = {"cpu_us_per_request": cpu_us, "bytes": size}
+
+    return {
+        "page_size": limit,
+        "pages": len(sample),
+        "serialize": serialize,
+        "request": per_request,
+        "columns_saving_pct": {
+            "serialize_vs_objects": _saving(
+                serialize["objects"]["cpu_us_per_page"], serialize["columns"]["cpu_us_per_page"]
+            ),
+            "request_vs_objects": _saving(
+                per_request["objects"]["cpu_us_per_request"],
+                per_request["columns"]["cpu_us_per_request"],
+            ),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--limit", type=int, default=MAX_PAGE_SIZE)
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--requests", type=int, default=300)
+    args = parser.parse_args()
+    result = asyncio.run(run(args.pages, args.limit, args.iterations, args.requests))
+    print(json.dumps(result, indent=2))
@@ -0,0 +1,300 @@
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict, defaultdict
+
+import asyncpg
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_MAX_SIZE = int(os.getenv("CACHE_MAX_SIZE", "10000"))
+CACHE_TTL = float(os.getenv("CACHE_TTL", "300"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+
+CHANNEL = "cache_invalidation"
+LISTENER_PING_INTERVAL = 10
+LISTENER_RECONNECT_DELAY = 2
+
+
+def _json_default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+# ---------- BACKENDS ----------
+
+class _Generations:
+    # Invalidation counters for the in-process backends. Like Redis's they
+    # expire with the entries' TTL and are capped at the same max_size, so
+    # keys that are invalidated but never cached again don't pile up.
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self._counters = OrderedDict()
+
+    def get(self, key):
+        entry = self._counters.get(key)
+        if entry is None:
+            return 0
+        generation, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._counters[key]
+            return 0
+        return generation
+
+    def bump(self, key, ttl):
+        self._counters[key] = (self.get(key) + 1, time.monotonic() + ttl)
+        self._counters.move_to_end(key)
+        while len(self._counters) > self.max_size:
+            self._counters.popitem(last=False)
+
+    def __len__(self):
+        return len(self._counters)
+
+    def clear(self):
+        self._counters.clear()
+
+
+class MemoryBackend:
+    # Per-process LRU. Values are stored as-is, so callers must not mutate
+    # what they get back.
+
+    def __init__(self, max_size=CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._generations = _Generations(max_size)
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key, value, ttl):
+        self._entries[key] = (value, time.monotonic() + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def generation(self, key):
+        return self._generations.get(key)
+
+    async def bump_generation(self, key, ttl):
+        self._generations.bump(key, ttl)
+
+    async def size(self):
+        return len(self._entries)
+
+    async def close(self):
+        self._entries.clear()
+        self._generations.clear()
+
+
+class LocalSharedBackend:
+    # Stand-in for Redis when developing without one: values make the same
+    # JSON round-trip they would over the wire.
+
+    def __init__(self, max_size=CACHE_MAX_SIZE):
+        self.max_size = max_size
+        self._store = OrderedDict()
+        self._generations = _Generations(max_size)
+
+    async def get(self, key):
+        entry = self._store.get(key)
+        if entry is None:
+            return None
+        raw, expires_at = entry
+        if expires_at < time.monotonic():
+            del self._store[key]
+            return None
+        self._store.move_to_end(key)
+        return json.loads(raw)
+
+    async def set(self, key, value, ttl):
+        self._store[key] = (json.dumps(value, default=_json_default), time.monotonic() + ttl)
+        self._store.move_to_end(key)
+        while len(self._store) > self.max_size:
+            self._store.popitem(last=False)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._store.pop(key, None)
+
+    async def generation(self, key):
+        return self._generations.get(key)
+
+    async def bump_generation(self, key, ttl):
+        self._generations.bump(key, ttl)
+
+    async def size(self):
+        return len(self._store)
+
+    async def close(self):
+        self._store.clear()
+        self._generations.clear()
+
+
+class RedisBackend:
+    def __init__(self, url=REDIS_URL):
+        # Only needed when CACHE_BACKEND=redis, so it isn't in requirements.txt.
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(url)
+
+    async def get(self, key):
+        raw = await self._redis.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    async def set(self, key, value, ttl):
+        await self._redis.set(key, json.dumps(value, default=_json_default), px=int(ttl * 1000))
+
+    async def delete(self, *keys):
+        if keys:
+            await self._redis.delete(*keys)
+
+    # Generations live next to the entries, so every API process sees the
+    # same counter. They only need to outlast a load, hence the expiry.
+    async def generation(self, key):
+        raw = await self._redis.get(f"generation:{key}")
+        return int(raw) if raw is not None else 0
+
+    async def bump_generation(self, key, ttl):
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.incr(f"generation:{key}")
+            pipe.pexpire(f"generation:{key}", int(ttl * 1000))
+            await pipe.execute()
+
+    async def size(self):
+        return await self._redis.dbsize()
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+# ---------- CACHE ----------
+
+class Cache:
+    def __init__(self, backend, ttl=CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = defaultdict(int)
+        self.misses = defaultdict(int)
+
+    async def get_or_load(self, namespace, key, loader, ttl=None):
+        cache_key = f"{namespace}:{key}"
+        value = await self.backend.get(cache_key)
+        if value is not None:
+            self.hits[namespace] += 1
+            return value
+        self.misses[namespace] += 1
+        # Bumped on every invalidation, in the backend so it holds across
+        # processes. A load that started before an invalidation must not
+        # write its (now stale) result back.
+        generation = await self.backend.generation(cache_key)
+        value = await loader()
+        if value is not None and generation == await self.backend.generation(cache_key):
+            await self.backend.set(cache_key, value, ttl or self.ttl)
+        return value
+
+    async def invalidate(self, namespace, key):
+        cache_key = f"{namespace}:{key}"
+        await self.backend.bump_generation(cache_key, self.ttl)
+        await self.backend.delete(cache_key)
+
+    async def stats(self):
+        namespaces = sorted(set(self.hits) | set(self.misses))
+        return {
+            "backend": type(self.backend).__name__,
+            "size": await self.backend.size(),
+            "hits": sum(self.hits.values()),
+            "misses": sum(self.misses.values()),
+            "namespaces": {
+                namespace: {"hits": self.hits[namespace], "misses": self.misses[namespace]}
+                for namespace in namespaces
+            },
+        }
+
+    async def close(self):
+        await self.backend.close()
+
+
+class CacheInvalidator:
+    # One LISTEN connection per process for the NOTIFYs sent by the
+    # triggers in migrations/0015, so writes that never pass through this
+    # process's async_db still evict what it cached. Entries cached while
+    # the connection was down are only bounded by their TTL.
+
+    def __init__(self, cache, connect):
+        self.cache = cache
+        self._connect = connect
+        self._task = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _listen(self):
+        while True:
+            con = None
+            try:
+                con = await self._connect()
+                invalidated = asyncio.Queue()
+                await con.add_listener(
+                    CHANNEL, lambda con, pid, channel, payload: invalidated.put_nowait(payload)
+                )
+                while True:
+                    try:
+                        payload = await asyncio.wait_for(
+                            invalidated.get(), LISTENER_PING_INTERVAL
+                        )
+                    except asyncio.TimeoutError:
+                        await con.execute("SELECT 1;")
+                        continue
+                    namespace, key = payload.split(":", 1)
+                    try:
+                        await self.cache.invalidate(namespace, key)
+                    except Exception:
+                        # The backend is unreachable; the entry expires
+                        # with its TTL instead.
+                        pass
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                pass
+            finally:
+                if con is not None and not con.is_closed():
+                    await con.close()
+            await asyncio.sleep(LISTENER_RECONNECT_DELAY)
+
+
+def create_cache(backend=CACHE_BACKEND):
+    if backend == "redis":
+        return Cache(RedisBackend())
+    if backend == "local":
+        return Cache(LocalSharedBackend())
+    if backend == "memory":
+        return Cache(MemoryBackend())
+    raise ValueError(f"Unknown CACHE_BACKEND: {backend}")
+
+
+cache = create_cache()
@@ -1,273 +1,364 @@
+import io
 import os
+import threading
+import time
 
 import psycopg2
 from dotenv import load_dotenv
+from psycopg2 import extensions, pool
 from psycopg2.extras import RealDictCursor
 
+from metrics import named_query, observe_acquire, observe_query
+from schemas import ListingResponse
+
 load_dotenv()
 
 
 # ---------- CONNECTION ----------
 
-def get_connection():
-    return psycopg2.connect(
-        host=os.getenv("DB_HOST"),
-        port=os.getenv("DB_PORT"),
-        dbname=os.getenv("DB_NAME"),
-        user=os.getenv("DB_USER"),
-        password=os.getenv("DB_PASSWORD"),
-    )
-
-
-# ---------- USERS ----------
-
-def get_users(con):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("SELECT id, email, first_name, last_name, role_id FROM users;")
-        return cur.fetchall()
-
-
-def get_user_by_id(con, user_id):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("SELECT * FROM users WHERE id = %s;", (user_id,))
-        return cur.fetchone()
-
-
-def create_user(con, email, password_hash, first_name, last_name, role_id):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            """
-            INSERT INTO users (email, password_hash, first_name, last_name, role_id)
-            VALUES (%s, %s, %s, %s, %s)
-            RETURNING *;
-            """,
-            (email, password_hash, first_name, last_name, role_id),
-        )
-        return cur.fetchone()
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+_pool = None
+_pool_slots = None
+_pool_lock = threading.Lock()
+
+_instrumented_cursors = {}
+
+
+def _instrumented_cursor(cursor_class):
+    # A subclass of whichever cursor the caller asked for (RealDictCursor,
+    # plain, named) that times execute() and copy_expert() for metrics.py.
+    instrumented = _instrumented_cursors.get(cursor_class)
+    if instrumented is None:
+        class InstrumentedCursor(cursor_class):
+            def execute(self, query, vars=None):
+                started = time.perf_counter()
+                try:
+                    return super().execute(query, vars)
+                finally:
+                    observe_query(
+                        str(query), time.perf_counter() - started, max(self.rowcount, 0)
+                    )
+
+            def copy_expert(self, sql, file, size=8192):
+                started = time.perf_counter()
+                try:
+                    return super().copy_expert(sql, file, size)
+                finally:
+                    observe_query(sql, time.perf_counter() - started, max(self.rowcount, 0))
+
+        instrumented = _instrumented_cursors[cursor_class] = InstrumentedCursor
+    return instrumented
+
+
+class InstrumentedConnection(extensions.connection):
+    def cursor(self, *args, **kwargs):
+        cursor_class = kwargs.get("cursor_factory") or self.cursor_factory or extensions.cursor
+        kwargs["cursor_factory"] = _instrumented_cursor(cursor_class)
+        return super().cursor(*args, **kwargs)
+
+
+def init_pool(min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE):
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is None:
+            _pool = pool.ThreadedConnectionPool(
+                min_size,
+                max_size,
+                host=os.getenv("DB_HOST"),
+                port=os.getenv("DB_PORT"),
+                dbname=os.getenv("DB_NAME"),
+                user=os.getenv("DB_USER"),
+                password=os.getenv("DB_PASSWORD"),
+                connection_factory=InstrumentedConnection,
+            )
+            # ThreadedConnectionPool raises instead of waiting when it is
+            # exhausted, so callers queue on this semaphore first.
+            _pool_slots = threading.BoundedSemaphore(max_size)
+        return _pool
+
+
+def close_pool():
+    global _pool, _pool_slots
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+        _pool = None
+        _pool_slots = None
+
+
+def _is_healthy(con):
+    if con.closed:
+        return False
+    try:
+        with con.cursor() as cur:
+            cur.execute("SELECT 1;")
+        con.rollback()
+        return True
+    except psycopg2.Error:
+        return False
 
 
-def update_user(con, user_id, first_name, last_name):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
+def get_connection():
+    connection_pool = _pool or init_pool()
+    started = time.perf_counter()
+    if not _pool_slots.acquire(timeout=POOL_TIMEOUT):
+        raise pool.PoolError("Timed out waiting for a database connection")
+    try:
+        con = connection_pool.getconn()
+        if not _is_healthy(con):
+            connection_pool.putconn(con, close=True)
+            con = connection_pool.getconn()
+    except Exception:
+        _pool_slots.release()
+        raise
+    observe_acquire(time.perf_counter() - started, "sync")
+    return con
+
+
+def release_connection(con):
+    if _pool is None:
+        con.close()
+        return
+    broken = bool(con.closed)
+    if not broken and con.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+        try:
+            con.rollback()
+        except psycopg2.Error:
+            broken = True
+    _pool.putconn(con, close=broken)
+    _pool_slots.release()
+
+
+# ---------- EXPORT ----------
+# Only the export and bulk ingest, which stream through a psycopg2 server-side
+# cursor and COPY, use this blocking layer; every other query is in
+# async_db.py.
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "2000"))
+EXPORT_INCLUDES = ("address", "category", "image")
+
+
+def _columns(model, alias=None):
+    prefix = f"{alias}." if alias else ""
+    return ", ".join(f"{prefix}{name}" for name in model.model_fields)
+
+
+@named_query("iter_listings_export")
+def iter_listings_export(con, include=(), batch_size=EXPORT_BATCH_SIZE):
+    unknown = set(include) - set(EXPORT_INCLUDES)
+    if unknown:
+        raise ValueError(f"Unknown export includes: {', '.join(sorted(unknown))}")
+    columns, joins = [_columns(ListingResponse, "l")], []
+    if "address" in include:
+        columns.append("a.street, a.postal_code, a.city, a.country")
+        joins.append("LEFT JOIN addresses a ON a.id = l.address_id")
+    if "category" in include:
+        columns.append("c.name AS category_name")
+        joins.append("LEFT JOIN listing_categories c ON c.id = l.category_id")
+    if "image" in include:
+        columns.append("i.image_url")
+        joins.append(
             """
-            UPDATE users
-            SET first_name = %s, last_name = %s
-            WHERE id = %s
-            RETURNING *;
-            """,
-            (first_name, last_name, user_id),
-        )
-        return cur.fetchone()
-
-
-def delete_user(con, user_id):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            "DELETE FROM users WHERE id = %s RETURNING id;",
-            (user_id,),
-        )
-        return cur.fetchone()
-
-
-# ---------- LISTINGS ----------
-
-def get_listings(con):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("SELECT * FROM listings;")
-        return cur.fetchall()
-
-
-def get_listing_by_id(con, listing_id):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute("SELECT * FROM listings WHERE id = %s;", (listing_id,))
-        return cur.fetchone()
-
-
-def create_listing(
-    con,
-    title,
-    description,
-    price,
-    living_area,
-    rooms,
-    category_id,
-    agent_id,
-    status,
-    address_id,
-):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
+            LEFT JOIN LATERAL (
+                SELECT image_url FROM images
+                WHERE listing_id = l.id
+                ORDER BY position, id
+                LIMIT 1
+            ) i ON TRUE
             """
-            INSERT INTO listings
-            (title, description, price, living_area, rooms,
-            category_id, agent_id, status, address_id)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
-            RETURNING *;
-            """,
-            (
-                title,
-                description,
-                price,
-                living_area,
-                rooms,
-                category_id,
-                agent_id,
-                status,
-                address_id,
-            ),
         )
-        return cur.fetchone()
-
-
-def update_listing(con, listing_id, title, description, price):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
+    # A named cursor keeps the result set on the server; iterating it pulls
+    # itersize rows per round-trip, so memory stays flat however big the table is.
+    with con, con.cursor(name="listings_export", cursor_factory=RealDictCursor) as cur:
+        cur.itersize = batch_size
         cur.execute(
+            f"""
+            SELECT {', '.join(columns)}
+            FROM listings l
+            {' '.join(joins)}
+            ORDER BY l.id;
             """
-            UPDATE listings
-            SET title = %s, description = %s, price = %s
-            WHERE id = %s
-            RETURNING *;
-            """,
-            (title, description, price, listing_id),
         )
-        return cur.fetchone()
+        yield from cur
 
 
-def update_listing_status(con, listing_id, status):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            """
-            UPDATE listings
-            SET status = %s
-            WHERE id = %s
-            RETURNING *;
-            """,
-            (status, listing_id),
-        )
-        return cur.fetchone()
-
+# ---------- BULK INGEST ----------
 
-def delete_listing(con, listing_id):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            "DELETE FROM listings WHERE id = %s RETURNING id;",
-            (listing_id,),
-        )
-        return cur.fetchone()
+def _copy_value(value):
+    if value is None:
+        return "\\N"
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
 
 
-# ---------- BIDS ----------
+def _copy_buffer(rows):
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_value(value) for value in row) + "\n")
+    buffer.seek(0)
+    return buffer
+
+
+@named_query("bulk_create_listings")
+def bulk_create_listings(con, listings):
+    listing_rows, image_rows = [], []
+    for row_no, listing in enumerate(listings):
+        address = listing.get("address") or {}
+        listing_rows.append((
+            row_no,
+            listing.get("title"),
+            listing.get("description"),
+            listing.get("price"),
+            listing.get("living_area"),
+            listing.get("rooms"),
+            listing.get("category_id"),
+            listing.get("agent_id"),
+            listing.get("status", "active"),
+            address.get("street"),
+            address.get("postal_code"),
+            address.get("city"),
+            address.get("country"),
+        ))
+        for image in listing.get("images") or []:
+            image_rows.append((
+                row_no,
+                image.get("image_url"),
+                image.get("description"),
+                image.get("position"),
+            ))
 
-def get_bids_for_listing(con, listing_id):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            "SELECT * FROM bids WHERE listing_id = %s ORDER BY amount DESC;",
-            (listing_id,),
-        )
-        return cur.fetchall()
-
-
-def create_bid(con, listing_id, bidder_id, amount):
     with con, con.cursor(cursor_factory=RealDictCursor) as cur:
+        # Staging columns are loose (TEXT / BIGINT) so a single bad value
+        # fails its own row below instead of aborting the whole COPY.
         cur.execute(
             """
-            INSERT INTO bids (listing_id, bidder_id, amount)
-            VALUES (%s, %s, %s)
-            RETURNING *;
-            """,
-            (listing_id, bidder_id, amount),
-        )
-        return cur.fetchone()
-
-
-def accept_bid(con, bid_id):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
+            CREATE TEMP TABLE ingest_listings (
+                row_no INTEGER PRIMARY KEY,
+                title TEXT,
+                description TEXT,
+                price BIGINT,
+                living_area BIGINT,
+                rooms BIGINT,
+                category_id BIGINT,
+                agent_id BIGINT,
+                status TEXT,
+                street TEXT,
+                postal_code TEXT,
+                city TEXT,
+                country TEXT,
+                address_id INTEGER,
+                listing_id INTEGER,
+                agency_id INTEGER,
+                error TEXT
+            ) ON COMMIT DROP;
+
+            CREATE TEMP TABLE ingest_images (
+                row_no INTEGER NOT NULL,
+                image_url TEXT,
+                description TEXT,
+                position BIGINT
+            ) ON COMMIT DROP;
             """
-            UPDATE bids
-            SET is_accepted = TRUE
-            WHERE id = %s
-            RETURNING *;
-            """,
-            (bid_id,),
         )
-        return cur.fetchone()
-
-
-# ---------- FAVORITES ----------
-
-def add_favorite(con, user_id, listing_id):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
+        cur.copy_expert(
             """
-            INSERT INTO favorites (user_id, listing_id)
-            VALUES (%s, %s)
-            RETURNING *;
+            COPY ingest_listings (
+                row_no, title, description, price, living_area, rooms,
+                category_id, agent_id, status, street, postal_code, city, country
+            ) FROM STDIN;
             """,
-            (user_id, listing_id),
+            _copy_buffer(listing_rows),
         )
-        return cur.fetchone()
-
-
-def remove_favorite(con, user_id, listing_id):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            """
-            DELETE FROM favorites
-            WHERE user_id = %s AND listing_id = %s
-            RETURNING *;
-            """,
-            (user_id, listing_id),
+        cur.copy_expert(
+            "COPY ingest_images (row_no, image_url, description, position) FROM STDIN;",
+            _copy_buffer(image_rows),
         )
-        return cur.fetchone()
-
 
-def get_user_favorites(con, user_id):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
+        # Each check only looks at rows that are still valid, so a row
+        # reports the first problem it hit.
         cur.execute(
             """
-            SELECT l.*
-            FROM listings l
-            JOIN favorites f ON l.id = f.listing_id
-            WHERE f.user_id = %s;
-            """,
-            (user_id,),
-        )
-        return cur.fetchall()
-
-# ---------- VIEWINGS ----------
-
-def get_viewings_for_listing(con, listing_id):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            "SELECT * FROM viewings WHERE listing_id = %s;",
-            (listing_id,)
-        )
-        return cur.fetchall()
+            ANALYZE ingest_listings;
+
+            UPDATE ingest_listings SET error = 'Missing required field'
+            WHERE error IS NULL AND (
+                title IS NULL OR description IS NULL OR price IS NULL
+                OR living_area IS NULL OR rooms IS NULL OR category_id IS NULL
+                OR agent_id IS NULL OR status IS NULL OR street IS NULL
+                OR postal_code IS NULL OR city IS NULL OR country IS NULL
+            );
+
+            UPDATE ingest_listings SET error = 'Value too long'
+            WHERE error IS NULL AND (
+                length(title) > 255 OR length(street) > 255 OR length(postal_code) > 20
+                OR length(city) > 255 OR length(country) > 255
+            );
+
+            UPDATE ingest_listings SET error = 'Value out of range'
+            WHERE error IS NULL AND (
+                price NOT BETWEEN 0 AND 2147483647
+                OR living_area NOT BETWEEN 0 AND 2147483647
+                OR rooms NOT BETWEEN 0 AND 2147483647
+            );
+
+            UPDATE ingest_listings SET error = 'Invalid status'
+            WHERE error IS NULL AND status NOT IN ('active', 'upcoming', 'sold', 'archived');
+
+            UPDATE ingest_listings s SET error = 'Unknown category_id'
+            WHERE error IS NULL
+            AND NOT EXISTS (SELECT 1 FROM listing_categories c WHERE c.id = s.category_id);
+
+            UPDATE ingest_listings s SET error = 'Unknown agent_id'
+            WHERE error IS NULL
+            AND NOT EXISTS (SELECT 1 FROM users u WHERE u.id = s.agent_id);
+
+            UPDATE ingest_listings s SET error = 'Invalid image'
+            WHERE error IS NULL AND EXISTS (
+                SELECT 1 FROM ingest_images i
+                WHERE i.row_no = s.row_no AND (
+                    i.image_url IS NULL OR i.position NOT BETWEEN -2147483648 AND 2147483647
+                )
+            );
+
+            UPDATE ingest_listings s
+            SET address_id = nextval(pg_get_serial_sequence('addresses', 'id')),
+                listing_id = nextval(pg_get_serial_sequence('listings', 'id')),
+                agency_id = u.agency_id
+            FROM users u
+            WHERE s.error IS NULL AND u.id = s.agent_id;
+
+            -- Offline geocoding in bulk, same lookup as CentroidGeocoder.
+            INSERT INTO addresses (id, street, postal_code, city, country, latitude, longitude)
+            SELECT s.address_id, s.street, s.postal_code, s.city, s.country,
+                pc.latitude, pc.longitude
+            FROM ingest_listings s
+            LEFT JOIN postal_code_centroids pc
+                ON pc.country = s.country
+                AND pc.postal_code = upper(replace(s.postal_code, ' ', ''))
+            WHERE s.error IS NULL;
 
-
-def create_viewing(con, listing_id, start_time, end_time=None):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
-            """
-            INSERT INTO viewings (listing_id, start_time, end_time)
-            VALUES (%s, %s, %s)
-            RETURNING *;
-            """,
-            (listing_id, start_time, end_time),
-        )
-        return cur.fetchone()
-    
-# ---------- ADDRESSES ----------
-
-def create_address(con, street, postal_code, city, country):
-    with con, con.cursor(cursor_factory=RealDictCursor) as cur:
-        cur.execute(
+            INSERT INTO listings
+            (id, title, description, price, living_area, rooms,
+            category_id, agent_id, agency_id, status, address_id)
+            SELECT listing_id, title, description, price, living_area, rooms,
+            category_id, agent_id, agency_id, status, address_id
+            FROM ingest_listings
+            WHERE error IS NULL;
+
+            INSERT INTO images (listing_id, image_url, description, position)
+            SELECT s.listing_id, i.image_url, i.description, i.position
+            FROM ingest_images i
+            JOIN ingest_listings s ON s.row_no = i.row_no
+            WHERE s.error IS NULL;
             """
-            INSERT INTO addresses (street, postal_code, city, country)
-            VALUES (%s, %s, %s, %s)
-            RETURNING *;
-            """,
-            (street, postal_code, city, country),
         )
-        return cur.fetchone()
\ No newline at end of file
+        cur.execute("SELECT row_no, listing_id, error FROM ingest_listings ORDER BY row_no;")
+        return cur.fetchall()
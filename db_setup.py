@@ -5,6 +5,13 @@ from dotenv import load_dotenv
 
 load_dotenv(override=True)
 
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+# Key of the pg_advisory_lock that serializes migrate() across processes.
+# Any constant works, it only has to be the same for every process and
+# unused by other advisory locks on the database.
+MIGRATIONS_LOCK_ID = 42001
+
 def get_connection():
     return psycopg2.connect(
         host=os.getenv("DB_HOST"),
@@ -14,163 +21,60 @@ def get_connection():
         password=os.getenv("DB_PASSWORD"),
     )
 
-def create_tables():
-    con = get_connection()
-    with con:
-        with con.cursor() as cur:
-
-            # ROLES
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS roles (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(50) UNIQUE NOT NULL,
-                    description VARCHAR(255)
-                );
-            """)
-
-            # ADDRESSES
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS addresses (
-                    id SERIAL PRIMARY KEY,
-                    street VARCHAR(255) NOT NULL,
-                    postal_code VARCHAR(20) NOT NULL,
-                    city VARCHAR(255) NOT NULL,
-                    country VARCHAR(255) NOT NULL
-                );
-            """)
-
-            # REAL ESTATE AGENCIES
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS real_estate_agencies (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(255) UNIQUE NOT NULL,
-                    phone VARCHAR(50),
-                    email VARCHAR(255) UNIQUE NOT NULL,
-                    website VARCHAR(255),
-                    is_freelanse BOOLEAN DEFAULT FALSE,
-                    address_id INTEGER REFERENCES addresses(id),
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                );
-            """)
-
-            # USERS
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS users (
-                    id SERIAL PRIMARY KEY,
-                    email VARCHAR(255) UNIQUE NOT NULL,
-                    password_hash TEXT NOT NULL,
-                    first_name VARCHAR(100) NOT NULL,
-                    last_name VARCHAR(100) NOT NULL,
-                    phone VARCHAR(50),
-                    role_id INTEGER NOT NULL REFERENCES roles(id),
-                    agency_id INTEGER REFERENCES real_estate_agencies(id),
-                    is_active BOOLEAN DEFAULT TRUE,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                );
-            """)
-
-            # LISTING CATEGORIES
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS listing_categories (
-                    id SERIAL PRIMARY KEY,
-                    name VARCHAR(100) UNIQUE NOT NULL
-                );
-            """)
+def get_migrations():
+    migrations = []
+    for filename in sorted(os.listdir(MIGRATIONS_DIR)):
+        if filename.endswith(".sql"):
+            version = int(filename.split("_", 1)[0])
+            migrations.append((version, filename))
+    return migrations
 
-            # LISTINGS
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS listings (
-                    id SERIAL PRIMARY KEY,
-                    title VARCHAR(255) NOT NULL,
-                    description TEXT NOT NULL,
-                    price INTEGER NOT NULL,
-                    living_area INTEGER NOT NULL,
-                    rooms INTEGER NOT NULL,
-                    address_id INTEGER NOT NULL REFERENCES addresses(id),
-                    category_id INTEGER NOT NULL REFERENCES listing_categories(id),
-                    agent_id INTEGER NOT NULL REFERENCES users(id),
-                    agency_id INTEGER REFERENCES real_estate_agencies(id),
-                    status VARCHAR(50) NOT NULL
-                        CHECK (status IN ('active', 'upcoming', 'sold', 'archived')),
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                );
-            """)
-
-            # IMAGES
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS images (
-                    id SERIAL PRIMARY KEY,
-                    listing_id INTEGER NOT NULL REFERENCES listings(id) ON DELETE CASCADE,
-                    image_url TEXT NOT NULL,
-                    description TEXT,
-                    position INTEGER,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                );
-            """)
-
-            # BIDS
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS bids (
-                    id SERIAL PRIMARY KEY,
-                    listing_id INTEGER NOT NULL REFERENCES listings(id) ON DELETE CASCADE,
-                    bidder_id INTEGER NOT NULL REFERENCES users(id),
-                    amount INTEGER NOT NULL CHECK (amount > 0),
-                    is_accepted BOOLEAN DEFAULT FALSE,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
-                );
-            """)
-
-            # FAVORITES
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS favorites (
-                    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                    listing_id INTEGER NOT NULL REFERENCES listings(id) ON DELETE CASCADE,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    PRIMARY KEY (user_id, listing_id)
-                );
-            """)
-
-            # VIEWINGS
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS viewings (
-                    id SERIAL PRIMARY KEY,
-                    listing_id INTEGER NOT NULL REFERENCES listings(id) ON DELETE CASCADE,
-                    start_time TIMESTAMPTZ NOT NULL,
-                    end_time TIMESTAMPTZ,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    CHECK (end_time IS NULL OR end_time > start_time)
-                );
-            """)
-
-            # VIEWING REGISTRATIONS
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS viewing_registrations (
-                    id SERIAL PRIMARY KEY,
-                    viewing_id INTEGER NOT NULL REFERENCES viewings(id) ON DELETE CASCADE,
-                    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
-                    registered_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    UNIQUE (viewing_id, user_id)
-                );
-            """)
-
-            # AGENT REVIEWS
-            cur.execute("""
-                CREATE TABLE IF NOT EXISTS agent_reviews (
-                    id SERIAL PRIMARY KEY,
-                    agent_id INTEGER NOT NULL REFERENCES users(id),
-                    reviewer_id INTEGER NOT NULL REFERENCES users(id),
-                    rating INTEGER NOT NULL CHECK (rating BETWEEN 1 AND 5),
-                    comment TEXT,
-                    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
-                    UNIQUE (agent_id, reviewer_id)
-                );
-            """)
-
-    con.close()
+def migrate():
+    con = get_connection()
+    applied = []
+    try:
+        with con:
+            with con.cursor() as cur:
+                # Session-level lock, taken before anything else so two deploys
+                # can't race on creating schema_migrations or apply the same
+                # migration twice.
+                cur.execute("SELECT pg_advisory_lock(%s);", (MIGRATIONS_LOCK_ID,))
+                cur.execute("""
+                    CREATE TABLE IF NOT EXISTS schema_migrations (
+                        version INTEGER PRIMARY KEY,
+                        name VARCHAR(255) NOT NULL,
+                        applied_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+                    );
+                """)
+
+        for version, name in get_migrations():
+            with con:
+                with con.cursor() as cur:
+                    cur.execute(
+                        "SELECT 1 FROM schema_migrations WHERE version = %s;",
+                        (version,)
+                    )
+                    if cur.fetchone():
+                        continue
+                    with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+                        cur.execute(f.read())
+                    cur.execute(
+                        "INSERT INTO schema_migrations (version, name) VALUES (%s, %s);",
+                        (version, name)
+                    )
+            applied.append(name)
+    finally:
+        if not con.closed:
+            con.rollback()
+            with con.cursor() as cur:
+                cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATIONS_LOCK_ID,))
+            con.commit()
+        con.close()
+    return applied
 
 
 if __name__ == "__main__":
-    create_tables()
-    print("Tables created successfully.")
\ No newline at end of file
+    applied = migrate()
+    for name in applied:
+        print(f"Applied {name}")
+    print("Database is up to date." if applied else "No pending migrations.")
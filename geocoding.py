@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import os
+
+from dotenv import load_dotenv
+
+import async_db
+from metrics import named_query
+
+load_dotenv()
+
+GEOCODER = os.getenv("GEOCODER", "centroid")
+GEOCODER_URL = os.getenv("GEOCODER_URL", "https://nominatim.openstreetmap.org/search")
+GEOCODER_USER_AGENT = os.getenv("GEOCODER_USER_AGENT", "nightowl-geocoder")
+GEOCODER_TIMEOUT = float(os.getenv("GEOCODER_TIMEOUT", "5"))
+BACKFILL_BATCH_SIZE = 500
+
+
+def normalize_postal_code(postal_code):
+    return postal_code.replace(" ", "").upper()
+
+
+# ---------- GEOCODERS ----------
+# Each geocoder returns (latitude, longitude) or None when it has no match.
+# Lookups in the database use con when given, or else a pooled connection
+# held only for that query, so callers needn't keep one across a slow
+# remote geocoder.
+
+class NullGeocoder:
+    async def geocode(self, street, postal_code, city, country, con=None):
+        return None
+
+    async def close(self):
+        pass
+
+
+class CentroidGeocoder:
+    # Offline: the centre of the postal code area from postal_code_centroids.
+    # Good enough for map clustering and radius search at neighbourhood level.
+
+    @named_query("geocode_centroid")
+    async def geocode(self, street, postal_code, city, country, con=None):
+        if con is None:
+            async with async_db.acquire() as con:
+                return await self.geocode(street, postal_code, city, country, con)
+        row = await con.fetchrow(
+            """
+            SELECT latitude, longitude
+            FROM postal_code_centroids
+            WHERE country = $1 AND postal_code = $2;
+            """,
+            country, normalize_postal_code(postal_code),
+        )
+        return (row["latitude"], row["longitude"]) if row is not None else None
+
+    async def close(self):
+        pass
+
+
+class NominatimGeocoder:
+    # Street-level results from a Nominatim-compatible service, falling back
+    # to the postal code centroid when it has no match or is unreachable.
+
+    def __init__(self, url=GEOCODER_URL, fallback=None):
+        # Only needed when GEOCODER=nominatim, so it isn't in requirements.txt.
+        import httpx
+
+        self._httpx = httpx
+        self._client = httpx.AsyncClient(
+            base_url=url,
+            headers={"User-Agent": GEOCODER_USER_AGENT},
+            timeout=GEOCODER_TIMEOUT,
+        )
+        self.fallback = fallback or CentroidGeocoder()
+
+    async def geocode(self, street, postal_code, city, country, con=None):
+        try:
+            response = await self._client.get(
+                "",
+                params={
+                    "street": street,
+                    "postalcode": postal_code,
+                    "city": city,
+                    "country": country,
+                    "format": "json",
+                    "limit": 1,
+                },
+            )
+            response.raise_for_status()
+            results = response.json()
+        except (self._httpx.HTTPError, ValueError):
+            results = []
+        if results:
+            return float(results[0]["lat"]), float(results[0]["lon"])
+        return await self.fallback.geocode(street, postal_code, city, country, con)
+
+    async def close(self):
+        await self._client.aclose()
+
+
+def create_geocoder(backend=GEOCODER):
+    if backend == "nominatim":
+        return NominatimGeocoder()
+    if backend == "centroid":
+        return CentroidGeocoder()
+    if backend == "none":
+        return NullGeocoder()
+    raise ValueError(f"Unknown GEOCODER: {backend}")
+
+
+geocoder = create_geocoder()
+
+
+# ---------- SCRIPTS ----------
+
+@named_query("load_centroids")
+async def load_centroids(path):
+    # CSV with a header row: country,postal_code,latitude,longitude
+    con = await async_db.connect()
+    try:
+        async with con.transaction():
+            await con.execute(
+                "CREATE TEMP TABLE centroids_staging"
+                " (LIKE postal_code_centroids) ON COMMIT DROP;"
+            )
+            with open(path, "rb") as f:
+                await con.copy_to_table(
+                    "centroids_staging",
+                    source=f,
+                    columns=["country", "postal_code", "latitude", "longitude"],
+                    format="csv",
+                    header=True,
+                )
+            status = await con.execute(
+                """
+                INSERT INTO postal_code_centroids (country, postal_code, latitude, longitude)
+                SELECT DISTINCT ON (country, upper(replace(postal_code, ' ', '')))
+                    country, upper(replace(postal_code, ' ', '')), latitude, longitude
+                FROM centroids_staging
+                ON CONFLICT (country, postal_code) DO UPDATE
+                SET latitude = EXCLUDED.latitude, longitude = EXCLUDED.longitude;
+                """
+            )
+    finally:
+        await con.close()
+    return int(status.split()[-1])
+
+
+@named_query("geocode_backfill")
+async def backfill(geocoder=geocoder, batch_size=BACKFILL_BATCH_SIZE):
+    # Geocodes addresses that have no coordinates yet. Addresses the
+    # geocoder can't place are skipped, not retried, within one run.
+    con = await async_db.connect()
+    updated, last_id = 0, 0
+    try:
+        while True:
+            rows = await con.fetch(
+                """
+                SELECT id, street, postal_code, city, country
+                FROM addresses
+                WHERE id > $1 AND (latitude IS NULL OR longitude IS NULL)
+                ORDER BY id
+                LIMIT $2;
+                """,
+                last_id, batch_size,
+            )
+            if not rows:
+                break
+            located = []
+            for row in rows:
+                coordinates = await geocoder.geocode(
+                    row["street"], row["postal_code"], row["city"], row["country"], con
+                )
+                if coordinates is not None:
+                    located.append((row["id"], *coordinates))
+            await con.executemany(
+                "UPDATE addresses SET latitude = $2, longitude = $3 WHERE id = $1;",
+                located,
+            )
+            updated += len(located)
+            last_id = rows[-1]["id"]
+    finally:
+        await con.close()
+    return updated
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Geocode addresses for map search.")
+    parser.add_argument("--load-centroids", metavar="CSV")
+    parser.add_argument("--backfill", action="store_true")
+    args = parser.parse_args()
+    if args.load_centroids:
+        print(f"Loaded {asyncio.run(load_centroids(args.load_centroids))} postal code centroids")
+    if args.backfill:
+        print(f"Geocoded {asyncio.run(backfill())} addresses")
@@ -0,0 +1,341 @@
+import hashlib
+import importlib.util
+import os
+import zlib
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from dotenv import load_dotenv
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+from stats import STATS_JOB_INTERVAL, STATS_REFRESH_INTERVAL
+
+load_dotenv()
+
+# Responses smaller than this go out uncompressed; the encoding overhead
+# outweighs the saving.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Server preference when the client accepts several equally.
+COMPRESSION_ENCODINGS = os.getenv("COMPRESSION_ENCODINGS", "zstd,br,gzip")
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+
+# max-age for collections that change a few times a day.
+REFERENCE_MAX_AGE = int(os.getenv("REFERENCE_MAX_AGE", "3600"))
+LISTINGS_MAX_AGE = int(os.getenv("LISTINGS_MAX_AGE", "5"))
+LISTINGS_STALE_WHILE_REVALIDATE = int(os.getenv("LISTINGS_STALE_WHILE_REVALIDATE", "30"))
+
+
+# ---------- VALIDATORS ----------
+# ETag and Last-Modified are built from a version: a dict such as the ones
+# async_db.get_*_version return, or {"updated_at": row["updated_at"]}. The
+# same version always gives the same ETag, however it was read.
+
+def _as_datetime(value):
+    # Rows served from the Redis / local-shared cache carry their
+    # timestamps as ISO strings.
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+
+def make_etag(version):
+    # Weak: the tag names a version, not the bytes. format=columns and the
+    # compressed encodings of a version all share it.
+    raw = "|".join(
+        value.isoformat() if isinstance(value, datetime) else str(value)
+        for value in map(_as_datetime, version.values())
+    )
+    return f'W/"{hashlib.blake2b(raw.encode(), digest_size=8).hexdigest()}"'
+
+
+def validator_headers(version):
+    headers = {"ETag": make_etag(version)}
+    updated_at = _as_datetime(version.get("updated_at"))
+    if updated_at is not None:
+        headers["Last-Modified"] = format_datetime(
+            updated_at.astimezone(timezone.utc), usegmt=True
+        )
+    return headers
+
+
+def has_conditions(request):
+    return "if-none-match" in request.headers or "if-modified-since" in request.headers
+
+
+def _not_modified(request_headers, etag, updated_at):
+    # If-None-Match wins over If-Modified-Since (RFC 9110 13.2.2), and is
+    # compared weakly: W/"x" matches "x".
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is None or updated_at is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have whole seconds.
+    return updated_at.replace(microsecond=0) <= since
+
+
+def conditional(request, response, version):
+    # Puts ETag / Last-Modified on the response and returns a 304 to send
+    # instead when the client's copy is still current, else None.
+    headers = validator_headers(version)
+    response.headers.update(headers)
+    if _not_modified(request.headers, headers["ETag"], _as_datetime(version.get("updated_at"))):
+        return Response(status_code=304, headers=headers)
+    return None
+
+
+# ---------- CACHE-CONTROL ----------
+# Per-route policy for successful GETs, keyed by route template. Routes
+# without a rule send no Cache-Control, and a header the endpoint set
+# itself (SSE's no-cache) is kept.
+
+_LISTING_PAGES = (
+    f"public, max-age={LISTINGS_MAX_AGE}, "
+    f"stale-while-revalidate={LISTINGS_STALE_WHILE_REVALIDATE}"
+)
+_REFERENCE = f"public, max-age={REFERENCE_MAX_AGE}"
+# Stored, but revalidated with the ETag on every use.
+_REVALIDATE = "public, no-cache"
+_STATS = f"public, max-age={int(STATS_REFRESH_INTERVAL or STATS_JOB_INTERVAL or 60)}"
+
+CACHE_CONTROL_RULES = {
+    "/categories": _REFERENCE,
+    "/agencies": _REFERENCE,
+    "/listings": _LISTING_PAGES,
+    "/listings/search": _LISTING_PAGES,
+    "/listings/map": _LISTING_PAGES,
+    "/listings/nearby": _LISTING_PAGES,
+    "/agencies/{agency_id}/listings": _LISTING_PAGES,
+    "/listings/{listing_id}": _REVALIDATE,
+    "/listings/{listing_id}/images": _REVALIDATE,
+    "/users/{user_id}/favorites": "private, no-cache",
+    "/users/{user_id}/favorites/ids": "private, no-cache",
+    "/users/{user_id}/favorites/membership": "private, no-cache",
+    # The views don't change between refreshes.
+    "/stats/market": _STATS,
+    "/stats/market/cities": _STATS,
+    "/stats/market/categories": _STATS,
+}
+
+# 304s repeat the policy so caches refresh the stored response's freshness.
+CACHEABLE_STATUSES = (200, 203, 304)
+
+
+class CacheControlMiddleware:
+    # Plain ASGI like MetricsMiddleware. The router has put the matched
+    # route in the scope by the time the response starts.
+
+    def __init__(self, app, rules=CACHE_CONTROL_RULES):
+        self.app = app
+        self.rules = rules
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("GET", "HEAD"):
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_policy(message):
+            if (
+                message["type"] == "http.response.start"
+                and message["status"] in CACHEABLE_STATUSES
+            ):
+                route = scope.get("route")
+                policy = self.rules.get(route.path) if route is not None else None
+                if policy is not None:
+                    MutableHeaders(scope=message).setdefault("Cache-Control", policy)
+            await send(message)
+
+        await self.app(scope, receive, send_with_policy)
+
+
+# ---------- COMPRESSION ----------
+# Encoders share one interface: compress() buffers, flush() emits
+# everything so far as a decodable block (used between the chunks of a
+# streaming response), finish() ends the stream.
+
+class GzipEncoder:
+    def __init__(self, level=GZIP_LEVEL):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    def __init__(self, quality=BROTLI_QUALITY):
+        # Optional, so it isn't in requirements.txt; br is only offered
+        # when it is installed.
+        import brotli
+
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level=ZSTD_LEVEL):
+        # Optional like brotli.
+        import zstandard
+
+        self._block = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(self._block)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+ENCODERS = {"zstd": ZstdEncoder, "br": BrotliEncoder, "gzip": GzipEncoder}
+_ENCODER_MODULES = {"zstd": "zstandard", "br": "brotli"}
+
+
+def available_encodings(preference=COMPRESSION_ENCODINGS):
+    encodings = []
+    for encoding in (name.strip() for name in preference.split(",")):
+        if encoding not in ENCODERS:
+            raise ValueError(f"Unknown compression encoding: {encoding}")
+        module = _ENCODER_MODULES.get(encoding)
+        if module is None or importlib.util.find_spec(module) is not None:
+            encodings.append(encoding)
+    return encodings
+
+
+def negotiate_encoding(accept_encoding, encodings):
+    # Highest q-value wins; ties go to the server's preference order.
+    weights = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        name = name.strip().lower()
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+    best, best_weight = None, 0.0
+    for encoding in encodings:
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+# Event streams are left alone: each event is flushed on its own, so there
+# is nothing to gain, and some proxies hold compressed streams back.
+_COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/x-ndjson",
+    "application/javascript",
+    "application/xml",
+    "image/svg+xml",
+    "text/plain",
+    "text/csv",
+    "text/html",
+    "text/css",
+)
+
+
+def _compressible(headers):
+    content_type = headers.get("content-type", "").split(";")[0].strip().lower()
+    return content_type in _COMPRESSIBLE_TYPES and "content-encoding" not in headers
+
+
+class CompressionMiddleware:
+    # Plain ASGI so streaming responses (export) are compressed chunk by
+    # chunk, each flushed so the client can decode it as it arrives.
+
+    def __init__(self, app, minimum_size=COMPRESSION_MIN_SIZE, encodings=None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.encodings = available_encodings() if encodings is None else encodings
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = None
+        if scope["method"] != "HEAD":
+            encoding = negotiate_encoding(
+                Headers(scope=scope).get("accept-encoding", ""), self.encodings
+            )
+        start = None
+        encoder = None
+
+        async def send_compressed(message):
+            nonlocal start, encoder
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(scope=message)
+                if message["status"] not in (204, 304) and _compressible(headers):
+                    headers.add_vary_header("Accept-Encoding")
+                    if encoding is not None:
+                        # Held back until the first body chunk shows the size.
+                        start = message
+                        return
+                # Anything that won't be compressed, event streams above all,
+                # goes out at once instead of waiting for a body.
+                await send(message)
+                return
+            if message["type"] == "http.response.body" and start is not None:
+                message, encoder = self._first_body(start, message, encoding)
+                await send(start)
+                start = None
+            elif message["type"] == "http.response.body" and encoder is not None:
+                more_body = message.get("more_body", False)
+                body = encoder.compress(message.get("body", b""))
+                body += encoder.flush() if more_body else encoder.finish()
+                message = {**message, "body": body}
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
+
+    def _first_body(self, start, message, encoding):
+        # Decides from the first chunk whether to compress a compressible
+        # response, updating the held start message. Returns the chunk to
+        # send and the encoder for the rest of the stream, if any.
+        headers = MutableHeaders(scope=start)
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if not more_body and len(body) < self.minimum_size:
+            return message, None
+        encoder = ENCODERS[encoding]()
+        headers["Content-Encoding"] = encoding
+        body = encoder.compress(body)
+        if more_body:
+            # Length unknown until the stream ends.
+            del headers["Content-Length"]
+            body += encoder.flush()
+        else:
+            body += encoder.finish()
+            headers["Content-Length"] = str(len(body))
+        return {**message, "body": body}, encoder
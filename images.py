@@ -0,0 +1,174 @@
+import asyncio
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncpg
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+
+import async_db
+from storage import storage
+
+load_dotenv()
+
+logger = logging.getLogger("nightowl.images")
+
+# Threads decoding and encoding uploads. Pillow releases the GIL while it
+# works, so these run in parallel beside the event loop; 0 turns the
+# in-app processor off.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(min(4, os.cpu_count() or 1))))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# Content-Type of an upload -> extension of the stored original.
+UPLOAD_TYPES = {"image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp"}
+
+# name -> (longest side in pixels, format). Images are only ever scaled
+# down.
+IMAGE_VARIANTS = {
+    "thumbnail": (320, "JPEG"),
+    "thumbnail_webp": (320, "WEBP"),
+    "webp": (1600, "WEBP"),
+}
+
+FORMATS = {
+    "JPEG": (".jpg", "image/jpeg", {"quality": 80, "optimize": True, "progressive": True}),
+    "WEBP": (".webp", "image/webp", {"quality": 75, "method": 4}),
+}
+
+
+# ---------- VARIANTS ----------
+
+def build_variants(data):
+    # CPU-bound; runs on the processor's threads. Returns
+    # {name: (bytes, width, height, format)}.
+    variants = {}
+    with Image.open(io.BytesIO(data)) as original:
+        # For JPEG, decode straight at a reduced scale when even the largest
+        # variant is much smaller than the original.
+        largest = max(size for size, _ in IMAGE_VARIANTS.values())
+        original.draft("RGB", (largest, largest))
+        image = ImageOps.exif_transpose(original)
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        for name, (size, image_format) in IMAGE_VARIANTS.items():
+            variant = image.copy()
+            variant.thumbnail((size, size), Image.Resampling.LANCZOS)
+            if image_format == "JPEG" and variant.mode != "RGB":
+                variant = variant.convert("RGB")
+            buffer = io.BytesIO()
+            variant.save(buffer, image_format, **FORMATS[image_format][2])
+            variants[name] = (buffer.getvalue(), variant.width, variant.height, image_format)
+    return variants
+
+
+def variant_key(storage_key, name, image_format):
+    stem = storage_key.rsplit(".", 1)[0]
+    return f"{stem}_{name}{FORMATS[image_format][0]}"
+
+
+async def _stored(data):
+    yield data
+
+
+# ---------- PROCESSOR ----------
+
+class ImageProcessor:
+    # Makes the variants of uploaded images off the request path: routes
+    # submit an image id and return, a task feeds ids to a thread pool, and
+    # each finished image is recorded in one UPDATE. Images still pending
+    # at startup (e.g. from before a restart) are queued again.
+    def __init__(self, workers=IMAGE_WORKERS):
+        self.workers = workers
+        self._queue = None
+        self._executor = None
+        self._tasks = []
+
+    async def start(self):
+        if self._tasks or self.workers <= 0:
+            return
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="images")
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+        try:
+            async with async_db.acquire() as con:
+                pending = await async_db.get_pending_image_ids(con)
+        except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError):
+            logger.warning("Could not load pending images; they wait for the next start")
+            pending = []
+        for image_id in pending:
+            self._queue.put_nowait(image_id)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._queue = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    @property
+    def running(self):
+        return self._queue is not None
+
+    def submit(self, image_id):
+        # With the processor off, the image stays pending for the next
+        # process that runs one (or a process_image job, see jobs.py).
+        if self._queue is not None:
+            self._queue.put_nowait(image_id)
+
+    async def _run(self):
+        while True:
+            image_id = await self._queue.get()
+            try:
+                await self.process(image_id)
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError):
+                # Still pending; picked up again on the next start.
+                logger.exception("Processing image %s failed", image_id)
+            finally:
+                self._queue.task_done()
+
+    async def process(self, image_id):
+        async with async_db.acquire() as con:
+            storage_key = await async_db.get_pending_image_key(con, image_id)
+        if storage_key is None:
+            return
+        data = await storage.read(storage_key)
+        loop = asyncio.get_running_loop()
+        try:
+            built = await loop.run_in_executor(self._executor, build_variants, data)
+        except (Image.UnidentifiedImageError, Image.DecompressionBombError, ValueError, OSError):
+            async with async_db.acquire() as con:
+                await async_db.set_image_failed(con, image_id)
+            return
+
+        variants = {}
+        for name, (content, width, height, image_format) in built.items():
+            key = variant_key(storage_key, name, image_format)
+            await storage.save(key, _stored(content))
+            variants[name] = {
+                "url": storage.url(key),
+                "width": width,
+                "height": height,
+                "media_type": FORMATS[image_format][1],
+            }
+        async with async_db.acquire() as con:
+            recorded = await async_db.set_image_variants(con, image_id, variants)
+        if not recorded:
+            for name, (_, _, _, image_format) in built.items():
+                await storage.delete(variant_key(storage_key, name, image_format))
+
+    async def join(self):
+        # Waits until everything submitted so far is processed.
+        if self._queue is not None:
+            await self._queue.join()
+
+
+processor = ImageProcessor()
@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import random
+import socket
+
+import asyncpg
+from dotenv import load_dotenv
+
+import async_db
+from images import processor
+from stats import STATS_JOB_INTERVAL, refresh_stats
+
+load_dotenv()
+
+logger = logging.getLogger("nightowl.jobs")
+
+CHANNEL = "jobs"
+# Jobs one worker process runs at a time.
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+# Idle workers are woken by NOTIFY when a job is enqueued; the poll only
+# catches scheduled jobs and retries coming due, and missed notifications.
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2"))
+# A run taking longer is cancelled and retried. A job still running after
+# twice this is taken to belong to a dead worker and requeued.
+JOB_TIMEOUT = float(os.getenv("JOB_TIMEOUT", "300"))
+# Retry n waits about JOB_BACKOFF_BASE * 2^(n-1) seconds, capped.
+JOB_BACKOFF_BASE = float(os.getenv("JOB_BACKOFF_BASE", "5"))
+JOB_BACKOFF_MAX = float(os.getenv("JOB_BACKOFF_MAX", "3600"))
+JOB_RETENTION_DAYS = float(os.getenv("JOB_RETENTION_DAYS", "7"))
+# How far back listing_events (the SSE replay log) reaches; a client
+# resuming from further back only gets what is left. 0 keeps everything.
+LISTING_EVENT_RETENTION_DAYS = float(os.getenv("LISTING_EVENT_RETENTION_DAYS", "7"))
+LISTENER_RECONNECT_DELAY = 2
+
+
+# ---------- TASKS ----------
+# A task is an async function taking the job's payload. It may run more
+# than once for one job (a retry after a timeout, a requeue after a
+# crash), so tasks are written to be safe to repeat.
+
+TASKS = {}
+
+
+def task(name):
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+@task("refresh_stats")
+async def run_refresh_stats(payload):
+    async with async_db.acquire() as con:
+        await refresh_stats(con, payload.get("force", False))
+
+
+@task("process_image")
+async def run_process_image(payload):
+    # A no-op unless the image is still pending.
+    await processor.process(payload["image_id"])
+
+
+@task("prune_jobs")
+async def run_prune_jobs(payload):
+    async with async_db.acquire() as con:
+        await async_db.prune_jobs(con, JOB_RETENTION_DAYS * 86400)
+
+
+@task("prune_listing_events")
+async def run_prune_listing_events(payload):
+    # Batch by batch, each in its own short transaction.
+    while True:
+        async with async_db.acquire() as con:
+            deleted = await async_db.prune_listing_events(
+                con, LISTING_EVENT_RETENTION_DAYS * 86400
+            )
+        if not deleted:
+            return
+
+
+def recurring_jobs():
+    # name -> (task, every seconds)
+    schedule = {"prune_jobs": ("prune_jobs", 3600)}
+    if LISTING_EVENT_RETENTION_DAYS > 0:
+        schedule["prune_listing_events"] = ("prune_listing_events", 3600)
+    if STATS_JOB_INTERVAL > 0:
+        schedule["refresh_stats"] = ("refresh_stats", STATS_JOB_INTERVAL)
+    return schedule
+
+
+def backoff(attempts):
+    # Full jitter, so jobs that failed together don't retry together.
+    delay = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** (attempts - 1))
+    return random.uniform(delay / 2, delay)
+
+
+# ---------- WORKER ----------
+
+class JobWorker:
+    def __init__(self, concurrency=JOB_CONCURRENCY, queues=None, poll_interval=JOB_POLL_INTERVAL):
+        self.concurrency = concurrency
+        self.queues = list(queues) if queues else None
+        self.poll_interval = poll_interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._runners = []
+        self._background = []
+
+    async def start(self):
+        schedule = recurring_jobs()
+        async with async_db.acquire() as con:
+            for name, (task_name, every) in schedule.items():
+                await async_db.register_recurring_job(con, name, task_name, every)
+            await async_db.remove_recurring_jobs(con, schedule)
+        self._background = [
+            asyncio.create_task(self._listen()),
+            asyncio.create_task(self._schedule()),
+        ]
+        self._runners = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    async def stop(self, timeout=JOB_TIMEOUT):
+        # Claims nothing more and gives running jobs up to timeout seconds
+        # to finish. Any cut short stay running until requeued as stale.
+        self._stopping = True
+        self._wake()
+        _, pending = await asyncio.wait(self._runners, timeout=timeout)
+        for running in (*pending, *self._background):
+            running.cancel()
+        await asyncio.gather(*pending, *self._background, return_exceptions=True)
+        self._runners, self._background = [], []
+
+    def _wake(self, *args):
+        wakeup, self._wakeup = self._wakeup, asyncio.Event()
+        wakeup.set()
+
+    async def _run(self):
+        while not self._stopping:
+            wakeup = self._wakeup
+            try:
+                async with async_db.acquire() as con:
+                    jobs = await async_db.claim_jobs(con, self.worker_id, self.queues)
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError):
+                logger.exception("Claiming jobs failed")
+                jobs = []
+            if not jobs:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for job in jobs:
+                try:
+                    await self._execute(job)
+                except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError):
+                    # Left running; requeued as stale later.
+                    logger.exception("Recording the outcome of job %s failed", job["id"])
+
+    async def _execute(self, job):
+        try:
+            function = TASKS.get(job["task"])
+            if function is None:
+                raise LookupError(f"Unknown task {job['task']}")
+            await asyncio.wait_for(function(job["payload"]), JOB_TIMEOUT)
+        except Exception as exc:
+            retry_in = backoff(job["attempts"]) if job["attempts"] < job["max_attempts"] else None
+            logger.warning(
+                "Job %s (%s) attempt %s failed: %r", job["id"], job["task"], job["attempts"], exc
+            )
+            async with async_db.acquire() as con:
+                await async_db.fail_job(con, job["id"], f"{type(exc).__name__}: {exc}", retry_in)
+        else:
+            async with async_db.acquire() as con:
+                await async_db.complete_job(con, job["id"])
+
+    async def _schedule(self):
+        while True:
+            try:
+                async with async_db.acquire() as con:
+                    await async_db.enqueue_due_recurring_jobs(con)
+                    requeued = await async_db.requeue_stale_jobs(con, JOB_TIMEOUT * 2)
+                if requeued:
+                    logger.warning("Requeued stale jobs %s", requeued)
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError):
+                logger.exception("Scheduling recurring jobs failed")
+            await asyncio.sleep(self.poll_interval)
+
+    async def _listen(self):
+        while True:
+            con = None
+            try:
+                con = await async_db.connect()
+                await con.add_listener(CHANNEL, self._wake)
+                # Whatever was enqueued while we weren't listening.
+                self._wake()
+                while True:
+                    await asyncio.sleep(self.poll_interval * 5)
+                    await con.execute("SELECT 1;")
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                pass
+            finally:
+                if con is not None and not con.is_closed():
+                    await con.close()
+            await asyncio.sleep(LISTENER_RECONNECT_DELAY)
@@ -0,0 +1,257 @@
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import re
+import threading
+import time
+
+from dotenv import load_dotenv
+from fastapi.routing import APIRoute
+
+load_dotenv()
+
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+
+logger = logging.getLogger("nightowl.db")
+
+# The request being served, so database timings can be labelled with its
+# route. Unset for work outside a request (LISTEN, the stats refresher).
+_request = contextvars.ContextVar("metrics_request", default=None)
+# The query being run, set by @named_query on the data-layer functions.
+# Statements outside one (transaction control, pool resets, LISTEN pings)
+# are labelled "other".
+_query = contextvars.ContextVar("metrics_query", default="other")
+
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+ROW_BUCKETS = (0, 1, 5, 10, 20, 50, 100, 500, 1000, 5000, 10000, 50000)
+
+
+# ---------- HISTOGRAMS ----------
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = buckets
+        # label values -> [count per bucket..., count, sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            for n, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[n] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            label_text = ",".join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.labelnames, labels)
+            )
+            prefix = f"{label_text}," if label_text else ""
+            for bound, count in zip(self.buckets, values):
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {values[-2]}')
+            lines.append(f"{self.name}_sum{{{label_text}}} {values[-1]}")
+            lines.append(f"{self.name}_count{{{label_text}}} {values[-2]}")
+        return "\n".join(lines)
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request to sending the last byte of its response.",
+    ("method", "route", "status"),
+)
+SERIALIZATION_DURATION = Histogram(
+    "http_response_serialization_seconds",
+    "Time from the endpoint returning to the response headers being sent "
+    "(response model validation, jsonable_encoder, JSON rendering, compression).",
+    ("route",),
+)
+ACQUIRE_DURATION = Histogram(
+    "db_connection_acquire_seconds",
+    "Time spent waiting for a pooled database connection.",
+    ("route", "pool"),
+)
+QUERY_DURATION = Histogram(
+    "db_query_duration_seconds",
+    "Execution time of one database statement, labelled by the named query that ran it.",
+    ("route", "query"),
+)
+QUERY_ROWS = Histogram(
+    "db_query_rows",
+    "Rows returned (or affected) by one database statement.",
+    ("route", "query"),
+    ROW_BUCKETS,
+)
+
+HISTOGRAMS = (
+    REQUEST_DURATION,
+    SERIALIZATION_DURATION,
+    ACQUIRE_DURATION,
+    QUERY_DURATION,
+    QUERY_ROWS,
+)
+
+
+def render_metrics():
+    return "\n".join(histogram.render() for histogram in HISTOGRAMS) + "\n"
+
+
+def current_route():
+    request = _request.get()
+    if request is None:
+        return "background"
+    route = request["scope"].get("route")
+    return route.path if route is not None else "unmatched"
+
+
+# ---------- DATABASE ----------
+
+def current_query():
+    return _query.get()
+
+
+def named_query(name):
+    # Labels the statements a data-layer function runs, including those of
+    # any helper it calls, with name. The innermost named function wins.
+    def decorate(function):
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def named(*args, **kwargs):
+                token = _query.set(name)
+                try:
+                    return await function(*args, **kwargs)
+                finally:
+                    _query.reset(token)
+        elif inspect.isgeneratorfunction(function):
+            @functools.wraps(function)
+            def named(*args, **kwargs):
+                # Each step runs under the name, without leaking it to the
+                # consumer between items.
+                context = contextvars.copy_context()
+                context.run(_query.set, name)
+                generator = function(*args, **kwargs)
+                try:
+                    while True:
+                        try:
+                            item = context.run(next, generator)
+                        except StopIteration as stop:
+                            return stop.value
+                        yield item
+                finally:
+                    context.run(generator.close)
+        else:
+            @functools.wraps(function)
+            def named(*args, **kwargs):
+                token = _query.set(name)
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    _query.reset(token)
+        return named
+    return decorate
+
+
+def observe_acquire(seconds, pool):
+    ACQUIRE_DURATION.observe(seconds, current_route(), pool)
+
+
+def observe_query(statement, seconds, rows):
+    name = current_query()
+    route = current_route()
+    QUERY_DURATION.observe(seconds, route, name)
+    QUERY_ROWS.observe(rows, route, name)
+    if seconds * 1000 >= SLOW_QUERY_MS:
+        logger.warning(
+            "slow query %s on %s: %.1f ms, %d rows: %s",
+            name, route, seconds * 1000, rows, re.sub(r"\s+", " ", statement).strip()[:500],
+        )
+
+
+# ---------- HTTP ----------
+
+class MetricsMiddleware:
+    # Plain ASGI rather than BaseHTTPMiddleware, so streaming responses
+    # (export, SSE) pass through untouched.
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        request = {"scope": scope, "endpoint_done": None}
+        token = _request.set(request)
+        started = time.perf_counter()
+        status_code = 500
+
+        async def send_with_metrics(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if request["endpoint_done"] is not None:
+                    SERIALIZATION_DURATION.observe(
+                        time.perf_counter() - request["endpoint_done"], current_route()
+                    )
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_metrics)
+        finally:
+            REQUEST_DURATION.observe(
+                time.perf_counter() - started, scope["method"], current_route(), str(status_code)
+            )
+            _request.reset(token)
+
+
+def _endpoint_done():
+    request = _request.get()
+    if request is not None:
+        request["endpoint_done"] = time.perf_counter()
+
+
+def _timed_endpoint(endpoint):
+    # Marks when the endpoint itself returns; everything between that and
+    # the response headers is serialization.
+    if inspect.iscoroutinefunction(endpoint):
+        @functools.wraps(endpoint)
+        async def timed(*args, **kwargs):
+            try:
+                return await endpoint(*args, **kwargs)
+            finally:
+                _endpoint_done()
+    else:
+        @functools.wraps(endpoint)
+        def timed(*args, **kwargs):
+            try:
+                return endpoint(*args, **kwargs)
+            finally:
+                _endpoint_done()
+    return timed
+
+
+class InstrumentedRoute(APIRoute):
+    def __init__(self, path, endpoint, **kwargs):
+        super().__init__(path, _timed_endpoint(endpoint), **kwargs)
@@ -0,0 +1,50 @@
+-- Indexes for the lookups in db.py / async_db.py that were sequential scans.
+-- agent_reviews(agent_id) is already served by UNIQUE (agent_id, reviewer_id)
+-- and favorites(user_id) by its primary key, so neither gets a new index.
+
+-- GET /listings/{id}/bids: WHERE listing_id = ? ORDER BY amount DESC
+CREATE INDEX IF NOT EXISTS bids_listing_id_amount_idx
+    ON bids (listing_id, amount DESC);
+
+-- GET /listings/{id}/viewings
+CREATE INDEX IF NOT EXISTS viewings_listing_id_start_time_idx
+    ON viewings (listing_id, start_time);
+
+-- GET /listings/{id}/images: WHERE listing_id = ? ORDER BY position
+CREATE INDEX IF NOT EXISTS images_listing_id_position_idx
+    ON images (listing_id, position);
+
+-- Keyset pagination of GET /listings, unfiltered and by status
+CREATE INDEX IF NOT EXISTS listings_created_at_id_idx
+    ON listings (created_at DESC, id DESC);
+
+CREATE INDEX IF NOT EXISTS listings_status_created_at_id_idx
+    ON listings (status, created_at DESC, id DESC);
+
+-- Most list views only show active listings
+CREATE INDEX IF NOT EXISTS listings_active_created_at_id_idx
+    ON listings (created_at DESC, id DESC)
+    WHERE status = 'active';
+
+CREATE INDEX IF NOT EXISTS listings_active_category_id_price_idx
+    ON listings (category_id, price)
+    WHERE status = 'active';
+
+-- GET /agencies/{id}/listings
+CREATE INDEX IF NOT EXISTS listings_agency_id_created_at_id_idx
+    ON listings (agency_id, created_at DESC, id DESC);
+
+-- Joins from listings to their address, and the city filter
+CREATE INDEX IF NOT EXISTS listings_address_id_idx
+    ON listings (address_id);
+
+CREATE INDEX IF NOT EXISTS addresses_lower_city_idx
+    ON addresses (lower(city));
+
+-- Favorites of a listing (ON DELETE CASCADE and per-listing lookups)
+CREATE INDEX IF NOT EXISTS favorites_listing_id_idx
+    ON favorites (listing_id);
+
+-- Keyset pagination of GET /users
+CREATE INDEX IF NOT EXISTS users_created_at_id_idx
+    ON users (created_at DESC, id DESC);
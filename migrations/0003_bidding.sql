@@ -0,0 +1,26 @@
+-- Denormalized bidding state on listings, kept current by create_bid, so
+-- the minimum-increment check and listing pages don't have to scan bids.
+ALTER TABLE listings
+    ADD COLUMN IF NOT EXISTS highest_bid_id INTEGER REFERENCES bids(id) ON DELETE SET NULL,
+    ADD COLUMN IF NOT EXISTS highest_bid_amount INTEGER,
+    ADD COLUMN IF NOT EXISTS bid_count INTEGER NOT NULL DEFAULT 0;
+
+ALTER TABLE bids
+    ADD COLUMN IF NOT EXISTS is_rejected BOOLEAN NOT NULL DEFAULT FALSE;
+
+UPDATE listings l
+SET highest_bid_id = top.id,
+    highest_bid_amount = top.amount,
+    bid_count = top.bid_count
+FROM (
+    SELECT DISTINCT ON (listing_id)
+        listing_id, id, amount, count(*) OVER (PARTITION BY listing_id) AS bid_count
+    FROM bids
+    ORDER BY listing_id, amount DESC, id
+) top
+WHERE top.listing_id = l.id;
+
+-- At most one accepted bid per listing, whatever code path writes it.
+CREATE UNIQUE INDEX IF NOT EXISTS bids_one_accepted_per_listing_idx
+    ON bids (listing_id)
+    WHERE is_accepted;
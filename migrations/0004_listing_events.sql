@@ -0,0 +1,61 @@
+-- Bid and status changes per listing, written by triggers so every write
+-- path emits them. Rows give SSE/WebSocket clients something to resume
+-- from (Last-Event-ID); pg_notify pushes the same row to the listening
+-- API workers once the transaction commits.
+CREATE TABLE IF NOT EXISTS listing_events (
+    id BIGSERIAL PRIMARY KEY,
+    listing_id INTEGER NOT NULL REFERENCES listings(id) ON DELETE CASCADE,
+    event_type VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS listing_events_listing_id_id_idx
+    ON listing_events (listing_id, id);
+
+CREATE OR REPLACE FUNCTION emit_listing_event(
+    p_listing_id INTEGER, p_event_type TEXT, p_payload JSONB
+) RETURNS VOID AS $$
+DECLARE
+    event listing_events;
+BEGIN
+    INSERT INTO listing_events (listing_id, event_type, payload)
+    VALUES (p_listing_id, p_event_type, p_payload)
+    RETURNING * INTO event;
+    PERFORM pg_notify('listing_events', row_to_json(event)::text);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION bids_emit_event() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM emit_listing_event(NEW.listing_id, 'bid_created', to_jsonb(NEW));
+    ELSIF NEW.is_accepted AND NOT OLD.is_accepted THEN
+        PERFORM emit_listing_event(NEW.listing_id, 'bid_accepted', to_jsonb(NEW));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS bids_emit_event ON bids;
+CREATE TRIGGER bids_emit_event
+    AFTER INSERT OR UPDATE OF is_accepted ON bids
+    FOR EACH ROW EXECUTE FUNCTION bids_emit_event();
+
+CREATE OR REPLACE FUNCTION listings_emit_status_event() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM emit_listing_event(
+        NEW.id,
+        'status_changed',
+        jsonb_build_object('listing_id', NEW.id, 'status', NEW.status, 'previous_status', OLD.status)
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS listings_emit_status_event ON listings;
+CREATE TRIGGER listings_emit_status_event
+    AFTER UPDATE OF status ON listings
+    FOR EACH ROW
+    WHEN (OLD.status IS DISTINCT FROM NEW.status)
+    EXECUTE FUNCTION listings_emit_status_event();
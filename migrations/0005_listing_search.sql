@@ -0,0 +1,94 @@
+-- Keyword search over listing title/description and address street/city.
+-- The document lives in its own table rather than on listings so the
+-- frequent bid updates to listings rows don't have to copy it around.
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS listing_search (
+    listing_id INTEGER PRIMARY KEY REFERENCES listings(id) ON DELETE CASCADE,
+    document TSVECTOR NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS listing_search_document_idx
+    ON listing_search USING GIN (document);
+
+-- Typo-tolerant street/city lookups (word_similarity, <% operator).
+CREATE INDEX IF NOT EXISTS addresses_street_city_trgm_idx
+    ON addresses USING GIN (lower(street || ' ' || city) gin_trgm_ops);
+
+-- Indexed under both configs so Swedish and English queries stem to
+-- something that is in the document.
+CREATE OR REPLACE FUNCTION listing_search_document(
+    p_title TEXT, p_description TEXT, p_street TEXT, p_city TEXT
+) RETURNS TSVECTOR AS $$
+    SELECT
+        setweight(to_tsvector('swedish', coalesce(p_title, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(p_title, '')), 'A') ||
+        setweight(to_tsvector('swedish', coalesce(p_street, '') || ' ' || coalesce(p_city, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(p_street, '') || ' ' || coalesce(p_city, '')), 'B') ||
+        setweight(to_tsvector('swedish', coalesce(p_description, '')), 'C') ||
+        setweight(to_tsvector('english', coalesce(p_description, '')), 'C');
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION refresh_listing_search(p_listing_ids INTEGER[]) RETURNS VOID AS $$
+    INSERT INTO listing_search (listing_id, document)
+    SELECT l.id, listing_search_document(l.title, l.description, a.street, a.city)
+    FROM listings l
+    JOIN addresses a ON a.id = l.address_id
+    WHERE l.id = ANY(p_listing_ids)
+    ON CONFLICT (listing_id) DO UPDATE SET document = EXCLUDED.document;
+$$ LANGUAGE sql;
+
+-- Statement-level with a transition table, so a bulk ingest refreshes
+-- every new listing in one INSERT ... SELECT.
+CREATE OR REPLACE FUNCTION listings_search_on_insert() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_listing_search(ARRAY(SELECT id FROM new_listings));
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS listings_search_on_insert ON listings;
+CREATE TRIGGER listings_search_on_insert
+    AFTER INSERT ON listings
+    REFERENCING NEW TABLE AS new_listings
+    FOR EACH STATEMENT EXECUTE FUNCTION listings_search_on_insert();
+
+CREATE OR REPLACE FUNCTION listings_search_on_update() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_listing_search(ARRAY[NEW.id]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS listings_search_on_update ON listings;
+CREATE TRIGGER listings_search_on_update
+    AFTER UPDATE OF title, description, address_id ON listings
+    FOR EACH ROW
+    WHEN (
+        OLD.title IS DISTINCT FROM NEW.title
+        OR OLD.description IS DISTINCT FROM NEW.description
+        OR OLD.address_id IS DISTINCT FROM NEW.address_id
+    )
+    EXECUTE FUNCTION listings_search_on_update();
+
+CREATE OR REPLACE FUNCTION addresses_search_on_update() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM refresh_listing_search(
+        ARRAY(SELECT id FROM listings WHERE address_id = NEW.id)
+    );
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS addresses_search_on_update ON addresses;
+CREATE TRIGGER addresses_search_on_update
+    AFTER UPDATE OF street, city ON addresses
+    FOR EACH ROW
+    WHEN (OLD.street IS DISTINCT FROM NEW.street OR OLD.city IS DISTINCT FROM NEW.city)
+    EXECUTE FUNCTION addresses_search_on_update();
+
+INSERT INTO listing_search (listing_id, document)
+SELECT l.id, listing_search_document(l.title, l.description, a.street, a.city)
+FROM listings l
+JOIN addresses a ON a.id = l.address_id
+ON CONFLICT (listing_id) DO NOTHING;
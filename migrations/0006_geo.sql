@@ -0,0 +1,31 @@
+-- Coordinates for map search. Filled by the geocoder in geocoding.py when
+-- an address is created; NULL until then, and such addresses simply don't
+-- show up on the map.
+ALTER TABLE addresses ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION;
+ALTER TABLE addresses ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION;
+
+-- Built-in point/box GiST, so bounding-box (<@) and radius prefilters are
+-- index scans without PostGIS.
+CREATE INDEX IF NOT EXISTS addresses_location_idx
+    ON addresses USING GIST (point(longitude, latitude))
+    WHERE latitude IS NOT NULL AND longitude IS NOT NULL;
+
+-- Offline geocoding: one centroid per postal code, postal_code stored
+-- upper-case without spaces ("211 11" -> "21111").
+CREATE TABLE IF NOT EXISTS postal_code_centroids (
+    country VARCHAR(255) NOT NULL,
+    postal_code VARCHAR(20) NOT NULL,
+    latitude DOUBLE PRECISION NOT NULL,
+    longitude DOUBLE PRECISION NOT NULL,
+    PRIMARY KEY (country, postal_code)
+);
+
+CREATE OR REPLACE FUNCTION haversine_km(
+    lat1 DOUBLE PRECISION, lon1 DOUBLE PRECISION,
+    lat2 DOUBLE PRECISION, lon2 DOUBLE PRECISION
+) RETURNS DOUBLE PRECISION AS $$
+    SELECT 2 * 6371.0088 * asin(sqrt(
+        sin(radians(lat2 - lat1) / 2) ^ 2
+        + cos(radians(lat1)) * cos(radians(lat2)) * sin(radians(lon2 - lon1) / 2) ^ 2
+    ));
+$$ LANGUAGE sql IMMUTABLE STRICT;
@@ -0,0 +1,106 @@
+-- Market statistics for /stats, precomputed so requests never scan
+-- listings. Rows are per (city, category); city = '' and category_id = 0
+-- are the "all cities" / "all categories" rollups. city is lower-cased so
+-- "Malmö" and "MALMÖ" land in the same row.
+
+-- Asking prices of listings currently on the market.
+CREATE MATERIALIZED VIEW IF NOT EXISTS market_price_stats AS
+SELECT
+    CASE WHEN grouping(lower(a.city)) = 1 THEN '' ELSE lower(a.city) END AS city,
+    CASE WHEN grouping(l.category_id) = 1 THEN 0 ELSE l.category_id END AS category_id,
+    count(*) AS listing_count,
+    avg(l.price)::float8 AS avg_price,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY l.price) AS median_price,
+    avg(l.price::float8 / l.living_area) FILTER (WHERE l.living_area > 0) AS avg_price_per_sqm,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY l.price::float8 / l.living_area)
+        FILTER (WHERE l.living_area > 0) AS median_price_per_sqm
+FROM listings l
+JOIN addresses a ON a.id = l.address_id
+WHERE l.status IN ('active', 'upcoming')
+GROUP BY GROUPING SETS ((lower(a.city), l.category_id), (lower(a.city)), (l.category_id), ());
+
+-- Sold listings. Days on market runs to the first status change to
+-- 'sold' in listing_events, so listings sold before events were recorded
+-- only count towards sold_count and bid-to-ask.
+CREATE MATERIALIZED VIEW IF NOT EXISTS market_sales_stats AS
+WITH sales AS (
+    SELECT
+        lower(a.city) AS city,
+        l.category_id,
+        l.price,
+        b.amount AS sale_price,
+        extract(epoch FROM sold.sold_at - l.created_at)::float8 / 86400 AS days_on_market
+    FROM listings l
+    JOIN addresses a ON a.id = l.address_id
+    LEFT JOIN bids b ON b.listing_id = l.id AND b.is_accepted
+    LEFT JOIN LATERAL (
+        SELECT min(e.created_at) AS sold_at
+        FROM listing_events e
+        WHERE e.listing_id = l.id
+            AND e.event_type = 'status_changed'
+            AND e.payload->>'status' = 'sold'
+    ) sold ON TRUE
+    WHERE l.status = 'sold'
+)
+SELECT
+    CASE WHEN grouping(city) = 1 THEN '' ELSE city END AS city,
+    CASE WHEN grouping(category_id) = 1 THEN 0 ELSE category_id END AS category_id,
+    count(*) AS sold_count,
+    avg(days_on_market) AS avg_days_on_market,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY days_on_market) AS median_days_on_market,
+    avg(sale_price)::float8 AS avg_sale_price,
+    avg(sale_price::float8 / price) FILTER (WHERE price > 0) AS avg_bid_to_ask,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY sale_price::float8 / price)
+        FILTER (WHERE price > 0) AS median_bid_to_ask
+FROM sales
+GROUP BY GROUPING SETS ((city, category_id), (city), (category_id), ());
+
+-- REFRESH ... CONCURRENTLY needs a unique index on plain columns.
+CREATE UNIQUE INDEX IF NOT EXISTS market_price_stats_key
+    ON market_price_stats (city, category_id);
+CREATE UNIQUE INDEX IF NOT EXISTS market_sales_stats_key
+    ON market_sales_stats (city, category_id);
+
+-- One row per view. Writes that can change a view set dirty; stats.py
+-- only refreshes views that are dirty.
+CREATE TABLE IF NOT EXISTS stats_refresh_state (
+    view_name VARCHAR(100) PRIMARY KEY,
+    dirty BOOLEAN NOT NULL DEFAULT FALSE,
+    refreshed_at TIMESTAMPTZ,
+    refresh_ms DOUBLE PRECISION
+);
+
+INSERT INTO stats_refresh_state (view_name, refreshed_at)
+VALUES ('market_price_stats', NOW()), ('market_sales_stats', NOW())
+ON CONFLICT (view_name) DO NOTHING;
+
+-- Statement-level, and "AND NOT dirty" so once a view is dirty further
+-- writes only read the row instead of queueing on its lock.
+CREATE OR REPLACE FUNCTION mark_stats_dirty() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE stats_refresh_state
+    SET dirty = TRUE
+    WHERE view_name = ANY(TG_ARGV) AND NOT dirty;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Column lists keep the bid hot path (highest_bid_*, bid_count) out of it.
+DROP TRIGGER IF EXISTS listings_mark_stats_dirty ON listings;
+CREATE TRIGGER listings_mark_stats_dirty
+    AFTER INSERT OR DELETE OR UPDATE OF price, living_area, status, category_id, address_id
+    ON listings
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION mark_stats_dirty('market_price_stats', 'market_sales_stats');
+
+DROP TRIGGER IF EXISTS addresses_mark_stats_dirty ON addresses;
+CREATE TRIGGER addresses_mark_stats_dirty
+    AFTER UPDATE OF city ON addresses
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION mark_stats_dirty('market_price_stats', 'market_sales_stats');
+
+DROP TRIGGER IF EXISTS bids_mark_stats_dirty ON bids;
+CREATE TRIGGER bids_mark_stats_dirty
+    AFTER DELETE OR UPDATE OF amount, is_accepted ON bids
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION mark_stats_dirty('market_sales_stats');
@@ -0,0 +1,108 @@
+-- Per-agent rating aggregates, maintained in the same transaction as every
+-- review write, so rankings and averages never scan agent_reviews.
+-- agency_id is copied from users so top agents per agency is one index
+-- range over this table.
+CREATE TABLE IF NOT EXISTS agent_ratings (
+    agent_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+    agency_id INTEGER REFERENCES real_estate_agencies(id),
+    rating_count INTEGER NOT NULL DEFAULT 0,
+    rating_sum INTEGER NOT NULL DEFAULT 0,
+    rating_1 INTEGER NOT NULL DEFAULT 0,
+    rating_2 INTEGER NOT NULL DEFAULT 0,
+    rating_3 INTEGER NOT NULL DEFAULT 0,
+    rating_4 INTEGER NOT NULL DEFAULT 0,
+    rating_5 INTEGER NOT NULL DEFAULT 0,
+    average_rating DOUBLE PRECISION GENERATED ALWAYS AS (
+        CASE WHEN rating_count > 0 THEN rating_sum::float8 / rating_count END
+    ) STORED
+);
+
+CREATE INDEX IF NOT EXISTS agent_ratings_agency_rank_idx
+    ON agent_ratings (agency_id, average_rating DESC, rating_count DESC, agent_id)
+    WHERE rating_count > 0;
+
+-- Newest-first keyset pages of one agent's reviews.
+CREATE INDEX IF NOT EXISTS agent_reviews_agent_keyset_idx
+    ON agent_reviews (agent_id, created_at DESC, id DESC);
+
+-- p_delta is +1 when a rating is added and -1 when it is removed.
+CREATE OR REPLACE FUNCTION apply_agent_rating(
+    p_agent_id INTEGER, p_rating INTEGER, p_delta INTEGER
+) RETURNS VOID AS $$
+    INSERT INTO agent_ratings AS r (
+        agent_id, agency_id, rating_count, rating_sum,
+        rating_1, rating_2, rating_3, rating_4, rating_5
+    )
+    SELECT
+        u.id, u.agency_id, p_delta, p_delta * p_rating,
+        CASE WHEN p_rating = 1 THEN p_delta ELSE 0 END,
+        CASE WHEN p_rating = 2 THEN p_delta ELSE 0 END,
+        CASE WHEN p_rating = 3 THEN p_delta ELSE 0 END,
+        CASE WHEN p_rating = 4 THEN p_delta ELSE 0 END,
+        CASE WHEN p_rating = 5 THEN p_delta ELSE 0 END
+    FROM users u
+    WHERE u.id = p_agent_id
+    ON CONFLICT (agent_id) DO UPDATE SET
+        rating_count = r.rating_count + EXCLUDED.rating_count,
+        rating_sum = r.rating_sum + EXCLUDED.rating_sum,
+        rating_1 = r.rating_1 + EXCLUDED.rating_1,
+        rating_2 = r.rating_2 + EXCLUDED.rating_2,
+        rating_3 = r.rating_3 + EXCLUDED.rating_3,
+        rating_4 = r.rating_4 + EXCLUDED.rating_4,
+        rating_5 = r.rating_5 + EXCLUDED.rating_5;
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION agent_reviews_apply_rating() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_agent_rating(OLD.agent_id, OLD.rating, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_agent_rating(NEW.agent_id, NEW.rating, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS agent_reviews_apply_rating ON agent_reviews;
+CREATE TRIGGER agent_reviews_apply_rating
+    AFTER INSERT OR DELETE OR UPDATE OF agent_id, rating ON agent_reviews
+    FOR EACH ROW EXECUTE FUNCTION agent_reviews_apply_rating();
+
+CREATE OR REPLACE FUNCTION users_sync_agent_rating_agency() RETURNS TRIGGER AS $$
+BEGIN
+    UPDATE agent_ratings SET agency_id = NEW.agency_id WHERE agent_id = NEW.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_sync_agent_rating_agency ON users;
+CREATE TRIGGER users_sync_agent_rating_agency
+    AFTER UPDATE OF agency_id ON users
+    FOR EACH ROW
+    WHEN (OLD.agency_id IS DISTINCT FROM NEW.agency_id)
+    EXECUTE FUNCTION users_sync_agent_rating_agency();
+
+INSERT INTO agent_ratings AS r (
+    agent_id, agency_id, rating_count, rating_sum,
+    rating_1, rating_2, rating_3, rating_4, rating_5
+)
+SELECT
+    u.id, u.agency_id, count(*), sum(ar.rating),
+    count(*) FILTER (WHERE ar.rating = 1),
+    count(*) FILTER (WHERE ar.rating = 2),
+    count(*) FILTER (WHERE ar.rating = 3),
+    count(*) FILTER (WHERE ar.rating = 4),
+    count(*) FILTER (WHERE ar.rating = 5)
+FROM agent_reviews ar
+JOIN users u ON u.id = ar.agent_id
+GROUP BY u.id
+ON CONFLICT (agent_id) DO UPDATE SET
+    agency_id = EXCLUDED.agency_id,
+    rating_count = EXCLUDED.rating_count,
+    rating_sum = EXCLUDED.rating_sum,
+    rating_1 = EXCLUDED.rating_1,
+    rating_2 = EXCLUDED.rating_2,
+    rating_3 = EXCLUDED.rating_3,
+    rating_4 = EXCLUDED.rating_4,
+    rating_5 = EXCLUDED.rating_5;
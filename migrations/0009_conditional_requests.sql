@@ -0,0 +1,128 @@
+-- Versions for HTTP conditional requests (ETag / Last-Modified).
+--
+-- updated_at on listings and users is set by the database on every UPDATE
+-- that changes the row, so no write path (API, db.py, bid bumps from
+-- create_bid, status changes from accept_bid) can forget it. It never goes
+-- backwards, even when a transaction that started earlier commits later,
+-- so it is usable both as Last-Modified and as an ETag.
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at := GREATEST(clock_timestamp(), OLD.updated_at + INTERVAL '1 microsecond');
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS listings_set_updated_at ON listings;
+CREATE TRIGGER listings_set_updated_at
+    BEFORE UPDATE ON listings
+    FOR EACH ROW
+    WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS users_set_updated_at ON users;
+CREATE TRIGGER users_set_updated_at
+    BEFORE UPDATE ON users
+    FOR EACH ROW
+    WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION set_updated_at();
+
+-- Collections have no row of their own to carry an updated_at, and a
+-- max(updated_at) over their members misses deletions. Each one gets a
+-- row here instead, bumped by statement-level triggers on its members:
+--   listing_images  owner_id = listing id
+--   user_favorites  owner_id = user id
+--   categories      owner_id = 0
+CREATE TABLE IF NOT EXISTS collection_versions (
+    collection VARCHAR(50) NOT NULL,
+    owner_id INTEGER NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (collection, owner_id)
+);
+
+CREATE OR REPLACE FUNCTION touch_collection(
+    p_collection TEXT, p_owner_ids INTEGER[]
+) RETURNS VOID AS $$
+    -- Sorted so concurrent statements lock version rows in the same order.
+    INSERT INTO collection_versions AS v (collection, owner_id, updated_at)
+    SELECT p_collection, owner_id, clock_timestamp()
+    FROM (SELECT DISTINCT unnest(p_owner_ids) AS owner_id) o
+    ORDER BY owner_id
+    ON CONFLICT (collection, owner_id) DO UPDATE
+    SET updated_at = GREATEST(EXCLUDED.updated_at, v.updated_at + INTERVAL '1 microsecond');
+$$ LANGUAGE sql;
+
+-- TG_ARGV: collection name, owner column. Fired with the changed rows as
+-- new_rows (INSERT, UPDATE) and/or old_rows (DELETE, UPDATE).
+CREATE OR REPLACE FUNCTION touch_collection_rows() RETURNS TRIGGER AS $$
+DECLARE
+    owner_ids INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        EXECUTE format('SELECT array_agg(%I) FROM new_rows', TG_ARGV[1]) INTO owner_ids;
+    ELSIF TG_OP = 'DELETE' THEN
+        EXECUTE format('SELECT array_agg(%I) FROM old_rows', TG_ARGV[1]) INTO owner_ids;
+    ELSE
+        EXECUTE format(
+            'SELECT array_agg(%1$I) FROM'
+            ' (SELECT %1$I FROM new_rows UNION SELECT %1$I FROM old_rows) c',
+            TG_ARGV[1]
+        ) INTO owner_ids;
+    END IF;
+    IF owner_ids IS NOT NULL THEN
+        PERFORM touch_collection(TG_ARGV[0], owner_ids);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS images_touch_on_insert ON images;
+CREATE TRIGGER images_touch_on_insert
+    AFTER INSERT ON images
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_collection_rows('listing_images', 'listing_id');
+
+DROP TRIGGER IF EXISTS images_touch_on_update ON images;
+CREATE TRIGGER images_touch_on_update
+    AFTER UPDATE ON images
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_collection_rows('listing_images', 'listing_id');
+
+DROP TRIGGER IF EXISTS images_touch_on_delete ON images;
+CREATE TRIGGER images_touch_on_delete
+    AFTER DELETE ON images
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_collection_rows('listing_images', 'listing_id');
+
+DROP TRIGGER IF EXISTS favorites_touch_on_insert ON favorites;
+CREATE TRIGGER favorites_touch_on_insert
+    AFTER INSERT ON favorites
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_collection_rows('user_favorites', 'user_id');
+
+DROP TRIGGER IF EXISTS favorites_touch_on_delete ON favorites;
+CREATE TRIGGER favorites_touch_on_delete
+    AFTER DELETE ON favorites
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_collection_rows('user_favorites', 'user_id');
+
+-- The category list is a single collection; no transition table needed.
+CREATE OR REPLACE FUNCTION touch_categories() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM touch_collection('categories', ARRAY[0]);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS listing_categories_touch ON listing_categories;
+CREATE TRIGGER listing_categories_touch
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON listing_categories
+    FOR EACH STATEMENT EXECUTE FUNCTION touch_categories();
+
+-- Start every existing collection at the time of the migration.
+INSERT INTO collection_versions (collection, owner_id)
+SELECT DISTINCT 'listing_images', listing_id FROM images
+UNION ALL
+SELECT DISTINCT 'user_favorites', user_id FROM favorites
+UNION ALL
+SELECT 'categories', 0
+ON CONFLICT (collection, owner_id) DO NOTHING;
@@ -0,0 +1,179 @@
+-- Saved searches and the per-user alert feed they fill.
+--
+-- A saved search is a /listings filter set. Instead of rerunning every
+-- search when a listing changes, each search is posted into an inverted
+-- index under its city, category and the price buckets its range covers,
+-- with '' / 0 / -1 standing for "any". A listing then only has to probe
+-- the at most 8 index entries its own city, category and price fall
+-- under, and the few candidate searches are checked against their exact
+-- bounds.
+CREATE TABLE IF NOT EXISTS saved_searches (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    name VARCHAR(255) NOT NULL,
+    city VARCHAR(255),
+    category_id INTEGER REFERENCES listing_categories(id) ON DELETE CASCADE,
+    min_price INTEGER,
+    max_price INTEGER,
+    rooms INTEGER,
+    min_living_area INTEGER,
+    max_living_area INTEGER,
+    agency_id INTEGER REFERENCES real_estate_agencies(id) ON DELETE CASCADE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    CHECK (min_price IS NULL OR max_price IS NULL OR min_price <= max_price)
+);
+
+CREATE INDEX IF NOT EXISTS saved_searches_user_id_idx ON saved_searches (user_id);
+
+-- Two buckets per doubling of the price, so a typical range spans a
+-- handful of them and an open-ended one a few dozen.
+CREATE OR REPLACE FUNCTION price_bucket(p_price INTEGER) RETURNS INTEGER AS $$
+    SELECT floor(2 * ln(greatest(p_price, 1)::float8) / ln(2))::int;
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE TABLE IF NOT EXISTS saved_search_terms (
+    city VARCHAR(255) NOT NULL,
+    category_id INTEGER NOT NULL,
+    price_bucket INTEGER NOT NULL,
+    saved_search_id INTEGER NOT NULL REFERENCES saved_searches(id) ON DELETE CASCADE,
+    PRIMARY KEY (city, category_id, price_bucket, saved_search_id)
+);
+
+CREATE INDEX IF NOT EXISTS saved_search_terms_saved_search_id_idx
+    ON saved_search_terms (saved_search_id);
+
+CREATE OR REPLACE FUNCTION saved_searches_index() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' THEN
+        DELETE FROM saved_search_terms WHERE saved_search_id = NEW.id;
+    END IF;
+    INSERT INTO saved_search_terms (city, category_id, price_bucket, saved_search_id)
+    SELECT coalesce(lower(NEW.city), ''), coalesce(NEW.category_id, 0), bucket, NEW.id
+    FROM generate_series(
+        CASE WHEN NEW.min_price IS NULL AND NEW.max_price IS NULL THEN -1
+             ELSE price_bucket(coalesce(NEW.min_price, 0)) END,
+        CASE WHEN NEW.min_price IS NULL AND NEW.max_price IS NULL THEN -1
+             ELSE price_bucket(coalesce(NEW.max_price, 2147483647)) END
+    ) bucket;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS saved_searches_index ON saved_searches;
+CREATE TRIGGER saved_searches_index
+    AFTER INSERT OR UPDATE ON saved_searches
+    FOR EACH ROW EXECUTE FUNCTION saved_searches_index();
+
+-- Searches a listing with these values matches. Only listings buyers can
+-- act on (active, upcoming) match anything.
+CREATE OR REPLACE FUNCTION saved_search_matches(
+    p_city TEXT,
+    p_category_id INTEGER,
+    p_price INTEGER,
+    p_rooms INTEGER,
+    p_living_area INTEGER,
+    p_agency_id INTEGER,
+    p_status TEXT
+) RETURNS TABLE (saved_search_id INTEGER, user_id INTEGER) AS $$
+    SELECT s.id, s.user_id
+    FROM saved_search_terms t
+    JOIN saved_searches s ON s.id = t.saved_search_id
+    WHERE p_status IN ('active', 'upcoming')
+      AND t.city = ANY (ARRAY[lower(p_city), ''])
+      AND t.category_id = ANY (ARRAY[p_category_id, 0])
+      AND t.price_bucket = ANY (ARRAY[price_bucket(p_price), -1])
+      AND (s.min_price IS NULL OR p_price >= s.min_price)
+      AND (s.max_price IS NULL OR p_price <= s.max_price)
+      AND (s.rooms IS NULL OR p_rooms = s.rooms)
+      AND (s.min_living_area IS NULL OR p_living_area >= s.min_living_area)
+      AND (s.max_living_area IS NULL OR p_living_area <= s.max_living_area)
+      AND (s.agency_id IS NULL OR p_agency_id = s.agency_id);
+$$ LANGUAGE sql STABLE;
+
+-- One alert per search and listing, however often the listing changes.
+CREATE TABLE IF NOT EXISTS saved_search_alerts (
+    id BIGSERIAL PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id) ON DELETE CASCADE,
+    saved_search_id INTEGER NOT NULL REFERENCES saved_searches(id) ON DELETE CASCADE,
+    listing_id INTEGER NOT NULL REFERENCES listings(id) ON DELETE CASCADE,
+    reason VARCHAR(50) NOT NULL CHECK (reason IN ('created', 'updated')),
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    UNIQUE (saved_search_id, listing_id)
+);
+
+CREATE INDEX IF NOT EXISTS saved_search_alerts_user_id_created_at_id_idx
+    ON saved_search_alerts (user_id, created_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS saved_search_alerts_listing_id_idx
+    ON saved_search_alerts (listing_id);
+
+-- Statement-level so bulk ingest and the seeder match a whole batch in
+-- one join, and skip it entirely while nobody has saved a search.
+CREATE OR REPLACE FUNCTION listings_match_created() RETURNS TRIGGER AS $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM saved_searches) THEN
+        RETURN NULL;
+    END IF;
+    INSERT INTO saved_search_alerts (user_id, saved_search_id, listing_id, reason)
+    SELECT m.user_id, m.saved_search_id, n.id, 'created'
+    FROM new_rows n
+    JOIN addresses a ON a.id = n.address_id
+    CROSS JOIN LATERAL saved_search_matches(
+        a.city, n.category_id, n.price, n.rooms, n.living_area, n.agency_id, n.status
+    ) m
+    ON CONFLICT (saved_search_id, listing_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS listings_match_created ON listings;
+CREATE TRIGGER listings_match_created
+    AFTER INSERT ON listings
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION listings_match_created();
+
+-- An update only alerts searches the listing didn't already match, e.g.
+-- a price cut into someone's range or archived -> active.
+CREATE OR REPLACE FUNCTION listings_match_updated() RETURNS TRIGGER AS $$
+DECLARE
+    old_city TEXT;
+    new_city TEXT;
+BEGIN
+    SELECT city INTO new_city FROM addresses WHERE id = NEW.address_id;
+    IF OLD.address_id = NEW.address_id THEN
+        old_city := new_city;
+    ELSE
+        SELECT city INTO old_city FROM addresses WHERE id = OLD.address_id;
+    END IF;
+    INSERT INTO saved_search_alerts (user_id, saved_search_id, listing_id, reason)
+    SELECT m.user_id, m.saved_search_id, NEW.id, 'updated'
+    FROM (
+        SELECT * FROM saved_search_matches(
+            new_city, NEW.category_id, NEW.price, NEW.rooms,
+            NEW.living_area, NEW.agency_id, NEW.status
+        )
+        EXCEPT
+        SELECT * FROM saved_search_matches(
+            old_city, OLD.category_id, OLD.price, OLD.rooms,
+            OLD.living_area, OLD.agency_id, OLD.status
+        )
+    ) m
+    ON CONFLICT (saved_search_id, listing_id) DO NOTHING;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Row-level with a WHEN clause so the updates that don't touch search
+-- criteria (bid bumps, title edits) never call the function.
+DROP TRIGGER IF EXISTS listings_match_updated ON listings;
+CREATE TRIGGER listings_match_updated
+    AFTER UPDATE OF price, status, category_id, address_id, rooms, living_area, agency_id
+    ON listings
+    FOR EACH ROW
+    WHEN (
+        (OLD.price, OLD.status, OLD.category_id, OLD.address_id,
+         OLD.rooms, OLD.living_area, OLD.agency_id)
+        IS DISTINCT FROM
+        (NEW.price, NEW.status, NEW.category_id, NEW.address_id,
+         NEW.rooms, NEW.living_area, NEW.agency_id)
+    )
+    EXECUTE FUNCTION listings_match_updated();
@@ -0,0 +1,51 @@
+-- How many users have saved each listing, kept by triggers on favorites
+-- in the same transaction as the insert/delete. A table of its own rather
+-- than a column on listings: updating listings would move updated_at (and
+-- so the listing's ETag) on every heart, and queue behind bids for the
+-- row lock.
+CREATE TABLE IF NOT EXISTS listing_favorite_counts (
+    listing_id INTEGER PRIMARY KEY REFERENCES listings(id) ON DELETE CASCADE,
+    favorite_count INTEGER NOT NULL DEFAULT 0 CHECK (favorite_count >= 0)
+);
+
+INSERT INTO listing_favorite_counts (listing_id, favorite_count)
+SELECT listing_id, count(*) FROM favorites GROUP BY listing_id
+ON CONFLICT (listing_id) DO UPDATE SET favorite_count = EXCLUDED.favorite_count;
+
+-- Statement-level, one upsert per listing touched. Sorted so concurrent
+-- statements lock count rows in the same order.
+CREATE OR REPLACE FUNCTION favorites_count() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        INSERT INTO listing_favorite_counts AS c (listing_id, favorite_count)
+        SELECT listing_id, count(*) FROM new_rows GROUP BY listing_id ORDER BY listing_id
+        ON CONFLICT (listing_id) DO UPDATE
+        SET favorite_count = c.favorite_count + EXCLUDED.favorite_count;
+    ELSE
+        UPDATE listing_favorite_counts c
+        SET favorite_count = c.favorite_count - removed.favorite_count
+        FROM (
+            SELECT listing_id, count(*) AS favorite_count FROM old_rows GROUP BY listing_id
+        ) removed
+        WHERE c.listing_id = removed.listing_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS favorites_count_on_insert ON favorites;
+CREATE TRIGGER favorites_count_on_insert
+    AFTER INSERT ON favorites
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION favorites_count();
+
+DROP TRIGGER IF EXISTS favorites_count_on_delete ON favorites;
+CREATE TRIGGER favorites_count_on_delete
+    AFTER DELETE ON favorites
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION favorites_count();
+
+-- GET /users/{id}/favorites/ids pages a user's favorites newest first
+-- without touching listings.
+CREATE INDEX IF NOT EXISTS favorites_user_id_created_at_listing_id_idx
+    ON favorites (user_id, created_at DESC, listing_id DESC);
@@ -0,0 +1,130 @@
+-- Viewing scheduling: no two live viewings of a listing, or of an agent,
+-- may overlap, and registrations stop at the viewing's capacity. Both are
+-- enforced here, so no write path can double-book or overfill.
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE viewings
+    ADD COLUMN IF NOT EXISTS agent_id INTEGER REFERENCES users(id),
+    ADD COLUMN IF NOT EXISTS capacity INTEGER NOT NULL DEFAULT 10,
+    ADD COLUMN IF NOT EXISTS registration_count INTEGER NOT NULL DEFAULT 0,
+    ADD COLUMN IF NOT EXISTS cancelled_at TIMESTAMPTZ;
+
+-- The listing's agent runs the viewing unless another one is named, and
+-- an open-ended viewing books an hour, so every viewing has a finite
+-- range to check against.
+UPDATE viewings v
+SET agent_id = l.agent_id
+FROM listings l
+WHERE l.id = v.listing_id AND v.agent_id IS NULL;
+
+UPDATE viewings SET end_time = start_time + INTERVAL '1 hour' WHERE end_time IS NULL;
+
+UPDATE viewings v
+SET registration_count = r.registration_count,
+    capacity = GREATEST(v.capacity, r.registration_count)
+FROM (
+    SELECT viewing_id, count(*) AS registration_count
+    FROM viewing_registrations
+    GROUP BY viewing_id
+) r
+WHERE r.viewing_id = v.id;
+
+ALTER TABLE viewings
+    ALTER COLUMN agent_id SET NOT NULL,
+    ALTER COLUMN end_time SET NOT NULL;
+
+ALTER TABLE viewings DROP CONSTRAINT IF EXISTS viewings_capacity_check;
+ALTER TABLE viewings ADD CONSTRAINT viewings_capacity_check
+    CHECK (capacity > 0 AND registration_count BETWEEN 0 AND capacity);
+
+CREATE OR REPLACE FUNCTION viewings_defaults() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.agent_id IS NULL THEN
+        SELECT agent_id INTO NEW.agent_id FROM listings WHERE id = NEW.listing_id;
+    END IF;
+    IF NEW.end_time IS NULL THEN
+        NEW.end_time := NEW.start_time + INTERVAL '1 hour';
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS viewings_defaults ON viewings;
+CREATE TRIGGER viewings_defaults
+    BEFORE INSERT ON viewings
+    FOR EACH ROW EXECUTE FUNCTION viewings_defaults();
+
+-- Existing double bookings would stop the constraints below from being
+-- created. Keep the earliest-booked viewing of each clash and cancel the
+-- rest rather than deleting them, so they can be found and rebooked.
+-- Inserting in booking order into a table with the same constraints, and
+-- skipping what conflicts, picks the viewings to keep.
+CREATE TEMPORARY TABLE kept_viewings (
+    id INTEGER PRIMARY KEY,
+    listing_id INTEGER NOT NULL,
+    agent_id INTEGER NOT NULL,
+    period TSTZRANGE NOT NULL,
+    EXCLUDE USING gist (listing_id WITH =, period WITH &&),
+    EXCLUDE USING gist (agent_id WITH =, period WITH &&)
+);
+
+INSERT INTO kept_viewings (id, listing_id, agent_id, period)
+SELECT id, listing_id, agent_id, tstzrange(start_time, end_time)
+FROM viewings
+WHERE cancelled_at IS NULL
+ORDER BY created_at, id
+ON CONFLICT DO NOTHING;
+
+UPDATE viewings v
+SET cancelled_at = NOW()
+WHERE v.cancelled_at IS NULL
+  AND NOT EXISTS (SELECT 1 FROM kept_viewings k WHERE k.id = v.id);
+
+DROP TABLE kept_viewings;
+
+-- Cancelled viewings free their slot. The agent constraint's index also
+-- serves the agent calendar (agent_id = $1 AND range && $2).
+ALTER TABLE viewings DROP CONSTRAINT IF EXISTS viewings_no_listing_overlap;
+ALTER TABLE viewings ADD CONSTRAINT viewings_no_listing_overlap
+    EXCLUDE USING gist (listing_id WITH =, tstzrange(start_time, end_time) WITH &&)
+    WHERE (cancelled_at IS NULL);
+
+ALTER TABLE viewings DROP CONSTRAINT IF EXISTS viewings_no_agent_overlap;
+ALTER TABLE viewings ADD CONSTRAINT viewings_no_agent_overlap
+    EXCLUDE USING gist (agent_id WITH =, tstzrange(start_time, end_time) WITH &&)
+    WHERE (cancelled_at IS NULL);
+
+-- registration_count follows viewing_registrations in the same
+-- transaction; with the check above, an insert past capacity fails.
+CREATE OR REPLACE FUNCTION viewing_registrations_count() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        UPDATE viewings v
+        SET registration_count = v.registration_count + added.registration_count
+        FROM (
+            SELECT viewing_id, count(*) AS registration_count FROM new_rows GROUP BY viewing_id
+        ) added
+        WHERE v.id = added.viewing_id;
+    ELSE
+        UPDATE viewings v
+        SET registration_count = v.registration_count - removed.registration_count
+        FROM (
+            SELECT viewing_id, count(*) AS registration_count FROM old_rows GROUP BY viewing_id
+        ) removed
+        WHERE v.id = removed.viewing_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS viewing_registrations_count_on_insert ON viewing_registrations;
+CREATE TRIGGER viewing_registrations_count_on_insert
+    AFTER INSERT ON viewing_registrations
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION viewing_registrations_count();
+
+DROP TRIGGER IF EXISTS viewing_registrations_count_on_delete ON viewing_registrations;
+CREATE TRIGGER viewing_registrations_count_on_delete
+    AFTER DELETE ON viewing_registrations
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION viewing_registrations_count();
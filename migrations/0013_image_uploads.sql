@@ -0,0 +1,16 @@
+-- Uploaded images. The original lives in object storage under storage_key;
+-- its thumbnail and WebP variants are made off the request path and
+-- recorded in variants as {name: {url, width, height, media_type}}.
+-- Images added by URL have no storage_key and nothing to process, so they
+-- start (and stay) 'ready'.
+ALTER TABLE images
+    ADD COLUMN IF NOT EXISTS storage_key TEXT,
+    ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'ready',
+    ADD COLUMN IF NOT EXISTS variants JSONB NOT NULL DEFAULT '{}';
+
+ALTER TABLE images DROP CONSTRAINT IF EXISTS images_status_check;
+ALTER TABLE images ADD CONSTRAINT images_status_check
+    CHECK (status IN ('pending', 'ready', 'failed'));
+
+-- The processor picks up uploads left pending by a restart from here.
+CREATE INDEX IF NOT EXISTS images_pending_idx ON images (id) WHERE status = 'pending';
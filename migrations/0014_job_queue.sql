@@ -0,0 +1,94 @@
+-- Durable job queue for work that shouldn't run inside a request. A job is
+-- inserted in the same transaction as the write that needs it, so it
+-- exists exactly when that write commits; python worker.py claims jobs
+-- with FOR UPDATE SKIP LOCKED, so any number of workers can poll the same
+-- table without handing one job to two of them or waiting on each other.
+CREATE TABLE IF NOT EXISTS jobs (
+    id BIGSERIAL PRIMARY KEY,
+    queue VARCHAR(50) NOT NULL DEFAULT 'default',
+    task VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'queued'
+        CHECK (status IN ('queued', 'running', 'done', 'failed')),
+    -- Not claimed before this; scheduled jobs and retries set it ahead.
+    run_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5 CHECK (max_attempts > 0),
+    -- At most one queued or running job per key, e.g. per recurring job.
+    dedupe_key TEXT,
+    last_error TEXT,
+    locked_by TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ
+);
+
+-- Claiming: the oldest due jobs of the queues a worker serves.
+CREATE INDEX IF NOT EXISTS jobs_queued_run_at_idx
+    ON jobs (run_at, id) WHERE status = 'queued';
+-- Requeueing jobs whose worker died mid-run.
+CREATE INDEX IF NOT EXISTS jobs_running_started_at_idx
+    ON jobs (started_at) WHERE status = 'running';
+-- Pruning finished jobs and the latency figures in job_queue_stats.
+CREATE INDEX IF NOT EXISTS jobs_finished_at_idx
+    ON jobs (finished_at) WHERE status IN ('done', 'failed');
+CREATE UNIQUE INDEX IF NOT EXISTS jobs_dedupe_key_idx
+    ON jobs (dedupe_key) WHERE status IN ('queued', 'running');
+
+-- Wakes idle workers as soon as a job commits instead of at their next
+-- poll. Once per statement, not per job.
+CREATE OR REPLACE FUNCTION jobs_notify() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('jobs', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS jobs_notify ON jobs;
+CREATE TRIGGER jobs_notify
+    AFTER INSERT ON jobs
+    FOR EACH STATEMENT EXECUTE FUNCTION jobs_notify();
+
+-- Recurring jobs, registered by the worker at startup. Whichever worker
+-- finds one due first enqueues it and moves next_run_at on; a run still
+-- queued or running is not doubled up (dedupe_key 'recurring:<name>').
+CREATE TABLE IF NOT EXISTS recurring_jobs (
+    name VARCHAR(100) PRIMARY KEY,
+    queue VARCHAR(50) NOT NULL DEFAULT 'default',
+    task VARCHAR(100) NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}',
+    every INTERVAL NOT NULL CHECK (every > INTERVAL '0'),
+    next_run_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Queue depth and latency per queue and task. wait is run_at to
+-- started_at (how long a due job sat in the queue), run is started_at to
+-- finished_at; both over the jobs finished in the last hour.
+CREATE OR REPLACE VIEW job_queue_stats AS
+SELECT
+    queue,
+    task,
+    count(*) FILTER (WHERE status = 'queued' AND run_at <= NOW()) AS ready,
+    count(*) FILTER (WHERE status = 'queued' AND run_at > NOW()) AS scheduled,
+    count(*) FILTER (WHERE status = 'running') AS running,
+    count(*) FILTER (WHERE status = 'failed') AS failed,
+    extract(epoch FROM NOW() - min(run_at) FILTER (
+        WHERE status = 'queued' AND run_at <= NOW()
+    ))::float8 AS oldest_ready_s,
+    count(*) FILTER (
+        WHERE status = 'done' AND finished_at > NOW() - INTERVAL '1 hour'
+    ) AS done_last_hour,
+    percentile_cont(0.5) WITHIN GROUP (
+        ORDER BY extract(epoch FROM started_at - run_at) * 1000
+    ) FILTER (WHERE status = 'done' AND finished_at > NOW() - INTERVAL '1 hour') AS wait_p50_ms,
+    percentile_cont(0.95) WITHIN GROUP (
+        ORDER BY extract(epoch FROM started_at - run_at) * 1000
+    ) FILTER (WHERE status = 'done' AND finished_at > NOW() - INTERVAL '1 hour') AS wait_p95_ms,
+    percentile_cont(0.5) WITHIN GROUP (
+        ORDER BY extract(epoch FROM finished_at - started_at) * 1000
+    ) FILTER (WHERE status = 'done' AND finished_at > NOW() - INTERVAL '1 hour') AS run_p50_ms,
+    percentile_cont(0.95) WITHIN GROUP (
+        ORDER BY extract(epoch FROM finished_at - started_at) * 1000
+    ) FILTER (WHERE status = 'done' AND finished_at > NOW() - INTERVAL '1 hour') AS run_p95_ms
+FROM jobs
+GROUP BY queue, task;
@@ -0,0 +1,38 @@
+-- Tells every API process which cache entries (cache.py) a write made
+-- stale, whatever did the write: async_db, db.py bulk ingest, the worker,
+-- a trigger or a psql session. The payload is '<namespace>:<key>', sent
+-- on commit; Postgres drops duplicates within a transaction.
+CREATE OR REPLACE FUNCTION notify_cache_invalidation() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_ARGV[0] = 'listing' THEN
+        PERFORM pg_notify('cache_invalidation', 'listing:' || id)
+        FROM (SELECT DISTINCT id FROM old_rows) changed;
+    ELSE
+        PERFORM pg_notify('cache_invalidation', TG_ARGV[0] || ':all');
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- New listings have nothing cached yet, so only updates and deletes.
+DROP TRIGGER IF EXISTS listings_invalidate_cache_on_update ON listings;
+CREATE TRIGGER listings_invalidate_cache_on_update
+    AFTER UPDATE ON listings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_invalidation('listing');
+
+DROP TRIGGER IF EXISTS listings_invalidate_cache_on_delete ON listings;
+CREATE TRIGGER listings_invalidate_cache_on_delete
+    AFTER DELETE ON listings
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_invalidation('listing');
+
+DROP TRIGGER IF EXISTS listing_categories_invalidate_cache ON listing_categories;
+CREATE TRIGGER listing_categories_invalidate_cache
+    AFTER INSERT OR UPDATE OR DELETE ON listing_categories
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_invalidation('categories');
+
+DROP TRIGGER IF EXISTS real_estate_agencies_invalidate_cache ON real_estate_agencies;
+CREATE TRIGGER real_estate_agencies_invalidate_cache
+    AFTER INSERT OR UPDATE OR DELETE ON real_estate_agencies
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_cache_invalidation('agencies');
@@ -0,0 +1,68 @@
+-- listing_events only has to reach back as far as a disconnected client
+-- may resume from (Last-Event-ID), so jobs.py prunes it past
+-- LISTING_EVENT_RETENTION_DAYS. Days on market used to be read from the
+-- first 'sold' event; it is recorded on the listing instead, so pruning
+-- loses nothing market_sales_stats needs.
+ALTER TABLE listings ADD COLUMN IF NOT EXISTS sold_at TIMESTAMPTZ;
+
+UPDATE listings l
+SET sold_at = sold.sold_at
+FROM (
+    SELECT listing_id, min(created_at) AS sold_at
+    FROM listing_events
+    WHERE event_type = 'status_changed' AND payload->>'status' = 'sold'
+    GROUP BY listing_id
+) sold
+WHERE sold.listing_id = l.id AND l.sold_at IS NULL;
+
+-- The first time a listing is sold, as the event was.
+CREATE OR REPLACE FUNCTION listings_set_sold_at() RETURNS TRIGGER AS $$
+BEGIN
+    IF NEW.sold_at IS NULL THEN
+        NEW.sold_at := NOW();
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS listings_set_sold_at ON listings;
+CREATE TRIGGER listings_set_sold_at
+    BEFORE INSERT OR UPDATE OF status ON listings
+    FOR EACH ROW
+    WHEN (NEW.status = 'sold')
+    EXECUTE FUNCTION listings_set_sold_at();
+
+DROP MATERIALIZED VIEW IF EXISTS market_sales_stats;
+CREATE MATERIALIZED VIEW market_sales_stats AS
+WITH sales AS (
+    SELECT
+        lower(a.city) AS city,
+        l.category_id,
+        l.price,
+        b.amount AS sale_price,
+        extract(epoch FROM l.sold_at - l.created_at)::float8 / 86400 AS days_on_market
+    FROM listings l
+    JOIN addresses a ON a.id = l.address_id
+    LEFT JOIN bids b ON b.listing_id = l.id AND b.is_accepted
+    WHERE l.status = 'sold'
+)
+SELECT
+    CASE WHEN grouping(city) = 1 THEN '' ELSE city END AS city,
+    CASE WHEN grouping(category_id) = 1 THEN 0 ELSE category_id END AS category_id,
+    count(*) AS sold_count,
+    avg(days_on_market) AS avg_days_on_market,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY days_on_market) AS median_days_on_market,
+    avg(sale_price)::float8 AS avg_sale_price,
+    avg(sale_price::float8 / price) FILTER (WHERE price > 0) AS avg_bid_to_ask,
+    percentile_cont(0.5) WITHIN GROUP (ORDER BY sale_price::float8 / price)
+        FILTER (WHERE price > 0) AS median_bid_to_ask
+FROM sales
+GROUP BY GROUPING SETS ((city, category_id), (city), (category_id), ());
+
+CREATE UNIQUE INDEX IF NOT EXISTS market_sales_stats_key
+    ON market_sales_stats (city, category_id);
+
+-- Pruning finds the oldest events; BRIN because they are appended in
+-- created_at order and this costs next to nothing on the insert path.
+CREATE INDEX IF NOT EXISTS listing_events_created_at_idx
+    ON listing_events USING brin (created_at);
@@ -0,0 +1,16 @@
+-- NEW.is_accepted AND NOT OLD.is_accepted is NULL, not TRUE, when the bid
+-- was never given an is_accepted, so accepting it emitted no bid_accepted
+-- event. Compare so NULL counts as not accepted, and stop NULLs arising.
+CREATE OR REPLACE FUNCTION bids_emit_event() RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        PERFORM emit_listing_event(NEW.listing_id, 'bid_created', to_jsonb(NEW));
+    ELSIF NEW.is_accepted AND OLD.is_accepted IS DISTINCT FROM TRUE THEN
+        PERFORM emit_listing_event(NEW.listing_id, 'bid_accepted', to_jsonb(NEW));
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+UPDATE bids SET is_accepted = FALSE WHERE is_accepted IS NULL;
+ALTER TABLE bids ALTER COLUMN is_accepted SET NOT NULL;
@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+from collections import defaultdict
+
+import asyncpg
+
+import async_db
+from async_db import get_last_listing_event_id, get_listing_events
+
+CHANNEL = "listing_events"
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("REALTIME_QUEUE_SIZE", "100"))
+HEARTBEAT_INTERVAL = float(os.getenv("REALTIME_HEARTBEAT_INTERVAL", "15"))
+REPLAY_BATCH_SIZE = 500
+LISTENER_PING_INTERVAL = 10
+LISTENER_RECONNECT_DELAY = 2
+
+# Put on a subscriber's queue when it has to catch up from the
+# listing_events table instead of from live notifications.
+RESYNC = object()
+
+
+def _json_default(value):
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+
+def format_sse(event):
+    data = json.dumps(event, default=_json_default)
+    return f"id: {event['id']}\nevent: {event['event_type']}\ndata: {data}\n\n"
+
+
+class Subscription:
+    def __init__(self, listing_id, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.listing_id = listing_id
+        self.queue = asyncio.Queue(maxsize=queue_size)
+
+    def push(self, item):
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            # Slow consumer: rather than buffer without bound (or block the
+            # listener for everyone else), drop what is queued and let it
+            # replay from the events table at its own pace.
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+
+class ListingEventHub:
+    # One LISTEN connection per worker, fanned out to every SSE / WebSocket
+    # subscriber of a listing in this process.
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._task = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def subscribe(self, listing_id):
+        subscription = Subscription(listing_id)
+        self._subscriptions[listing_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscribers = self._subscriptions.get(subscription.listing_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscriptions[subscription.listing_id]
+
+    def subscriber_count(self):
+        return sum(len(subscribers) for subscribers in self._subscriptions.values())
+
+    def _on_notify(self, con, pid, channel, payload):
+        event = json.loads(payload)
+        for subscription in list(self._subscriptions.get(event["listing_id"], ())):
+            subscription.push(event)
+
+    def _resync_all(self):
+        for subscribers in self._subscriptions.values():
+            for subscription in subscribers:
+                subscription.push(RESYNC)
+
+    async def _listen(self):
+        while True:
+            con = None
+            try:
+                con = await async_db.connect()
+                await con.add_listener(CHANNEL, self._on_notify)
+                # Anything published while we were not listening is only in
+                # the table now.
+                self._resync_all()
+                while True:
+                    await asyncio.sleep(LISTENER_PING_INTERVAL)
+                    await con.execute("SELECT 1;")
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError):
+                pass
+            finally:
+                if con is not None and not con.is_closed():
+                    await con.close()
+            await asyncio.sleep(LISTENER_RECONNECT_DELAY)
+
+
+hub = ListingEventHub()
+
+
+async def listing_events(listing_id, last_event_id=None):
+    # Yields events for one listing, or None when a heartbeat is due.
+    # Events are inserted while the listing row is locked (bids, acceptance
+    # and status changes all lock it), so ids for one listing commit in
+    # order and anything at or below the last id sent is a duplicate.
+    subscription = hub.subscribe(listing_id)
+    try:
+        if last_event_id is None:
+            async with async_db.acquire() as con:
+                last_event_id = await get_last_listing_event_id(con, listing_id)
+            replay = False
+        else:
+            replay = True
+        while True:
+            if replay:
+                async with async_db.acquire() as con:
+                    events = await get_listing_events(
+                        con, listing_id, last_event_id, REPLAY_BATCH_SIZE
+                    )
+                for event in events:
+                    yield event
+                    last_event_id = event["id"]
+                replay = len(events) == REPLAY_BATCH_SIZE
+                continue
+            try:
+                item = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if item is RESYNC:
+                replay = True
+            elif item["id"] > last_event_id:
+                yield item
+                last_event_id = item["id"]
+    finally:
+        hub.unsubscribe(subscription)
@@ -1,8 +1,14 @@
 from datetime import datetime
-from typing import Optional
+from typing import Generic, Optional, TypeVar
 
 from pydantic import BaseModel, EmailStr, Field
 
+# Range of a Postgres INTEGER column. Ints headed for one are bounded to it,
+# so an out-of-range value is a validation error rather than a failed
+# statement.
+INT4_MIN = -2_147_483_648
+INT4_MAX = 2_147_483_647
+
 # ---------- USERS ----------
 
 class UserCreate(BaseModel):
@@ -14,19 +20,29 @@ class UserCreate(BaseModel):
     phone: Optional[str] = None
 
 
-class UserResponse(BaseModel):
+class UserSummary(BaseModel):
     id: int
     email: EmailStr
     first_name: str
     last_name: str
-    phone: Optional[str]
     role_id: int
-    is_active: bool
+    created_at: datetime
 
     class Config:
         from_attributes = True
 
 
+class UserResponse(UserSummary):
+    phone: Optional[str]
+    agency_id: Optional[int]
+    is_active: bool
+    updated_at: datetime
+
+
+class UserDeleted(BaseModel):
+    deleted_user_id: int
+
+
 # ---------- LISTINGS ----------
 
 class ListingCreate(BaseModel):
@@ -40,22 +56,133 @@ class ListingCreate(BaseModel):
     address_id: int
 
 
+class AddressCreate(BaseModel):
+    street: str
+    postal_code: str
+    city: str
+    country: str
+
+
+class AddressResponse(BaseModel):
+    id: int
+    street: str
+    postal_code: str
+    city: str
+    country: str
+    latitude: Optional[float]
+    longitude: Optional[float]
+
+    class Config:
+        from_attributes = True
+
+
+class ImageCreate(BaseModel):
+    image_url: str
+    description: Optional[str] = None
+    position: Optional[int] = Field(None, ge=INT4_MIN, le=INT4_MAX)
+
+
+class ListingIngest(BaseModel):
+    title: str
+    description: str
+    price: int = Field(ge=0, le=INT4_MAX)
+    living_area: int = Field(ge=0, le=INT4_MAX)
+    rooms: int = Field(ge=0, le=INT4_MAX)
+    category_id: int = Field(gt=0, le=INT4_MAX)
+    agent_id: int = Field(gt=0, le=INT4_MAX)
+    status: str = "active"
+    address: AddressCreate
+    images: list[ImageCreate] = []
+
+
+class ListingSummary(BaseModel):
+    # Only id is required: ?fields= trims list pages, and list routes
+    # leave the unselected fields out (response_model_exclude_unset).
+    id: int
+    title: Optional[str] = None
+    price: Optional[int] = None
+    living_area: Optional[int] = None
+    rooms: Optional[int] = None
+    status: Optional[str] = None
+    address_id: Optional[int] = None
+    category_id: Optional[int] = None
+    agency_id: Optional[int] = None
+    highest_bid_amount: Optional[int] = None
+    bid_count: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 class ListingResponse(BaseModel):
     id: int
     title: str
     description: str
     price: int
+    living_area: int
+    rooms: int
     status: str
+    address_id: int
+    category_id: int
+    agent_id: int
+    agency_id: Optional[int]
+    highest_bid_id: Optional[int]
+    highest_bid_amount: Optional[int]
+    bid_count: int
+    created_at: datetime
+    updated_at: datetime
 
     class Config:
         from_attributes = True
 
 
+class ListingDeleted(BaseModel):
+    deleted_listing_id: int
+
+
+class MapListing(ListingSummary):
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    distance_km: Optional[float] = None
+
+
+class MapListings(BaseModel):
+    items: list[MapListing]
+    truncated: bool
+
+
+class MapCluster(BaseModel):
+    count: int
+    latitude: float
+    longitude: float
+    min_price: int
+    max_price: int
+    listing_id: Optional[int]
+
+
+class MapClusters(BaseModel):
+    clusters: list[MapCluster]
+    truncated: bool
+
+
+class BulkResult(BaseModel):
+    row: int
+    listing_id: Optional[int]
+    error: Optional[str]
+
+
+class BulkResponse(BaseModel):
+    inserted: int
+    failed: int
+    results: list[BulkResult]
+
+
 # ---------- BIDS ----------
 
 class BidCreate(BaseModel):
     bidder_id: int
-    amount: int = Field(gt=0)
+    amount: int = Field(gt=0, le=INT4_MAX)
 
 
 class BidResponse(BaseModel):
@@ -64,6 +191,8 @@ class BidResponse(BaseModel):
     bidder_id: int
     amount: int
     is_accepted: bool
+    is_rejected: bool
+    created_at: datetime
 
     class Config:
         from_attributes = True
@@ -75,8 +204,248 @@ class FavoriteCreate(BaseModel):
     user_id: int
     listing_id: int
 
+
+class FavoriteResponse(BaseModel):
+    user_id: int
+    listing_id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class FavoriteMembership(BaseModel):
+    listing_id: int
+    is_favorite: bool
+    favorited_at: Optional[datetime]
+    favorite_count: int
+
+# ---------- SAVED SEARCHES ----------
+
+class SavedSearchCreate(BaseModel):
+    name: str = Field(min_length=1, max_length=255)
+    city: Optional[str] = None
+    category_id: Optional[int] = None
+    min_price: Optional[int] = Field(None, ge=0)
+    max_price: Optional[int] = Field(None, ge=0)
+    rooms: Optional[int] = None
+    min_living_area: Optional[int] = None
+    max_living_area: Optional[int] = None
+    agency_id: Optional[int] = None
+
+
+class SavedSearchResponse(SavedSearchCreate):
+    id: int
+    user_id: int
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class SearchAlertResponse(BaseModel):
+    id: int
+    saved_search_id: int
+    listing_id: int
+    reason: str
+    created_at: datetime
+    listing: ListingSummary
+
+    class Config:
+        from_attributes = True
+
 # ---------- VIEWINGS ----------
 
 class ViewingCreate(BaseModel):
     start_time: datetime
-    end_time: datetime | None = None
\ No newline at end of file
+    # An hour when left out.
+    end_time: datetime | None = None
+    # The listing's agent when left out.
+    agent_id: int | None = None
+    capacity: int | None = Field(None, gt=0)
+
+
+class ViewingResponse(BaseModel):
+    id: int
+    listing_id: int
+    agent_id: int
+    start_time: datetime
+    end_time: datetime
+    capacity: int
+    registration_count: int
+    cancelled_at: Optional[datetime]
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ViewingRegistrationCreate(BaseModel):
+    user_id: int
+
+
+class ViewingRegistrationResponse(BaseModel):
+    id: int
+    viewing_id: int
+    user_id: int
+    registered_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+# ---------- IMAGES ----------
+
+class ImageVariant(BaseModel):
+    url: str
+    width: int
+    height: int
+    media_type: str
+
+
+class ImageResponse(BaseModel):
+    id: int
+    listing_id: int
+    image_url: str
+    description: Optional[str]
+    position: Optional[int]
+    # pending until an upload's variants are made; failed if the file
+    # couldn't be decoded.
+    status: str
+    variants: dict[str, ImageVariant]
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class ImageOrder(BaseModel):
+    image_ids: list[int] = Field(min_length=1)
+
+
+# ---------- CATEGORIES ----------
+
+class CategoryResponse(BaseModel):
+    id: int
+    name: str
+
+    class Config:
+        from_attributes = True
+
+
+# ---------- AGENCIES ----------
+
+class AgencyResponse(BaseModel):
+    id: int
+    name: str
+    phone: Optional[str]
+    email: str
+    website: Optional[str]
+    is_freelanse: Optional[bool]
+    address_id: Optional[int]
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+# ---------- AGENTS ----------
+
+class AgentReviewResponse(BaseModel):
+    id: int
+    agent_id: int
+    reviewer_id: int
+    rating: int
+    comment: Optional[str]
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
+
+class AgentRating(BaseModel):
+    agent_id: int
+    rating_count: int
+    rating_sum: int
+    average_rating: Optional[float]
+    histogram: dict[str, int]
+
+
+class TopAgent(AgentRating):
+    first_name: str
+    last_name: str
+
+
+class ListingAgent(BaseModel):
+    id: int
+    first_name: str
+    last_name: str
+    email: EmailStr
+    phone: Optional[str]
+    review_count: int
+    average_rating: Optional[float]
+
+
+# ---------- LISTING DETAIL ----------
+
+class ListingDetail(ListingResponse):
+    address: AddressResponse
+    category: CategoryResponse
+    agency: Optional[AgencyResponse]
+    agent: ListingAgent
+    images: list[ImageResponse]
+    top_bid: Optional[BidResponse]
+    upcoming_viewings: list[ViewingResponse]
+
+
+# ---------- STATS ----------
+
+class MarketStats(BaseModel):
+    # Either side of the FULL JOIN may be missing, hence all optional.
+    city: Optional[str]
+    category_id: Optional[int]
+    listing_count: Optional[int]
+    avg_price: Optional[float]
+    median_price: Optional[float]
+    avg_price_per_sqm: Optional[float]
+    median_price_per_sqm: Optional[float]
+    sold_count: Optional[int]
+    avg_days_on_market: Optional[float]
+    median_days_on_market: Optional[float]
+    avg_sale_price: Optional[float]
+    avg_bid_to_ask: Optional[float]
+    median_bid_to_ask: Optional[float]
+
+
+class StatsRefreshState(BaseModel):
+    view_name: str
+    dirty: bool
+    refreshed_at: Optional[datetime]
+    refresh_ms: Optional[float]
+
+
+# ---------- PAGES ----------
+
+T = TypeVar("T")
+
+
+class Page(BaseModel, Generic[T]):
+    items: list[T]
+    next_cursor: Optional[str]
+
+
+# ---------- JOBS ----------
+
+class JobQueueStats(BaseModel):
+    queue: str
+    task: str
+    ready: int
+    scheduled: int
+    running: int
+    failed: int
+    oldest_ready_s: Optional[float]
+    done_last_hour: int
+    wait_p50_ms: Optional[float]
+    wait_p95_ms: Optional[float]
+    run_p50_ms: Optional[float]
+    run_p95_ms: Optional[float]
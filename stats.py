@@ -0,0 +1,120 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+
+import asyncpg
+from dotenv import load_dotenv
+
+import async_db
+from metrics import named_query
+
+load_dotenv()
+
+# Seconds between runs of the recurring refresh_stats job in python
+# worker.py; 0 leaves the views to the refresher below.
+STATS_JOB_INTERVAL = float(os.getenv("STATS_JOB_INTERVAL", "60"))
+# Seconds between checks for dirty views in each API process. Off by
+# default since the worker refreshes them; set it (and STATS_JOB_INTERVAL
+# to 0) to run without a worker.
+STATS_REFRESH_INTERVAL = float(os.getenv("STATS_REFRESH_INTERVAL", "0"))
+
+STATS_VIEWS = ("market_price_stats", "market_sales_stats")
+
+
+@named_query("refresh_stats")
+async def refresh_stats(con, force=False):
+    # Claims the dirty views before refreshing them, so with several API
+    # workers each change is refreshed by exactly one of them, and a write
+    # that lands during the refresh marks the view dirty again for the next
+    # round. CONCURRENTLY keeps the views readable and only rewrites rows
+    # whose aggregates changed.
+    claimed = await con.fetch(
+        """
+        UPDATE stats_refresh_state
+        SET dirty = FALSE
+        WHERE (dirty OR $1) AND view_name = ANY($2::text[])
+        RETURNING view_name;
+        """,
+        force, list(STATS_VIEWS),
+    )
+    refreshed = {}
+    for row in claimed:
+        view_name = row["view_name"]
+        started = time.perf_counter()
+        try:
+            await con.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view_name};")
+        except Exception:
+            await con.execute(
+                "UPDATE stats_refresh_state SET dirty = TRUE WHERE view_name = $1;",
+                view_name,
+            )
+            raise
+        refresh_ms = (time.perf_counter() - started) * 1000
+        await con.execute(
+            """
+            UPDATE stats_refresh_state
+            SET refreshed_at = NOW(), refresh_ms = $2
+            WHERE view_name = $1;
+            """,
+            view_name, refresh_ms,
+        )
+        refreshed[view_name] = round(refresh_ms, 1)
+    return refreshed
+
+
+class StatsRefresher:
+    def __init__(self, interval=STATS_REFRESH_INTERVAL):
+        self.interval = interval
+        self._task = None
+
+    async def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                async with async_db.acquire() as con:
+                    await refresh_stats(con)
+            except (OSError, asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError):
+                # Still dirty; the next round retries.
+                pass
+
+
+refresher = StatsRefresher()
+
+
+async def main(once, force):
+    await async_db.init_pool(min_size=1, max_size=1)
+    try:
+        while True:
+            async with async_db.acquire() as con:
+                refreshed = await refresh_stats(con, force)
+            if refreshed:
+                print(json.dumps(refreshed))
+            if once:
+                break
+            force = False
+            await asyncio.sleep(STATS_REFRESH_INTERVAL or STATS_JOB_INTERVAL or 60)
+    finally:
+        await async_db.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the market statistics views.")
+    parser.add_argument("--once", action="store_true", help="refresh dirty views and exit")
+    parser.add_argument("--force", action="store_true", help="refresh every view, dirty or not")
+    args = parser.parse_args()
+    asyncio.run(main(args.once, args.force))
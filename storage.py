@@ -0,0 +1,84 @@
+import asyncio
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from starlette.staticfiles import StaticFiles
+
+load_dotenv()
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_DIR = os.getenv("STORAGE_DIR", "media")
+# Public prefix for stored objects. For local storage the app serves
+# STORAGE_DIR there itself.
+STORAGE_URL = os.getenv("STORAGE_URL", "/media")
+
+
+# ---------- BACKENDS ----------
+# A backend stores objects under keys the app makes up (never client
+# input) and hands out a public URL for each. Anything with the same four
+# methods - an S3 bucket, say - can stand in for LocalStorage.
+
+class LocalStorage:
+    def __init__(self, root=STORAGE_DIR, base_url=STORAGE_URL):
+        self.root = Path(root).resolve()
+        self.base_url = base_url.rstrip("/")
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key):
+        path = (self.root / key).resolve()
+        if not path.is_relative_to(self.root):
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    async def save(self, key, chunks):
+        # Written chunk by chunk as they arrive, so an upload never sits in
+        # memory whole, and renamed into place only once complete. chunks
+        # is an async iterable of bytes; whatever it raises (e.g. a size
+        # limit) removes the partial file and propagates.
+        path = self._path(key)
+        partial = path.with_name(path.name + ".part")
+        await asyncio.to_thread(path.parent.mkdir, parents=True, exist_ok=True)
+        size = 0
+        handle = await asyncio.to_thread(open, partial, "wb")
+        try:
+            async for chunk in chunks:
+                if chunk:
+                    await asyncio.to_thread(handle.write, chunk)
+                    size += len(chunk)
+            await asyncio.to_thread(handle.close)
+            await asyncio.to_thread(os.replace, partial, path)
+        except BaseException:
+            handle.close()
+            partial.unlink(missing_ok=True)
+            raise
+        return size
+
+    async def read(self, key):
+        return await asyncio.to_thread(self._path(key).read_bytes)
+
+    async def delete(self, key):
+        await asyncio.to_thread(self._path(key).unlink, missing_ok=True)
+
+    def url(self, key):
+        return f"{self.base_url}/{key}"
+
+
+def create_storage(backend=STORAGE_BACKEND):
+    if backend == "local":
+        return LocalStorage()
+    raise ValueError(f"Unknown STORAGE_BACKEND: {backend}")
+
+
+storage = create_storage()
+
+
+# ---------- SERVING ----------
+
+class MediaFiles(StaticFiles):
+    # Keys are never reused, so a stored object never changes under its URL.
+
+    def file_response(self, *args, **kwargs):
+        response = super().file_response(*args, **kwargs)
+        response.headers.setdefault("Cache-Control", "public, max-age=31536000, immutable")
+        return response
@@ -0,0 +1,48 @@
+import pytest
+
+import app
+import async_db
+from geocoding import CentroidGeocoder
+
+pytestmark = pytest.mark.anyio
+
+
+class RecordingGeocoder:
+    # Notes how many pooled connections were checked out while it ran.
+    def __init__(self):
+        self.in_use = None
+
+    async def geocode(self, street, postal_code, city, country, con=None):
+        self.in_use = async_db._pool.get_size() - async_db._pool.get_idle_size()
+        return 55.6, 13.0
+
+
+async def test_create_address_geocodes_without_holding_a_connection(pool, monkeypatch):
+    geocoder = RecordingGeocoder()
+    monkeypatch.setattr(app, "geocoder", geocoder)
+    created = await app.api_create_address(
+        street="Testgatan 1", postal_code="211 20", city="Testby", country="SE",
+        latitude=None, longitude=None,
+    )
+    try:
+        assert geocoder.in_use == 0
+        assert (created["latitude"], created["longitude"]) == (55.6, 13.0)
+    finally:
+        async with async_db.acquire() as con:
+            await con.execute("DELETE FROM addresses WHERE id = $1;", created["id"])
+
+
+async def test_centroid_geocoder_with_and_without_a_connection(con):
+    await con.execute(
+        """
+        INSERT INTO postal_code_centroids (country, postal_code, latitude, longitude)
+        VALUES ('ZZ', '99999', 1.5, 2.5);
+        """
+    )
+    try:
+        geocoder = CentroidGeocoder()
+        assert await geocoder.geocode("", "999 99", "", "ZZ", con) == (1.5, 2.5)
+        assert await geocoder.geocode("", "999 99", "", "ZZ") == (1.5, 2.5)
+        assert await geocoder.geocode("", "00000", "", "ZZ") is None
+    finally:
+        await con.execute("DELETE FROM postal_code_centroids WHERE country = 'ZZ';")
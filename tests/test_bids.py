@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+import async_db
+from async_db import BidRejected
+from conftest import create_listing
+from schemas import INT4_MAX
+
+pytestmark = pytest.mark.anyio
+
+
+async def bid(listing_id, bidder_id, amount):
+    async with async_db.acquire() as con:
+        try:
+            return await async_db.create_bid(con, listing_id, bidder_id, amount)
+        except BidRejected:
+            return None
+
+
+async def accept(bid_id):
+    async with async_db.acquire() as con:
+        try:
+            return await async_db.accept_bid(con, bid_id)
+        except BidRejected:
+            return None
+
+
+async def test_create_bid_bumps_the_listing(con, world):
+    listing_id = await create_listing(con, world)
+    first = await async_db.create_bid(con, listing_id, world["buyer"], 1_000_000)
+    second = await async_db.create_bid(
+        con, listing_id, world["other_buyer"], 1_000_000 + async_db.BID_MIN_INCREMENT
+    )
+    listing = await async_db.get_listing_by_id(con, listing_id)
+    assert listing["highest_bid_id"] == second["id"] != first["id"]
+    assert listing["highest_bid_amount"] == second["amount"]
+    assert listing["bid_count"] == 2
+
+
+async def test_bid_must_beat_the_highest_by_the_increment(con, world):
+    listing_id = await create_listing(con, world)
+    await async_db.create_bid(con, listing_id, world["buyer"], 1_000_000)
+    with pytest.raises(BidRejected):
+        await async_db.create_bid(
+            con, listing_id, world["other_buyer"], 1_000_000 + async_db.BID_MIN_INCREMENT - 1
+        )
+    listing = await async_db.get_listing_by_id(con, listing_id)
+    assert listing["bid_count"] == 1
+
+
+async def test_bids_near_the_integer_maximum(client, con, world):
+    listing_id = await create_listing(con, world)
+    await async_db.create_bid(con, listing_id, world["buyer"], INT4_MAX)
+    with pytest.raises(BidRejected):
+        await async_db.create_bid(con, listing_id, world["other_buyer"], INT4_MAX)
+    response = await client.post(
+        f"/listings/{listing_id}/bids", json={"bidder_id": world["buyer"], "amount": 2**31}
+    )
+    assert response.status_code == 422
+
+
+async def test_bid_on_inactive_or_missing_listing(con, world):
+    listing_id = await create_listing(con, world, status="upcoming")
+    with pytest.raises(BidRejected):
+        await async_db.create_bid(con, listing_id, world["buyer"], 1_000_000)
+    assert await async_db.create_bid(con, -1, world["buyer"], 1_000_000) is None
+
+
+async def test_concurrent_bids_keep_the_listing_consistent(con, world):
+    listing_id = await create_listing(con, world)
+    amounts = [1_000_000 + i * async_db.BID_MIN_INCREMENT for i in range(20)]
+    bidders = [world["buyer"], world["other_buyer"]]
+    results = await asyncio.gather(*(
+        bid(listing_id, bidders[i % 2], amount) for i, amount in enumerate(amounts)
+    ))
+    placed = [result for result in results if result is not None]
+
+    listing = await async_db.get_listing_by_id(con, listing_id)
+    stored = await con.fetch("SELECT id, amount FROM bids WHERE listing_id = $1;", listing_id)
+    assert listing["bid_count"] == len(stored) == len(placed)
+    highest = max(stored, key=lambda row: row["amount"])
+    assert (listing["highest_bid_id"], listing["highest_bid_amount"]) == tuple(highest)
+    # Every stored bid beat the one before it by at least the increment.
+    ordered = sorted(row["amount"] for row in stored)
+    assert all(b - a >= async_db.BID_MIN_INCREMENT for a, b in zip(ordered, ordered[1:]))
+
+
+async def test_only_one_bid_is_accepted(con, world):
+    listing_id = await create_listing(con, world)
+    bid_ids = []
+    for i in range(5):
+        placed = await async_db.create_bid(
+            con, listing_id, world["buyer"], 1_000_000 + i * async_db.BID_MIN_INCREMENT
+        )
+        bid_ids.append(placed["id"])
+
+    results = await asyncio.gather(*(accept(bid_id) for bid_id in bid_ids))
+    assert len([result for result in results if result is not None]) == 1
+    assert await con.fetchval(
+        "SELECT count(*) FROM bids WHERE listing_id = $1 AND is_accepted;", listing_id
+    ) == 1
+    listing = await async_db.get_listing_by_id(con, listing_id)
+    assert listing["status"] == "sold"
+    with pytest.raises(BidRejected):
+        await async_db.create_bid(con, listing_id, world["buyer"], 9_000_000)
@@ -0,0 +1,61 @@
+import json
+
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+NDJSON = {"Content-Type": "application/x-ndjson"}
+
+
+def listing(world, **values):
+    return {
+        "title": "Bulk listing",
+        "description": "Loaded by the test suite",
+        "price": 2_500_000,
+        "living_area": 70,
+        "rooms": 3,
+        "category_id": world["category_id"],
+        "agent_id": world["agent"],
+        "address": {
+            "street": "Bulkgatan 1", "postal_code": "211 20", "city": "Testby", "country": "SE"
+        },
+        **values,
+    }
+
+
+async def test_bad_rows_fail_on_their_own(client, con, world):
+    rows = [
+        json.dumps(listing(world)).encode(),
+        b'{"title": "\xff\xfe"}',
+        json.dumps(listing(world, price=2**70)).encode(),
+        json.dumps(listing(world, images=[{"image_url": "x", "position": 2**40}])).encode(),
+        json.dumps(listing(world, category_id=2**63)).encode(),
+        b"{not json",
+    ]
+    response = await client.post("/listings/bulk", content=b"\n".join(rows), headers=NDJSON)
+    assert response.status_code == 200
+    body = response.json()
+    try:
+        errors = [result["error"] for result in body["results"]]
+        assert errors[0] is None and body["results"][0]["listing_id"]
+        assert errors[1] == errors[5] == "Invalid JSON"
+        assert errors[2].startswith("price:")
+        assert errors[3].startswith("images.0.position:")
+        assert errors[4].startswith("category_id:")
+        assert (body["inserted"], body["failed"]) == (1, 5)
+    finally:
+        address_ids = await con.fetch(
+            "SELECT address_id FROM listings WHERE agency_id = $1;", world["agency_id"]
+        )
+        await con.execute("DELETE FROM listings WHERE agency_id = $1;", world["agency_id"])
+        await con.execute(
+            "DELETE FROM addresses WHERE id = ANY($1::int[]);",
+            [row["address_id"] for row in address_ids],
+        )
+
+
+async def test_unreadable_body_is_a_400(client, pool):
+    response = await client.post("/listings/bulk", content=b'[{"title": "\xff"}]')
+    assert response.status_code == 400
+    response = await client.post("/listings/bulk", content=b'{"title": "x"}')
+    assert response.status_code == 400
@@ -0,0 +1,125 @@
+import asyncio
+
+import pytest
+
+import async_db
+from cache import Cache, CacheInvalidator, LocalSharedBackend, MemoryBackend
+from conftest import create_listing
+
+pytestmark = pytest.mark.anyio
+
+
+def counting_loader(value):
+    calls = []
+
+    async def load():
+        calls.append(1)
+        return value
+    return load, calls
+
+
+@pytest.mark.parametrize("backend", [MemoryBackend, LocalSharedBackend])
+async def test_loads_once_then_hits(backend):
+    cache = Cache(backend())
+    load, calls = counting_loader({"id": 1})
+    assert await cache.get_or_load("listing", 1, load) == {"id": 1}
+    assert await cache.get_or_load("listing", 1, load) == {"id": 1}
+    assert len(calls) == 1
+    stats = await cache.stats()
+    assert stats["namespaces"]["listing"] == {"hits": 1, "misses": 1}
+
+
+async def test_none_is_not_cached():
+    cache = Cache(MemoryBackend())
+    load, calls = counting_loader(None)
+    await cache.get_or_load("listing", 1, load)
+    await cache.get_or_load("listing", 1, load)
+    assert len(calls) == 2
+
+
+async def test_invalidate_evicts():
+    cache = Cache(MemoryBackend())
+    load, calls = counting_loader({"id": 1})
+    await cache.get_or_load("listing", 1, load)
+    await cache.invalidate("listing", 1)
+    await cache.get_or_load("listing", 1, load)
+    assert len(calls) == 2
+
+
+async def test_entries_expire():
+    cache = Cache(MemoryBackend(), ttl=0.01)
+    load, calls = counting_loader({"id": 1})
+    await cache.get_or_load("listing", 1, load)
+    await asyncio.sleep(0.02)
+    await cache.get_or_load("listing", 1, load)
+    assert len(calls) == 2
+
+
+async def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_size=2)
+    await backend.set("a", 1, 60)
+    await backend.set("b", 2, 60)
+    await backend.get("a")
+    await backend.set("c", 3, 60)
+    assert await backend.get("a") == 1
+    assert await backend.get("b") is None
+    assert await backend.get("c") == 3
+
+
+async def test_load_racing_an_invalidation_is_not_stored():
+    # Two processes sharing one backend: the invalidation from the other
+    # one lands while this one is still loading.
+    backend = LocalSharedBackend()
+    this, other = Cache(backend), Cache(backend)
+
+    async def load():
+        await other.invalidate("listing", 1)
+        return {"id": 1, "title": "stale"}
+
+    assert await this.get_or_load("listing", 1, load) == {"id": 1, "title": "stale"}
+    assert await backend.get("listing:1") is None
+
+
+@pytest.mark.parametrize("backend", [MemoryBackend, LocalSharedBackend])
+async def test_misses_and_invalidations_stay_bounded(backend):
+    backend = backend(max_size=10)
+    cache = Cache(backend)
+    load, _ = counting_loader(None)
+    for key in range(1000):
+        await cache.get_or_load("listing", key, load)
+        await cache.invalidate("listing", key)
+    assert len(backend._generations) <= 10
+    assert await backend.generation("listing:999") == 1
+    assert await backend.generation("listing:0") == 0
+
+
+async def test_generations_expire_with_the_ttl():
+    backend = MemoryBackend()
+    await backend.bump_generation("listing:1", 0.01)
+    assert await backend.generation("listing:1") == 1
+    await asyncio.sleep(0.02)
+    assert await backend.generation("listing:1") == 0
+    assert len(backend._generations) == 0
+
+
+async def test_writes_outside_async_db_evict_through_notify(con, world):
+    listing_id = await create_listing(con, world, title="Before")
+    cache = Cache(MemoryBackend())
+    invalidator = CacheInvalidator(cache, async_db.connect)
+    await invalidator.start()
+    try:
+        await asyncio.sleep(0.2)
+        await cache.get_or_load(
+            "listing", listing_id, lambda: async_db.get_listing_by_id(con, listing_id)
+        )
+        assert await cache.backend.get(f"listing:{listing_id}") is not None
+
+        # As a script or db.py would: straight SQL, no cache call.
+        await con.execute("UPDATE listings SET title = 'After' WHERE id = $1;", listing_id)
+        for _ in range(50):
+            if await cache.backend.get(f"listing:{listing_id}") is None:
+                break
+            await asyncio.sleep(0.02)
+        assert await cache.backend.get(f"listing:{listing_id}") is None
+    finally:
+        await invalidator.stop()
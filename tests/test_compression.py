@@ -0,0 +1,148 @@
+import zlib
+
+import pytest
+
+from http_cache import CompressionMiddleware, negotiate_encoding
+
+pytestmark = pytest.mark.anyio
+
+ENCODINGS = ["zstd", "br", "gzip"]
+BODY = b'{"items": [' + b", ".join(b'{"id": %d}' % n for n in range(500)) + b"]}"
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, br, zstd", "zstd"),
+        ("gzip;q=1.0, br;q=0.5", "gzip"),
+        ("br;q=0.8, zstd;q=0.8", "zstd"),
+        ("*", "zstd"),
+        ("*;q=0.5, zstd;q=0", "br"),
+        ("gzip;q=0", None),
+        ("identity", None),
+        ("gzip;q=abc, br", "br"),
+        ("", None),
+    ],
+)
+def test_negotiate_encoding(accept_encoding, expected):
+    assert negotiate_encoding(accept_encoding, ENCODINGS) == expected
+
+
+def scope(accept_encoding="gzip"):
+    return {
+        "type": "http",
+        "method": "GET",
+        "headers": [(b"accept-encoding", accept_encoding.encode())] if accept_encoding else [],
+    }
+
+
+def start(status=200, content_type="application/json", length=None):
+    headers = [(b"content-type", content_type.encode())]
+    if length is not None:
+        headers.append((b"content-length", str(length).encode()))
+    return {"type": "http.response.start", "status": status, "headers": headers}
+
+
+def headers_of(message):
+    return {name.decode(): value.decode() for name, value in message["headers"]}
+
+
+async def run(app, accept_encoding="gzip"):
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await CompressionMiddleware(app, minimum_size=1024, encodings=["gzip"])(
+        scope(accept_encoding), None, send
+    )
+    return sent
+
+
+async def test_event_stream_headers_are_not_held_back():
+    seen_before_body = []
+
+    async def app(scope, receive, send):
+        await send(start(content_type="text/event-stream"))
+        seen_before_body.extend(sent)
+        await send({"type": "http.response.body", "body": b": hi\n\n", "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    await CompressionMiddleware(app, encodings=["gzip"])(scope(), None, send)
+    assert [message["type"] for message in seen_before_body] == ["http.response.start"]
+    assert "content-encoding" not in headers_of(sent[0])
+    assert sent[1]["body"] == b": hi\n\n"
+
+
+async def test_not_modified_is_passed_through():
+    async def app(scope, receive, send):
+        await send(start(status=304))
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = await run(app)
+    assert sent[0]["status"] == 304
+    assert "vary" not in headers_of(sent[0])
+
+
+async def test_small_body_is_sent_as_is():
+    async def app(scope, receive, send):
+        await send(start(length=2))
+        await send({"type": "http.response.body", "body": b"[]"})
+
+    sent = await run(app)
+    headers = headers_of(sent[0])
+    assert "content-encoding" not in headers
+    assert headers["vary"] == "Accept-Encoding"
+    assert sent[1]["body"] == b"[]"
+
+
+async def test_without_accept_encoding_start_goes_out_first():
+    async def app(scope, receive, send):
+        await send(start(length=len(BODY)))
+        assert len(sent_so_far) == 1
+        await send({"type": "http.response.body", "body": BODY})
+
+    sent_so_far = []
+
+    async def send(message):
+        sent_so_far.append(message)
+
+    await CompressionMiddleware(app, encodings=["gzip"])(scope(None), None, send)
+    assert headers_of(sent_so_far[0])["vary"] == "Accept-Encoding"
+    assert sent_so_far[1]["body"] == BODY
+
+
+async def test_large_body_is_compressed():
+    async def app(scope, receive, send):
+        await send(start(length=len(BODY)))
+        await send({"type": "http.response.body", "body": BODY})
+
+    sent = await run(app)
+    headers = headers_of(sent[0])
+    assert headers["content-encoding"] == "gzip"
+    assert int(headers["content-length"]) == len(sent[1]["body"]) < len(BODY)
+    assert zlib.decompress(sent[1]["body"], 16 + zlib.MAX_WBITS) == BODY
+
+
+async def test_streamed_chunks_decode_as_they_arrive():
+    chunks = [BODY[:2000], BODY[2000:4000], BODY[4000:]]
+
+    async def app(scope, receive, send):
+        await send(start(content_type="application/x-ndjson"))
+        for chunk in chunks:
+            await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    sent = await run(app)
+    headers = headers_of(sent[0])
+    assert headers["content-encoding"] == "gzip"
+    assert "content-length" not in headers
+    decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    for message, chunk in zip(sent[1:], chunks):
+        assert decoder.decompress(message["body"]) == chunk
+    assert decoder.decompress(sent[-1]["body"]) + decoder.flush() == b""
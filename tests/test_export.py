@@ -0,0 +1,20 @@
+import pytest
+
+import db
+from schemas import ListingResponse
+
+
+def test_export_selects_the_response_model_columns(database):
+    con = db.get_connection()
+    try:
+        rows = db.iter_listings_export(con, ["address", "category"], batch_size=10)
+        first = next(rows, None)
+        rows.close()
+    finally:
+        db.release_connection(con)
+    if first is None:
+        pytest.skip("No listings to export")
+    assert list(first) == [
+        *ListingResponse.model_fields, "street", "postal_code", "city", "country",
+        "category_name",
+    ]
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from conftest import create_listing
+from http_cache import _not_modified, make_etag, validator_headers
+
+pytestmark = pytest.mark.anyio
+
+UPDATED_AT = datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=timezone.utc)
+ETAG = make_etag({"updated_at": UPDATED_AT})
+LAST_MODIFIED = "Wed, 01 May 2024 12:30:15 GMT"
+
+
+def test_validators_from_a_version():
+    headers = validator_headers({"updated_at": UPDATED_AT})
+    assert headers == {"ETag": ETAG, "Last-Modified": LAST_MODIFIED}
+    assert ETAG.startswith('W/"')
+    # Cached rows carry ISO strings; the tag must not change.
+    assert make_etag({"updated_at": UPDATED_AT.isoformat()}) == ETAG
+    assert make_etag({"updated_at": UPDATED_AT + timedelta(microseconds=1)}) != ETAG
+
+
+@pytest.mark.parametrize(
+    "if_none_match, expected",
+    [
+        (ETAG, True),
+        (ETAG.removeprefix("W/"), True),
+        (f'"other", {ETAG}', True),
+        ("*", True),
+        ('W/"other"', False),
+    ],
+)
+def test_if_none_match(if_none_match, expected):
+    assert _not_modified({"if-none-match": if_none_match}, ETAG, UPDATED_AT) is expected
+
+
+@pytest.mark.parametrize(
+    "if_modified_since, expected",
+    [
+        (LAST_MODIFIED, True),
+        ("Wed, 01 May 2024 12:30:16 GMT", True),
+        ("Wed, 01 May 2024 12:30:14 GMT", False),
+        ("not a date", False),
+    ],
+)
+def test_if_modified_since(if_modified_since, expected):
+    assert _not_modified({"if-modified-since": if_modified_since}, ETAG, UPDATED_AT) is expected
+
+
+def test_if_none_match_wins_over_if_modified_since():
+    headers = {"if-none-match": 'W/"other"', "if-modified-since": LAST_MODIFIED}
+    assert _not_modified(headers, ETAG, UPDATED_AT) is False
+
+
+def test_no_conditions_or_no_timestamp():
+    assert _not_modified({}, ETAG, UPDATED_AT) is False
+    assert _not_modified({"if-modified-since": LAST_MODIFIED}, ETAG, None) is False
+
+
+async def test_listing_revalidation(client, con, world):
+    listing_id = await create_listing(con, world)
+    url = f"/listings/{listing_id}"
+
+    first = await client.get(url)
+    assert first.status_code == 200
+    etag, last_modified = first.headers["etag"], first.headers["last-modified"]
+
+    for conditions in ({"If-None-Match": etag}, {"If-Modified-Since": last_modified}):
+        revalidated = await client.get(url, headers=conditions)
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert revalidated.headers["etag"] == etag
+
+    await con.execute("UPDATE listings SET price = price + 1 WHERE id = $1;", listing_id)
+    changed = await client.get(url, headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["price"] == 3_000_001
+
+
+async def test_missing_listing_with_conditions_is_404(client, pool):
+    response = await client.get("/listings/0", headers={"If-None-Match": "*"})
+    assert response.status_code == 404
@@ -0,0 +1,123 @@
+import asyncio
+import uuid
+
+import pytest
+
+import async_db
+import jobs
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+async def queue(con):
+    # A queue of its own, so claims never touch real jobs.
+    name = f"test-{uuid.uuid4().hex[:12]}"
+    yield name
+    await con.execute("DELETE FROM jobs WHERE queue = $1;", name)
+
+
+def test_backoff_grows_with_full_jitter_up_to_the_cap():
+    for attempts in range(1, 20):
+        delay = min(jobs.JOB_BACKOFF_MAX, jobs.JOB_BACKOFF_BASE * 2 ** (attempts - 1))
+        for _ in range(20):
+            assert delay / 2 <= jobs.backoff(attempts) <= delay
+    assert jobs.backoff(100) <= jobs.JOB_BACKOFF_MAX
+
+
+async def test_enqueue_with_a_fractional_delay_and_dedupe_key(con, queue):
+    job_id = await async_db.enqueue_job(
+        con, "noop", queue=queue, delay=1.5, dedupe_key=f"{queue}:once"
+    )
+    delay = await con.fetchval(
+        "SELECT extract(epoch FROM run_at - created_at) FROM jobs WHERE id = $1;", job_id
+    )
+    assert 1.4 < delay < 1.6
+    assert await async_db.enqueue_job(con, "noop", queue=queue, dedupe_key=f"{queue}:once") is None
+    # Not due yet.
+    assert await async_db.claim_jobs(con, "test", [queue]) == []
+
+
+async def test_claims_skip_jobs_locked_by_another_worker(con, queue):
+    job_ids = [await async_db.enqueue_job(con, "noop", queue=queue) for _ in range(6)]
+    async with async_db.acquire() as holder:
+        async with holder.transaction():
+            held = await async_db.claim_jobs(holder, "holder", [queue], limit=2)
+            # The other worker neither waits for nor sees the locked rows.
+            others = await asyncio.wait_for(
+                async_db.claim_jobs(con, "other", [queue], limit=10), timeout=5
+            )
+    assert len(held) == 2
+    assert sorted(job["id"] for job in held + others) == sorted(job_ids)
+
+
+async def test_concurrent_claims_never_share_a_job(con, queue):
+    job_ids = [await async_db.enqueue_job(con, "noop", queue=queue) for _ in range(20)]
+
+    async def claim(worker):
+        claimed = []
+        while True:
+            async with async_db.acquire() as con:
+                batch = await async_db.claim_jobs(con, worker, [queue], limit=3)
+            if not batch:
+                return claimed
+            claimed += [job["id"] for job in batch]
+
+    claimed = await asyncio.gather(*(claim(f"worker-{n}") for n in range(5)))
+    flat = [job_id for batch in claimed for job_id in batch]
+    assert sorted(flat) == sorted(job_ids)
+
+
+async def test_failed_job_retries_with_backoff_then_fails(con, queue, monkeypatch):
+    async def fail(payload):
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(jobs.TASKS, "test_fail", fail)
+    job_id = await async_db.enqueue_job(con, "test_fail", queue=queue, max_attempts=2)
+    worker = jobs.JobWorker(queues=[queue])
+
+    [job] = await async_db.claim_jobs(con, worker.worker_id, [queue])
+    await worker._execute(job)
+    row = await con.fetchrow(
+        "SELECT status, attempts, last_error, run_at - NOW() AS wait FROM jobs WHERE id = $1;",
+        job_id,
+    )
+    assert (row["status"], row["attempts"], row["last_error"]) == (
+        "queued", 1, "RuntimeError: boom"
+    )
+    assert row["wait"].total_seconds() > jobs.JOB_BACKOFF_BASE / 2 - 1
+
+    await con.execute("UPDATE jobs SET run_at = NOW() WHERE id = $1;", job_id)
+    [job] = await async_db.claim_jobs(con, worker.worker_id, [queue])
+    await worker._execute(job)
+    row = await con.fetchrow("SELECT status, attempts, finished_at FROM jobs WHERE id = $1;", job_id)
+    assert (row["status"], row["attempts"]) == ("failed", 2)
+    assert row["finished_at"] is not None
+
+
+async def test_successful_job_is_done_and_pruned(con, queue, monkeypatch):
+    ran = []
+
+    async def record(payload):
+        ran.append(payload)
+
+    monkeypatch.setitem(jobs.TASKS, "test_record", record)
+    job_id = await async_db.enqueue_job(con, "test_record", {"n": 1}, queue=queue)
+    worker = jobs.JobWorker(queues=[queue])
+    [job] = await async_db.claim_jobs(con, worker.worker_id, [queue])
+    await worker._execute(job)
+    assert ran == [{"n": 1}]
+    assert await con.fetchval("SELECT status FROM jobs WHERE id = $1;", job_id) == "done"
+
+    await con.execute(
+        "UPDATE jobs SET finished_at = NOW() - INTERVAL '1 day' WHERE id = $1;", job_id
+    )
+    assert await async_db.prune_jobs(con, 3600) >= 1
+    assert await con.fetchval("SELECT count(*) FROM jobs WHERE id = $1;", job_id) == 0
+
+
+async def test_unscheduled_recurring_jobs_are_removed(con):
+    name = f"test-{uuid.uuid4().hex[:12]}"
+    await async_db.register_recurring_job(con, name, "noop", 60)
+    keep = await con.fetchval("SELECT array_agg(name) FROM recurring_jobs WHERE name <> $1;", name)
+    assert await async_db.remove_recurring_jobs(con, keep or []) == [name]
@@ -0,0 +1,66 @@
+import pytest
+
+import async_db
+from metrics import QUERY_DURATION, current_query, named_query
+
+pytestmark = pytest.mark.anyio
+
+
+def query_count(name):
+    series = QUERY_DURATION._series.get(("background", name))
+    return series[-2] if series else 0
+
+
+async def test_named_query_labels_nested_calls():
+    @named_query("inner")
+    async def inner():
+        return current_query()
+
+    @named_query("outer")
+    async def outer():
+        return current_query(), await inner(), current_query()
+
+    assert await outer() == ("outer", "inner", "outer")
+    assert current_query() == "other"
+
+
+def test_named_query_labels_generator_steps_only():
+    seen = []
+
+    @named_query("export")
+    def export():
+        for n in range(3):
+            seen.append(current_query())
+            yield n
+
+    consumed = []
+    for n in export():
+        consumed.append(current_query())
+    assert seen == ["export"] * 3
+    assert consumed == ["other"] * 3
+
+    closed = []
+
+    @named_query("export")
+    def export_until_closed():
+        try:
+            yield 1
+            yield 2
+        finally:
+            closed.append(current_query())
+
+    items = export_until_closed()
+    next(items)
+    items.close()
+    assert closed == ["export"]
+
+
+async def test_statements_are_labelled_by_name_not_caller(con):
+    before = query_count("get_listing_by_id"), query_count("other")
+    await async_db.get_listing_by_id(con, -1)
+    # Transaction control run by asyncpg itself isn't a named query.
+    async with con.transaction():
+        pass
+    assert query_count("get_listing_by_id") == before[0] + 1
+    assert query_count("other") >= before[1] + 2
+    assert not any(name in ("start", "__commit", "reset") for _, name in QUERY_DURATION._series)
@@ -0,0 +1,29 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import db_setup
+
+
+def test_migrate_waits_for_the_lock(database):
+    holder = db_setup.get_connection()
+    try:
+        with holder.cursor() as cur:
+            cur.execute("SELECT pg_advisory_lock(%s);", (db_setup.MIGRATIONS_LOCK_ID,))
+        holder.commit()
+        done = threading.Event()
+        thread = threading.Thread(target=lambda: (db_setup.migrate(), done.set()))
+        thread.start()
+        assert not done.wait(0.5)
+        with holder.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (db_setup.MIGRATIONS_LOCK_ID,))
+        holder.commit()
+        thread.join(10)
+        assert done.is_set()
+    finally:
+        holder.close()
+
+
+def test_concurrent_migrate_runs(database):
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(lambda _: db_setup.migrate(), range(4)))
+    assert results == [[]] * 4
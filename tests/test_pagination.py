@@ -0,0 +1,58 @@
+from datetime import datetime, timezone
+
+import pytest
+
+import async_db
+from conftest import create_listing
+
+
+def test_cursor_round_trip():
+    row = {"id": 42, "created_at": datetime(2026, 3, 1, 12, 30, 5, 123456, tzinfo=timezone.utc)}
+    assert async_db.decode_cursor(async_db.encode_cursor(row)) == (row["created_at"], 42)
+
+
+def test_cursor_other_id_column():
+    row = {"listing_id": 7, "created_at": datetime(2026, 3, 1, tzinfo=timezone.utc)}
+    cursor = async_db.encode_cursor(row, id_column="listing_id")
+    assert async_db.decode_cursor(cursor) == (row["created_at"], 7)
+
+
+@pytest.mark.parametrize("cursor", ["", "not base64!", "bm8gc2VwYXJhdG9y", "MjAyNnwx"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        async_db.decode_cursor(cursor)
+
+
+@pytest.mark.anyio
+async def test_listing_pages_cover_every_row_once(con, world):
+    # Inserted in one transaction, so they share created_at and only the id
+    # orders them.
+    async with con.transaction():
+        ids = [await create_listing(con, world) for _ in range(7)]
+
+    seen, cursor = [], None
+    while True:
+        page = await async_db.get_listings(
+            con, limit=3, cursor=cursor, agency_id=world["agency_id"]
+        )
+        seen.extend(item["id"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == sorted(ids, reverse=True)
+
+
+@pytest.mark.anyio
+async def test_listing_filters_apply_with_cursor(con, world):
+    cheap = [await create_listing(con, world, price=1_000_000) for _ in range(3)]
+    await create_listing(con, world, price=9_000_000)
+
+    first = await async_db.get_listings(
+        con, limit=2, agency_id=world["agency_id"], max_price=2_000_000
+    )
+    second = await async_db.get_listings(
+        con, limit=2, cursor=first["next_cursor"], agency_id=world["agency_id"],
+        max_price=2_000_000,
+    )
+    assert [item["id"] for item in first["items"] + second["items"]] == cheap[::-1]
+    assert second["next_cursor"] is None
@@ -0,0 +1,62 @@
+from datetime import datetime, timezone
+
+import orjson
+import pytest
+from fastapi.exceptions import ResponseValidationError
+
+from conftest import create_listing
+from schemas import ListingSummary
+from serialization import columnar_page, columnar_response
+
+pytestmark = pytest.mark.anyio
+
+COLUMNS = list(ListingSummary.model_fields)
+
+
+def summary(listing_id, **values):
+    return {column: None for column in COLUMNS} | {"id": listing_id, **values}
+
+
+def test_columnar_page_orders_rows_by_model_fields():
+    created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    page = {
+        "items": [summary(2, price=100, created_at=created_at), summary(1, title="Villa")],
+        "next_cursor": "abc",
+    }
+    columnar = columnar_page(page, ListingSummary)
+    assert columnar["columns"] == COLUMNS
+    assert columnar["next_cursor"] == "abc"
+    first = dict(zip(COLUMNS, columnar["rows"][0]))
+    assert (first["id"], first["price"], first["created_at"]) == (2, 100, created_at)
+    assert dict(zip(COLUMNS, columnar["rows"][1]))["title"] == "Villa"
+
+
+def test_columnar_response_renders_with_orjson():
+    created_at = datetime(2024, 5, 1, 12, 30, tzinfo=timezone.utc)
+    page = {"items": [summary(1, created_at=created_at)], "next_cursor": None}
+    response = columnar_response(page, ListingSummary, {"ETag": '"1"'})
+    assert response.media_type == "application/json"
+    assert response.headers["etag"] == '"1"'
+    body = orjson.loads(response.body)
+    assert body["rows"][0][COLUMNS.index("created_at")] == "2024-05-01T12:30:00Z"
+    assert body["next_cursor"] is None
+
+
+def test_columnar_page_rejects_rows_that_dont_fit_the_model():
+    page = {"items": [summary("not a number")], "next_cursor": None}
+    with pytest.raises(ResponseValidationError):
+        columnar_page(page, ListingSummary)
+
+
+async def test_columns_match_the_objects_shape(client, con, world):
+    for n in range(3):
+        await create_listing(con, world, title=f"Listing {n}", price=1_000_000 + n)
+    url = f"/agencies/{world['agency_id']}/listings?limit=2"
+
+    objects = (await client.get(url)).json()
+    columns = (await client.get(url + "&format=columns")).json()
+    assert columns["columns"] == COLUMNS
+    assert [dict(zip(COLUMNS, row)) for row in columns["rows"]] == [
+        summary(item["id"]) | item for item in objects["items"]
+    ]
+    assert columns["next_cursor"] == objects["next_cursor"] is not None
@@ -0,0 +1,91 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import async_db
+from async_db import ViewingRejected
+from conftest import create_listing
+
+pytestmark = pytest.mark.anyio
+
+SLOT = (datetime.now(timezone.utc) + timedelta(days=30)).replace(
+    hour=10, minute=0, second=0, microsecond=0
+)
+HOUR = timedelta(hours=1)
+
+
+async def test_listing_viewings_may_not_overlap(con, world):
+    listing_id = await create_listing(con, world)
+    await async_db.create_viewing(con, listing_id, SLOT, SLOT + HOUR)
+    with pytest.raises(ViewingRejected, match="listing"):
+        await async_db.create_viewing(
+            con, listing_id, SLOT + HOUR / 2, SLOT + 2 * HOUR, world["other_agent"]
+        )
+    # Back to back is fine: the ranges are half-open.
+    assert await async_db.create_viewing(
+        con, listing_id, SLOT + HOUR, SLOT + 2 * HOUR, world["other_agent"]
+    )
+
+
+async def test_agent_viewings_may_not_overlap(con, world):
+    first = await create_listing(con, world)
+    second = await create_listing(con, world)
+    await async_db.create_viewing(con, first, SLOT, SLOT + HOUR)
+    with pytest.raises(ViewingRejected, match="agent"):
+        await async_db.create_viewing(con, second, SLOT + HOUR / 2)
+    assert await async_db.create_viewing(con, second, SLOT, agent_id=world["other_agent"])
+
+
+async def test_cancelled_viewing_frees_the_slot(con, world):
+    listing_id = await create_listing(con, world)
+    viewing = await async_db.create_viewing(con, listing_id, SLOT)
+    await async_db.cancel_viewing(con, viewing["id"])
+    assert await async_db.create_viewing(con, listing_id, SLOT)
+
+
+async def test_concurrent_bookings_of_one_slot(con, world):
+    listing_id = await create_listing(con, world)
+
+    async def book():
+        async with async_db.acquire() as con:
+            try:
+                return await async_db.create_viewing(con, listing_id, SLOT)
+            except ViewingRejected:
+                return None
+
+    booked = [viewing for viewing in await asyncio.gather(*(book() for _ in range(5))) if viewing]
+    assert len(booked) == 1
+
+
+async def test_registrations_stop_at_capacity(con, world):
+    listing_id = await create_listing(con, world)
+    viewing = await async_db.create_viewing(con, listing_id, SLOT, capacity=2)
+    users = [world["agent"], world["other_agent"], world["buyer"], world["other_buyer"]]
+
+    async def register(user_id):
+        async with async_db.acquire() as con:
+            try:
+                return await async_db.register_for_viewing(con, viewing["id"], user_id)
+            except ViewingRejected as exc:
+                return str(exc)
+
+    results = await asyncio.gather(*(register(user_id) for user_id in users))
+    registered = [result for result in results if isinstance(result, dict)]
+    assert len(registered) == 2
+    assert sorted(result for result in results if isinstance(result, str)) == [
+        "Viewing is full", "Viewing is full"
+    ]
+    count = await con.fetchval(
+        "SELECT registration_count FROM viewings WHERE id = $1;", viewing["id"]
+    )
+    assert count == len(await async_db.get_viewing_registrations(con, viewing["id"])) == 2
+
+    with pytest.raises(ViewingRejected, match="Already registered"):
+        await async_db.register_for_viewing(con, viewing["id"], registered[0]["user_id"])
+    # Cancelling one frees a place.
+    await async_db.cancel_registration(con, viewing["id"], registered[0]["user_id"])
+    left_out = next(user_id for user_id in users if user_id not in {
+        result["user_id"] for result in registered
+    })
+    assert await async_db.register_for_viewing(con, viewing["id"], left_out)
@@ -0,0 +1,41 @@
+import argparse
+import asyncio
+import logging
+import signal
+
+import async_db
+from jobs import JOB_CONCURRENCY, JobWorker
+
+
+async def main(concurrency, queues):
+    # Each running job may hold a connection, plus one for claiming and one
+    # for the recurring schedule.
+    await async_db.init_pool(min_size=1, max_size=concurrency + 2)
+    worker = JobWorker(concurrency, queues)
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, stopping.set)
+    try:
+        await worker.start()
+        logging.getLogger("nightowl.jobs").info(
+            "Worker %s running %s jobs at a time", worker.worker_id, concurrency
+        )
+        await stopping.wait()
+        await worker.stop()
+    finally:
+        await async_db.close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run jobs from the Postgres job queue.")
+    parser.add_argument(
+        "--concurrency", type=int, default=JOB_CONCURRENCY, help="jobs to run at a time"
+    )
+    parser.add_argument(
+        "--queues", help="comma-separated queues to take jobs from (default: all)"
+    )
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s %(message)s")
+    queues = [queue.strip() for queue in args.queues.split(",")] if args.queues else None
+    asyncio.run(main(args.concurrency, queues))